@@ -3,10 +3,10 @@ import os
 from pathlib import Path
 import tempfile
 from typing import Optional
-from rag_processor import LegalDocumentRAG
-from processor import LegalDocumentProcessor
+import resources
 import logging
 from dotenv import load_dotenv
+from page_renderer import PageRenderer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -17,6 +17,38 @@ logger = logging.getLogger(__name__)
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
+@st.cache_resource
+def load_processors(api_key: str):
+    """Load processors once and share them across all sessions and reruns."""
+    return resources.get_rag_processor(api_key), resources.get_doc_processor(api_key)
+
+@st.cache_resource
+def load_page_renderer():
+    """One page renderer (and its on-disk cache) shared by all sessions."""
+    return PageRenderer(str(Path(__file__).parent.parent / 'data' / 'page_cache'))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_pdf_bytes(path: str, mtime: float) -> bytes:
+    """File contents, read once per file version rather than on every rerun."""
+    with open(path, "rb") as pdf_file:
+        return pdf_file.read()
+
+# Only the page viewer reruns on its own interactions where fragments exist
+_fragment_api = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+fragment = _fragment_api or (lambda func: func)
+
+PREVIEW_BATCH = 8
+THUMBNAIL_COLUMNS = 4
+SUMMARY_POLL_SECONDS = 1.0
+
+def _rerun_when_ready(future) -> None:
+    """Rerun the page once the Gemini summaries have arrived."""
+    if future.done():
+        st.rerun()
+
+# Polls without rerunning the whole page; None where fragments are unavailable
+watch_llm_summary = _fragment_api(run_every=SUMMARY_POLL_SECONDS)(_rerun_when_ready) if _fragment_api else None
+
 class LegalDocumentUI:
     def __init__(self):
         """Initialize the UI."""
@@ -36,9 +68,8 @@ class LegalDocumentUI:
             st.error("🚨 Google API Key not found in .env file!")
             st.stop()
             
-        # Initialize processors
-        self.rag_processor = LegalDocumentRAG(self.api_key)
-        self.doc_processor = LegalDocumentProcessor(self.api_key)
+        # Reuse shared processors instead of rebuilding them on every rerun
+        self.rag_processor, self.doc_processor = load_processors(self.api_key)
 
     def process_upload(self, uploaded_file) -> None:
         """Process uploaded PDF and find similar documents."""
@@ -106,6 +137,11 @@ class LegalDocumentUI:
                         st.session_state.selected_doc = doc
                         st.session_state.page = 'details'
                         st.rerun()
+                if doc.get('matches'):
+                    with st.expander("Matching issues"):
+                        for match in doc['matches']:
+                            st.markdown(f"**{match['score']:.1f}%** — {match['query_issue']}  \n"
+                                        f"↳ {match['matched_issue']}")
                 st.markdown("---")
 
     def show_document_details(self):
@@ -117,13 +153,20 @@ class LegalDocumentUI:
                 st.rerun()
                 return
 
-            # Get document details
+            # Local summaries show at once; Gemini's replace them when they arrive
             doc_path = st.session_state.selected_doc['file_path']
-            with st.spinner('Loading document details...'):
-                doc_details = self.doc_processor.process_document(doc_path)
+            doc_details, llm_run = self.doc_processor.process_document_async(doc_path)
 
             # Main title and document info
             st.title("Document Details")
+            if not llm_run.done():
+                st.caption("Showing extractive summaries while Gemini summaries are generated...")
+                if watch_llm_summary is not None:
+                    watch_llm_summary(llm_run)
+                else:
+                    st.button("Check for Gemini summaries")
+            elif doc_details.get('summary_source') == 'extractive':
+                st.caption("Gemini summaries are unavailable; showing extractive summaries.")
             
             # Create tabs for different sections
             tab1, tab2, tab3 = st.tabs(["Case Information", "Case Summaries", "Document Actions"])
@@ -172,14 +215,9 @@ class LegalDocumentUI:
             # Tab 3: Document Actions
             with tab3:
                 st.subheader("Document Actions")
-                with open(doc_path, "rb") as pdf_file:
-                    pdf_bytes = pdf_file.read()
-                st.download_button(
-                    label="Download Original PDF",
-                    data=pdf_bytes,
-                    file_name=os.path.basename(doc_path),
-                    mime="application/pdf"
-                )
+                self.show_download(doc_path)
+                st.subheader("Pages")
+                self.show_page_viewer(doc_path)
 
         except Exception as e:
             logger.error(f"Error displaying document details: {str(e)}")
@@ -188,6 +226,48 @@ class LegalDocumentUI:
                 st.session_state.page = 'upload'
                 st.rerun()
 
+    def show_download(self, doc_path: str):
+        """Offer the original PDF, reading it only once the user asks for it."""
+        key = f"download_{doc_path}"
+        if not st.session_state.get(key):
+            st.button("Prepare PDF download", key=f"prepare_{doc_path}",
+                      on_click=st.session_state.__setitem__, args=(key, True))
+            return
+        st.download_button(
+            label="Download Original PDF",
+            data=load_pdf_bytes(doc_path, os.path.getmtime(doc_path)),
+            file_name=os.path.basename(doc_path),
+            mime="application/pdf"
+        )
+
+    @fragment
+    def show_page_viewer(self, doc_path: str):
+        """Page thumbnails, rendered a batch at a time, plus one full-size page."""
+        renderer = load_page_renderer()
+        page_count = renderer.page_count(doc_path)
+        if not page_count:
+            st.info("This document has no pages to preview.")
+            return
+        shown_key = f"preview_shown_{doc_path}"
+        page_key = f"preview_page_{doc_path}"
+        shown = min(st.session_state.get(shown_key, PREVIEW_BATCH), page_count)
+        if page_key not in st.session_state:
+            st.session_state[page_key] = 1
+
+        # Only thumbnails in the visible window are rendered
+        columns = st.columns(THUMBNAIL_COLUMNS)
+        for page in range(shown):
+            with columns[page % THUMBNAIL_COLUMNS]:
+                st.image(renderer.thumbnail(doc_path, page))
+                st.button(f"Page {page + 1}", key=f"thumb_{doc_path}_{page}",
+                          on_click=st.session_state.__setitem__, args=(page_key, page + 1))
+        if shown < page_count:
+            st.button(f"Show more pages ({shown} of {page_count})", key=f"more_{doc_path}",
+                      on_click=st.session_state.__setitem__, args=(shown_key, shown + PREVIEW_BATCH))
+
+        page = st.number_input("Page", min_value=1, max_value=page_count, key=page_key)
+        st.image(renderer.page_image(doc_path, page - 1))
+
     def run(self):
         """Main UI loop."""
         st.set_page_config(
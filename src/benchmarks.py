@@ -0,0 +1,607 @@
+# Benchmarks and load tests
+#
+# Usage: python benchmarks.py <name> [options]
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BENCHMARKS: Dict[str, Tuple[Callable, Tuple[Tuple[tuple, dict], ...]]] = {}
+
+
+def arg(*flags, **kwargs) -> Tuple[tuple, dict]:
+    """Describe a command-line option for a benchmark."""
+    return flags, kwargs
+
+
+def benchmark(name: str, *arguments: Tuple[tuple, dict]):
+    """Register a benchmark under ``name`` with its command-line options."""
+    def decorator(func):
+        BENCHMARKS[name] = (func, arguments)
+        return func
+    return decorator
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is KB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report_latencies(label: str, latencies: List[float]) -> None:
+    """Print a one-line latency summary in milliseconds."""
+    ms = [l * 1000 for l in latencies]
+    print(f"{label}: n={len(ms)} mean={statistics.mean(ms):.2f}ms "
+          f"p50={percentile(ms, 50):.2f}ms p95={percentile(ms, 95):.2f}ms "
+          f"max={max(ms):.2f}ms")
+
+
+def get_api_key() -> str:
+    load_dotenv()
+    api_key = os.getenv('GOOGLE_API_KEY')
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+    return api_key
+
+
+@benchmark("sessions",
+           arg("--sessions", type=int, default=8, help="concurrent sessions"),
+           arg("--reruns", type=int, default=5, help="reruns per session"))
+def bench_sessions(args) -> None:
+    """Simulate N concurrent Streamlit sessions sharing process resources."""
+    import resources
+
+    api_key = get_api_key()
+    queries = [
+        "Issue: Landlord failed to maintain the property in a habitable condition",
+        "Issue: Improper rent increase above the annual general adjustment",
+        "Issue: Reduction in housing services due to laundry room closure",
+    ]
+
+    def session(index: int) -> float:
+        # Each rerun of a session resolves its processors and runs one query
+        start = time.perf_counter()
+        rag = resources.get_rag_processor(api_key)
+        resources.get_doc_processor(api_key)
+        rag.collection.query(
+            query_texts=[queries[index % len(queries)]],
+            n_results=5,
+            include=["metadatas", "distances"]
+        )
+        return time.perf_counter() - start
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    resources.get_rag_processor(api_key)
+    print(f"Cold start: {(time.perf_counter() - start) * 1000:.1f}ms, "
+          f"RSS {baseline:.1f}MB -> {rss_mb():.1f}MB")
+
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        latencies = list(executor.map(session, range(args.sessions * args.reruns)))
+
+    report_latencies(f"{args.sessions} sessions x {args.reruns} reruns", latencies)
+    print(f"RSS after load: {rss_mb():.1f}MB")
+
+
+def synthetic_embeddings(count: int, dim: int = 384, clusters: int = 200, seed: int = 0):
+    """Clustered unit vectors shaped like sentence embeddings."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)]
+    vectors += 0.5 * rng.normal(size=(count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+@benchmark("quantized",
+           arg("--vectors", type=int, default=200000, help="synthetic index size"),
+           arg("--queries", type=int, default=100),
+           arg("--top-k", type=int, default=10),
+           arg("--rescore", type=int, nargs="+", default=[20, 50, 100, 200],
+               help="candidate counts re-ranked at full precision"),
+           arg("--space", default="cosine", choices=["l2", "cosine", "ip"]))
+def bench_quantized(args) -> None:
+    """Memory, latency and recall of the int8 store versus float32 search."""
+    import numpy as np
+    from quantized_store import QuantizedVectorStore, exact_search, vector_norms
+
+    vectors = synthetic_embeddings(args.vectors)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+
+    norms = vector_norms(vectors, args.space)
+    truth, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        truth.append(set(exact_search(query, vectors, args.top_k, args.space, norms).tolist()))
+        latencies.append(time.perf_counter() - start)
+    print(f"float32 index: {vectors.nbytes / 1e6:.1f}MB")
+    report_latencies("float32 exact", latencies)
+
+    store = QuantizedVectorStore.build(ids, vectors, args.space)
+    print(f"int8 index: {store.nbytes / 1e6:.1f}MB in memory "
+          f"({vectors.nbytes / store.nbytes:.1f}x smaller)")
+    for rescore_k in args.rescore:
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = store.search(query, args.top_k, rescore_k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected & {int(doc_id) for doc_id, _ in found})
+        recall = hits / (len(queries) * args.top_k)
+        report_latencies(f"int8 rescore={rescore_k} recall@{args.top_k}={recall:.3f}", latencies)
+
+
+@benchmark("ivf",
+           arg("--vectors", type=int, default=200000, help="synthetic index size"),
+           arg("--queries", type=int, default=100),
+           arg("--top-k", type=int, default=10),
+           arg("--nlist", type=int, default=None, help="inverted lists (default 4*sqrt(n))"),
+           arg("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64],
+               help="lists probed per query"),
+           arg("--space", default="cosine", choices=["l2", "cosine", "ip"]))
+def bench_ivf(args) -> None:
+    """k-means training time, then recall and latency of IVF search for each nprobe."""
+    import numpy as np
+    from ivf_index import IVFIndex
+    from quantized_store import exact_search, vector_norms
+
+    vectors = synthetic_embeddings(args.vectors)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+
+    norms = vector_norms(vectors, args.space)
+    truth, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        truth.append(set(exact_search(query, vectors, args.top_k, args.space, norms).tolist()))
+        latencies.append(time.perf_counter() - start)
+    report_latencies("float32 exact", latencies)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(ids, vectors, args.space, args.nlist)
+    sizes = np.diff(index.list_offsets)
+    print(f"Trained {index.nlist} lists in {time.perf_counter() - start:.1f}s "
+          f"(list size min={sizes.min()} median={int(np.median(sizes))} max={sizes.max()}, "
+          f"drift {index.drift():.3f})")
+    for nprobe in args.nprobe:
+        if nprobe > index.nlist:
+            break
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = index.search(query, args.top_k, nprobe)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected & {int(doc_id) for doc_id, _ in found})
+        recall = hits / (len(queries) * args.top_k)
+        report_latencies(f"nprobe={nprobe} recall@{args.top_k}={recall:.3f}", latencies)
+
+
+def describe_scores(label: str, scores) -> None:
+    """Print the spread of a score distribution."""
+    import numpy as np
+
+    scores = np.asarray(scores)
+    p5, p50, p95 = np.percentile(scores, [5, 50, 95])
+    print(f"{label}: min={scores.min():.1f} p5={p5:.1f} median={p50:.1f} p95={p95:.1f} "
+          f"max={scores.max():.1f} negative={np.mean(scores < 0) * 100:.1f}%")
+
+
+@benchmark("cosine",
+           arg("--vectors", type=int, default=20000, help="synthetic index size"),
+           arg("--queries", type=int, default=200),
+           arg("--top-k", type=int, default=5),
+           arg("--from-collection", action="store_true",
+               help="use the embeddings stored in chroma_db instead of synthetic ones"))
+def bench_cosine(args) -> None:
+    """Score distribution and query speed of L2 versus cosine/dot-product search."""
+    import chromadb
+    import numpy as np
+
+    if args.from_collection:
+        from rag_processor import LegalDocumentRAG
+        records = LegalDocumentRAG(get_api_key()).collection.get(include=["embeddings"])
+        vectors = np.asarray(records['embeddings'], dtype=np.float32)
+    else:
+        vectors = synthetic_embeddings(args.vectors)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rng = np.random.default_rng(2)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(vectors.shape[1])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    top_k = min(args.top_k, len(vectors))
+
+    # Top-k scores as find_similar reports them: (1 - distance) * 100
+    dots = queries @ vectors.T
+    top = -np.sort(-dots, axis=1)[:, :top_k]
+    describe_scores("L2 space scores    ", (1 - (2 - 2 * top)) * 100)
+    describe_scores("cosine space scores", top * 100)
+
+    # NumPy search: generic cosine (divide by norms) versus pre-normalized dot product
+    norms = np.linalg.norm(vectors, axis=1)
+    for label, search in [
+        ("numpy cosine with norms", lambda q: 1 - (vectors @ q) / (norms * np.linalg.norm(q))),
+        ("numpy dot product      ", lambda q: 1 - vectors @ q),
+    ]:
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            distances = search(query)
+            np.argpartition(distances, top_k - 1)[:top_k]
+            latencies.append(time.perf_counter() - start)
+        report_latencies(label, latencies)
+
+    client = chromadb.EphemeralClient()
+    for space in ("l2", "cosine"):
+        collection = client.create_collection(f"bench_{space}", metadata={"hnsw:space": space})
+        for start in range(0, len(vectors), 1000):
+            batch = vectors[start:start + 1000]
+            collection.add(ids=[str(i) for i in range(start, start + len(batch))],
+                           embeddings=batch.tolist())
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            collection.query(query_embeddings=[query.tolist()], n_results=top_k, include=["distances"])
+            latencies.append(time.perf_counter() - start)
+        report_latencies(f"chroma {space:<6} space     ", latencies)
+        client.delete_collection(f"bench_{space}")
+
+
+@benchmark("rerank",
+           arg("--candidates", type=int, nargs="+", default=[5, 10, 20, 50],
+               help="candidate counts re-ranked by the cross-encoder"),
+           arg("--top-k", type=int, default=5),
+           arg("--budget", type=float, default=None, help="re-rank time budget in seconds"))
+def bench_rerank(args) -> None:
+    """Quality against latency of cross-encoder re-ranking for several N.
+
+    Every indexed case is used as a query against the others; decisions for
+    the same property (HO decision, appeal, remand) count as relevant.
+    """
+    from evaluation import case_family, recall_at_k, reciprocal_rank
+    from reranker import CrossEncoderReranker
+    from rag_processor import LegalDocumentRAG
+
+    rag = LegalDocumentRAG(get_api_key())
+    records = rag.collection.get(include=["metadatas", "documents"])
+    queries = [
+        (doc_id, metadata['filename'], document)
+        for doc_id, metadata, document in zip(records['ids'], records['metadatas'], records['documents'])
+        if sum(case_family(m['filename']) == case_family(metadata['filename'])
+               for m in records['metadatas']) > 1
+    ]
+    if not queries:
+        print("No case families with more than one indexed decision")
+        return
+    reranker = CrossEncoderReranker(time_budget=args.budget, cache_size=0)
+
+    for candidates in [0] + args.candidates:
+        latencies, reciprocal_ranks, recalls = [], [], []
+        for doc_id, filename, document in queries:
+            start = time.perf_counter()
+            results = rag.collection.query(
+                query_texts=[document],
+                n_results=min(max(args.top_k, candidates) + 1, len(records['ids'])),
+                include=["metadatas", "documents"]
+            )
+            hits = [
+                (metadata['filename'], text)
+                for hit_id, metadata, text in zip(results['ids'][0], results['metadatas'][0],
+                                                  results['documents'][0])
+                if hit_id != doc_id
+            ]
+            if candidates:
+                order = reranker.rerank(document, [text for _, text in hits])
+                hits = [hits[index] for index, _ in order]
+            ranked = [name for name, _ in hits[:args.top_k]]
+            latencies.append(time.perf_counter() - start)
+
+            relevant = {m['filename']: 1 for m in records['metadatas']
+                        if case_family(m['filename']) == case_family(filename) and m['filename'] != filename}
+            reciprocal_ranks.append(reciprocal_rank(ranked, relevant))
+            recalls.append(recall_at_k(ranked, relevant, args.top_k))
+
+        label = f"N={candidates}" if candidates else "no re-rank"
+        report_latencies(f"{label} MRR={statistics.mean(reciprocal_ranks):.3f} "
+                         f"recall@{args.top_k}={statistics.mean(recalls):.3f}", latencies)
+
+
+@benchmark("evaluate",
+           arg("--configs", nargs="+", default=["vector", "maxsim", "rerank"],
+               help="retrieval configurations as name[:key=value,...], e.g. ivf:nprobe=4 "
+                    "or rerank:rerank_candidates=50"),
+           arg("--k", type=int, nargs="+", default=[1, 3, 5, 10], help="cutoffs for recall@k and nDCG@k"),
+           arg("--judgments", default=None, help="JSONL of user relevance judgments"),
+           arg("--shard", default=None, choices=["city_year", "hash"],
+               help="sharding strategy (detected from the index when omitted)"),
+           arg("--output", default=None, help="also write the report as JSON"))
+def bench_evaluate(args) -> None:
+    """Retrieval quality (recall@k, MRR, nDCG@k) next to latency for each configuration.
+
+    Relevance comes from case families (decisions for the same property,
+    the HO decision and its appeal ranked highest) plus any judgments in
+    ``data/relevance_judgments.jsonl``; queries replay stored issues, so no
+    Gemini calls are made.
+    """
+    import json
+    from evaluation import JUDGMENTS_PATH, evaluate_configurations
+
+    reports = evaluate_configurations(get_api_key(), args.configs, k_values=args.k,
+                                      judgments_path=args.judgments or JUDGMENTS_PATH, sharding=args.shard)
+    if not reports or not reports[0]['metrics'].get('queries'):
+        print("No judged queries; index related decisions or add judgments first")
+        return
+    columns = ['mrr'] + [f'{metric}@{k}' for k in args.k for metric in ('recall', 'ndcg')]
+    print(f"{len(reports[0]['latencies'])} queries")
+    print(f"{'configuration':<32}" + ''.join(f"{column:>10}" for column in columns)
+          + f"{'p50 ms':>10}{'p95 ms':>10}")
+    for report in reports:
+        ms = [l * 1000 for l in report['latencies']]
+        print(f"{report['configuration']:<32}"
+              + ''.join(f"{report['metrics'].get(column, 0.0):>10.3f}" for column in columns)
+              + f"{percentile(ms, 50):>10.2f}{percentile(ms, 95):>10.2f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump([{'configuration': report['configuration'], **report['metrics'],
+                        'latency_p50_ms': percentile(report['latencies'], 50) * 1000,
+                        'latency_p95_ms': percentile(report['latencies'], 95) * 1000,
+                        'rankings': report['rankings']} for report in reports], f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+def sample_issue_texts(count: int) -> List[str]:
+    """Indexed petitioner issues, padded with templated ones if the index is small."""
+    import random
+    import resources
+
+    texts = []
+    try:
+        collection = resources.get_chroma_client().get_collection(
+            "petitioner_issues", embedding_function=resources.shared_embedding_function())
+        texts = [doc for doc in collection.get(limit=count, include=["documents"])['documents'] if doc]
+    except Exception as e:
+        logger.info(f"No indexed issues available ({str(e)}); using templated issues")
+    rng = random.Random(0)
+    subjects = ["heating system", "rent increase", "laundry room", "security deposit", "parking space",
+                "water leak", "pest infestation", "elevator service", "capital improvement passthrough"]
+    while len(texts) < count:
+        texts.append(f"Issue: Landlord {rng.choice(['failed to repair', 'reduced', 'overcharged for'])} "
+                     f"the {rng.choice(subjects)} " * rng.randint(1, 6))
+    return texts[:count]
+
+
+@benchmark("embeddings",
+           arg("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+               help="backends to compare; the first is the parity reference"),
+           arg("--texts", type=int, default=512),
+           arg("--batch-size", type=int, default=32),
+           arg("--threads", type=int, default=None, help="intra-op threads"),
+           arg("--top-k", type=int, default=5))
+def bench_embeddings(args) -> None:
+    """Embedding throughput and output parity of the torch and ONNX backends."""
+    import numpy as np
+    import resources
+    from embedding_backends import backend_options, create_backend
+
+    texts = sample_issue_texts(args.texts)
+    reference = None
+    for label in args.backends:
+        options = {**backend_options(), 'backend': label.split('-')[0], 'quantize': label.endswith('int8'),
+                   'device': 'cpu', 'intra_op_threads': args.threads}
+        start = time.perf_counter()
+        backend = create_backend(resources.EMBEDDING_MODEL_NAME, **options)
+        backend.warmup()
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = np.asarray(backend.encode(texts, batch_size=args.batch_size), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        line = (f"{label}: load+warmup {load:.2f}s, {len(texts) / elapsed:.1f} texts/s "
+                f"(batch {args.batch_size}), RSS {rss_mb():.0f}MB")
+
+        if reference is None:
+            reference = vectors
+            print(line)
+            continue
+        cosines = (vectors * reference).sum(axis=1)
+        # Retrieval parity: overlap of each text's nearest neighbours
+        k = min(args.top_k, len(texts) - 1)
+        def neighbours(matrix):
+            similarity = matrix @ matrix.T
+            np.fill_diagonal(similarity, -np.inf)
+            return np.argsort(-similarity, axis=1)[:, :k]
+        overlap = np.mean([len(set(a) & set(b)) / k
+                           for a, b in zip(neighbours(vectors), neighbours(reference))])
+        print(f"{line}; cosine to {args.backends[0]} mean={cosines.mean():.5f} "
+              f"min={cosines.min():.5f}, top-{k} neighbour overlap {overlap:.3f}")
+
+
+@benchmark("metadata",
+           arg("--pdf-dir", default=os.path.join("data", "pdfs")),
+           arg("--repeat", type=int, default=100, help="timed extractions per document"),
+           arg("--show", action="store_true", help="print the extracted fields per document"))
+def bench_metadata(args) -> None:
+    """Per-field coverage and speed of the rule-based caption metadata extractor."""
+    import fitz
+    from case_metadata import METADATA_FIELDS, CAPTION_CHARS, extract_metadata
+
+    resolved = {field: 0 for field in METADATA_FIELDS}
+    latencies = []
+    files = sorted(f for f in os.listdir(args.pdf_dir) if f.lower().endswith('.pdf'))
+    for filename in files:
+        with fitz.open(os.path.join(args.pdf_dir, filename)) as doc:
+            text = ""
+            for page in doc:
+                text += page.get_text() + "\n"
+                if len(text) >= CAPTION_CHARS:
+                    break
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            metadata = extract_metadata(text, filename)
+            latencies.append(time.perf_counter() - start)
+        for field in METADATA_FIELDS:
+            resolved[field] += metadata[field] is not None
+        if args.show:
+            print(f"{filename}: {metadata}")
+
+    print(f"{len(files)} documents; fields left for the LLM are those not covered")
+    for field in METADATA_FIELDS:
+        print(f"  {field:16} {resolved[field]:3}/{len(files)} ({100 * resolved[field] / max(1, len(files)):.0f}%)")
+    complete = sum(resolved.values())
+    print(f"  {'all fields':16} {complete:3}/{len(files) * len(METADATA_FIELDS)}")
+    print(f"extraction: p50 {percentile(latencies, 50) * 1e6:.0f}us, p95 {percentile(latencies, 95) * 1e6:.0f}us")
+
+
+class FakeLLM:
+    """Stand-in for a Gemini model: sleeps for a jittered latency and echoes the prompt."""
+
+    def __init__(self, latency: float, seed: int = 0):
+        import random
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str):
+        with self._lock:
+            delay = self.latency * self._rng.uniform(0.5, 1.5)
+        time.sleep(delay)
+        return type("Response", (), {"text": prompt})()
+
+
+@benchmark("llm-scheduler",
+           arg("--batch", type=int, default=2000, help="queued batch (build) calls"),
+           arg("--interactive", type=int, default=40, help="interactive calls arriving during the build"),
+           arg("--arrival", type=float, default=0.25, help="seconds between interactive calls"),
+           arg("--latency", type=float, default=0.05, help="mean fake LLM latency in seconds"),
+           arg("--concurrency", type=int, default=8),
+           arg("--batch-share", type=float, default=0.2))
+def bench_llm_scheduler(args) -> None:
+    """Interactive latency behind a queued build, FIFO versus priority scheduling, on a fake LLM."""
+    from llm_scheduler import BATCH, INTERACTIVE, LLMScheduler, PriorityClass, default_classes
+
+    configurations = [
+        ("fifo", [PriorityClass(BATCH, 0, args.concurrency), PriorityClass(INTERACTIVE, 0, args.concurrency)],
+         lambda priority: BATCH),
+        ("priority", list(default_classes(args.concurrency, args.batch_share)), lambda priority: priority),
+    ]
+    for label, classes, route in configurations:
+        scheduler = LLMScheduler(args.concurrency, classes=classes, activity_path=None)
+        model = FakeLLM(args.latency)
+        start = time.perf_counter()
+        batch = [scheduler.submit(model.generate_content, f"doc {i}", priority=route(BATCH))
+                 for i in range(args.batch)]
+        latencies = []
+        for i in range(args.interactive):
+            submitted = time.perf_counter()
+            scheduler.call(model.generate_content, f"query {i}", priority=route(INTERACTIVE))
+            latencies.append(time.perf_counter() - submitted)
+            time.sleep(max(0.0, args.arrival - latencies[-1]))
+        interactive_done = time.perf_counter() - start
+        done_during = sum(future.done() for future in batch)
+        for future in batch:
+            future.result()
+        build_time = time.perf_counter() - start
+        scheduler.shutdown()
+        report_latencies(f"{label:8} interactive", latencies)
+        print(f"{label:8} batch: {done_during}/{args.batch} done while interactive traffic ran "
+              f"({interactive_done:.1f}s), all done after {build_time:.1f}s")
+
+
+# Modules that must not be imported just to start the CLI
+HEAVY_MODULES = ("torch", "sentence_transformers", "chromadb", "google.generativeai", "fitz", "numpy")
+
+
+def import_times(module: str) -> Dict[str, float]:
+    """Cumulative import time in seconds per module from ``python -X importtime``."""
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=here, capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@benchmark("startup",
+           arg("--module", default="main", help="entry-point module to import"),
+           arg("--budget", type=float, default=1.0, help="maximum seconds for the usage command"),
+           arg("--top", type=int, default=10, help="slowest imports to list"))
+def bench_startup(args) -> None:
+    """CLI startup time; exits non-zero if heavy modules load eagerly or the budget is exceeded."""
+    import subprocess
+
+    times = import_times(args.module)
+    print(f"import {args.module}: {times.get(args.module, 0.0) * 1000:.1f}ms cumulative")
+    for name, seconds in sorted(times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {seconds * 1000:8.1f}ms  {name}")
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    latencies = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, f"{args.module}.py"], cwd=here,
+                       capture_output=True, check=True)
+        latencies.append(time.perf_counter() - start)
+    report_latencies(f"python {args.module}.py (usage)", latencies)
+
+    eager = [name for name in HEAVY_MODULES if name in times]
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+    if min(latencies) > args.budget:
+        print(f"FAIL: startup {min(latencies):.2f}s exceeds budget {args.budget:.2f}s")
+    if eager or min(latencies) > args.budget:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run benchmarks")
+    subparsers = parser.add_subparsers(dest="name", required=True)
+    for name, (func, arguments) in sorted(BENCHMARKS.items()):
+        subparser = subparsers.add_parser(name, help=func.__doc__)
+        for flags, kwargs in arguments:
+            subparser.add_argument(*flags, **kwargs)
+    args = parser.parse_args()
+    BENCHMARKS[args.name][0](args)
+
+
+if __name__ == "__main__":
+    main()
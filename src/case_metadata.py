@@ -0,0 +1,143 @@
+# Rule-based case metadata from decision captions and filenames
+
+import os
+import re
+from typing import Dict, List, Optional
+
+METADATA_FIELDS = ['case_number', 'petitioner_name', 'respondent_name', 'city', 'is_appeal']
+# The caption sits on the first page; this comfortably covers it
+CAPTION_CHARS = 8000
+
+# "California_1556 2023.11.21 HODecision_Redacted.pdf"
+_FILENAME = re.compile(r'^(?P<street>.+?)_(?P<number>\d+)\s+(?P<date>\d{4})\.(?P<month>\d{2})\.(?P<day>\d{2})\s+'
+                       r'(?P<type>[A-Za-z ]+?)(?:_Redacted)?\.pdf$', re.IGNORECASE)
+DECISION_TYPES = {
+    'hodecision': 'Hearing Officer Decision',
+    'hocpdecision': 'Compliance Hearing Decision',
+    'appealdecision': 'Appeal Decision',
+    'remandappealdecision': 'Remand Appeal Decision',
+}
+
+# "C22230055", "22230009", "C2324003"
+_CASE_NUMBER = re.compile(r'\b(C\d{7,9}|\d{8})\b')
+# "Petitioner Tenant Name(s):", "Respondent Owner Name(s)", "Respondent Landlord Names(s):"
+_PARTY_LABEL = re.compile(r'^(Petitioner|Respondent)\s+(?:Tenant|Landlord|Owner)\s+Names?\s*\(s\)\s*:?$',
+                          re.IGNORECASE)
+_LABEL = re.compile(r':$|^(?:Property Manager|Hearing Officer|Date|Place|Affected Unit)', re.IGNORECASE)
+# Pleading captions: "NAME," / "Petitioner," / "vs." / "NAME," / "Respondent." on separate lines
+_VERSUS = re.compile(r'^vs?\.?$', re.IGNORECASE)
+_PETITIONER_ROLE = re.compile(r'^Petitioners?\b', re.IGNORECASE)
+_RESPONDENT_ROLE = re.compile(r'^Respondents?\b', re.IGNORECASE)
+# Appeal decisions: 'Tenant Jane Doe ("Petitioner") ... The Property is owned by X, which'
+_APPEAL_PETITIONER = re.compile(r'\bTenants?\s+(.+?)\s*\((?:collectively\s+)?["“]Petitioners?["”]\)', re.DOTALL)
+_APPEAL_RESPONDENT = re.compile(r'\bowned by\s+(.+?),?\s+which\b', re.DOTALL)
+_CITY_OF = re.compile(r'\b(?:CITY OF|City of)\s+([A-Z][A-Za-z]+(?: [A-Z][A-Za-z]+)?)')
+_CITY_STATE = re.compile(r'([A-Z][A-Za-z]+(?: [A-Z][A-Za-z]+){0,2}),?\s+(?:CA|CALIFORNIA|California)\b')
+_NOT_CITY = {'Unit', 'Apt', 'Street', 'St', 'Avenue', 'Ave', 'Road', 'Rd', 'Drive', 'Blvd', 'Circle'}
+_APPEAL_TITLE = re.compile(r'\bAppeal Decision\b', re.IGNORECASE)
+
+
+def parse_filename(filename: str) -> Dict[str, Optional[str]]:
+    """Street, decision date, decision type and appeal flag encoded in a decision's filename."""
+    match = _FILENAME.match(os.path.basename(filename))
+    if not match:
+        return {'property_address': None, 'decision_date': None, 'decision_type': None, 'is_appeal': None}
+    kind = match.group('type').replace(' ', '').lower()
+    return {
+        'property_address': f"{match.group('number')} {match.group('street')}",
+        'decision_date': f"{match.group('date')}-{match.group('month')}-{match.group('day')}",
+        'decision_type': DECISION_TYPES.get(kind, match.group('type')),
+        'is_appeal': 'appeal' in kind
+    }
+
+
+def _clean_name(name: str) -> Optional[str]:
+    # Drop nicknames such as (“Ms. Hernandez”), brackets cut off at the line end and stray punctuation
+    name = re.sub(r'\([^()]*\)|\(|\[[^\]]*$', ' ', name)
+    name = ' '.join(name.split()).strip(' ,;')
+    return name or None
+
+
+def _case_number(lines: List[str]) -> Optional[str]:
+    # Every number on the first line that has one: "C23240022 and C23240023"
+    for line in lines:
+        numbers = _CASE_NUMBER.findall(line)
+        if numbers:
+            return ', '.join(dict.fromkeys(numbers))
+    return None
+
+
+def _labeled_parties(lines: List[str]) -> Dict[str, str]:
+    parties = {}
+    for i, line in enumerate(lines[:-1]):
+        match = _PARTY_LABEL.match(line)
+        value = lines[i + 1]
+        if match and not _LABEL.search(value) and not _PARTY_LABEL.match(value):
+            parties.setdefault(f"{match.group(1).lower()}_name", _clean_name(value))
+    return parties
+
+
+def _pleading_parties(lines: List[str]) -> Dict[str, str]:
+    for i in range(2, len(lines) - 2):
+        if (_VERSUS.match(lines[i]) and _PETITIONER_ROLE.match(lines[i - 1])
+                and _RESPONDENT_ROLE.match(lines[i + 2])):
+            return {'petitioner_name': _clean_name(lines[i - 2]), 'respondent_name': _clean_name(lines[i + 1])}
+    return {}
+
+
+def _city(caption: str) -> Optional[str]:
+    match = _CITY_OF.search(caption)
+    if match:
+        return match.group(1).title()
+    for match in _CITY_STATE.finditer(caption):
+        words = match.group(1).split()
+        while words and words[0].title() in _NOT_CITY:
+            words.pop(0)
+        if words:
+            return ' '.join(words).title()
+    return None
+
+
+def extract_metadata(text: str, filename: str = '') -> Dict[str, Optional[object]]:
+    """Case number, parties, city and appeal status from the caption, None where not found.
+
+    ``text`` is the decision's text with line breaks (only the first
+    ``CAPTION_CHARS`` characters are read). The labelled caption table of
+    hearing officer decisions, the "X, Petitioner, vs. Y, Respondent"
+    pleading caption and the opening paragraph of appeal decisions are
+    recognised; the appeal flag comes from the filename when it follows
+    the corpus naming scheme.
+    """
+    caption = text[:CAPTION_CHARS]
+    # Non-empty lines, without the pleading-paper line numbers
+    lines = [line.strip() for line in caption.splitlines()
+             if line.strip() and not line.strip().isdigit()]
+    joined = '\n'.join(lines)
+
+    metadata: Dict[str, Optional[object]] = {field: None for field in METADATA_FIELDS}
+    metadata['case_number'] = _case_number(lines)
+    metadata.update(_labeled_parties(lines))
+
+    for field, name in _pleading_parties(lines).items():
+        metadata[field] = metadata[field] or name
+    if metadata['petitioner_name'] is None:
+        match = _APPEAL_PETITIONER.search(joined)
+        metadata['petitioner_name'] = _clean_name(match.group(1)) if match else None
+    if metadata['respondent_name'] is None:
+        match = _APPEAL_RESPONDENT.search(joined)
+        metadata['respondent_name'] = _clean_name(match.group(1)) if match else None
+
+    metadata['city'] = _city(joined)
+    metadata['is_appeal'] = parse_filename(filename)['is_appeal'] if filename else None
+    if metadata['is_appeal'] is None and lines:
+        # Appeal decisions are titled as such; hearing officer decisions never are
+        if _APPEAL_TITLE.search(' '.join(lines[:3])):
+            metadata['is_appeal'] = True
+        elif re.search(r'HEARING OFFICER DECISION|DECISION (?:AFTER|FOLLOWING) HEARING', joined):
+            metadata['is_appeal'] = False
+    return metadata
+
+
+def missing_fields(metadata: Dict[str, Optional[object]]) -> List[str]:
+    """Metadata fields the rules could not resolve."""
+    return [field for field in METADATA_FIELDS if metadata.get(field) is None]
@@ -0,0 +1,243 @@
+# Citation extraction and the citation -> decisions postings index
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CITATION_INDEX_PATH = os.path.join("data", "citation_index.json")
+FORMAT_VERSION = 1
+# A lock file older than this was left by a crashed writer
+LOCK_STALE_SECONDS = 30.0
+
+# "Section 1707(f)(1)", "§ 1710(b)(2)", "§§1702"
+_SECTION = re.compile(r'(?:§§?|\bsections?)\s*(\d{3,6}(?:\.\d+)?)((?:\s?\([a-z0-9]{1,4}\))*)', re.IGNORECASE)
+# "Regulations, Chapter 2", "Regulation Chapter 5", "Chapter 7"
+_CHAPTER = re.compile(r'\b(?:regulations?,?\s+)?chapter\s+(\d+[a-z]?)\b', re.IGNORECASE)
+# Case numbers such as "C23240003"
+_CASE_NUMBER = re.compile(r'\b([A-Z]\d{7,8})\b')
+_SUBSECTION = re.compile(r'\(([a-z0-9]{1,4})\)', re.IGNORECASE)
+
+
+def _section(number: str, subsections: str) -> str:
+    parts = _SUBSECTION.findall(subsections or '')
+    return "§" + number + "".join(f"({part.lower()})" for part in parts)
+
+
+def extract_citations(text: str) -> Set[str]:
+    """Normalized ordinance sections, regulation chapters and case numbers cited in ``text``.
+
+    Sections are written ``§1707(f)(1)``, chapters ``Chapter 2`` and case
+    numbers as printed, e.g. ``C23240003``.
+    """
+    citations = {_section(number, subsections) for number, subsections in _SECTION.findall(text)}
+    citations.update(f"Chapter {chapter.upper()}" for chapter in _CHAPTER.findall(text))
+    citations.update(_CASE_NUMBER.findall(text))
+    return citations
+
+
+def normalize_citation(query: str) -> str:
+    """Normalize a user-typed citation ("section 1707(A)", "1707(a)", "c23240003")."""
+    query = query.strip()
+    if re.fullmatch(r'\d{3,6}(?:\.\d+)?(?:\s?\([a-z0-9]{1,4}\))*', query, re.IGNORECASE):
+        query = "§" + query
+    citations = extract_citations(query) or extract_citations(query.upper())
+    if len(citations) == 1:
+        return citations.pop()
+    return query
+
+
+def expand_citation(citation: str) -> List[str]:
+    """A section citation and its parents: ``§1707(f)(1)`` -> itself, ``§1707(f)``, ``§1707``."""
+    expanded = [citation]
+    while citation.startswith("§") and citation.endswith(")"):
+        citation = citation[:citation.rindex("(")]
+        expanded.append(citation)
+    return expanded
+
+
+class CitationIndex:
+    """Inverted index from citation to the decisions citing it.
+
+    Documents are numbered and each citation keeps a sorted list of
+    document numbers, which is what gets saved; lookups and intersections
+    run on in-memory sets. A section citation is also posted under its
+    parent sections, so ``§1707`` finds decisions citing ``§1707(a)``.
+
+    Several processes (build, watch, the app) share the file. ``add`` only
+    changes memory; ``save`` is called once per build or batch and merges
+    the documents added here into what is on disk, so edges written by
+    other processes are kept.
+    """
+
+    def __init__(self, path: Optional[str] = CITATION_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.documents: List[str] = []
+        self._doc_numbers: Dict[str, int] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._cited: Dict[int, Set[str]] = {}
+        # Documents added since the last save
+        self._dirty: Set[str] = set()
+        self._loaded_mtime = None
+        if path and os.path.exists(path):
+            self._loaded_mtime = os.path.getmtime(path)
+            self._load(path)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def _load(self, path: str) -> None:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != FORMAT_VERSION:
+            logger.warning(f"Ignoring citation index {path} with unsupported version {data.get('version')}")
+            return
+        self.documents = data['documents']
+        self._doc_numbers = {doc_id: number for number, doc_id in enumerate(self.documents)}
+        for citation, numbers in data['postings'].items():
+            self._postings[citation] = set(numbers)
+            for number in numbers:
+                self._cited.setdefault(number, set()).add(citation)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_numbers and self._doc_numbers[doc_id] in self._cited
+
+    def __len__(self) -> int:
+        return len(self._cited)
+
+    def add(self, doc_id: str, citations: Iterable[str]) -> None:
+        """Index ``doc_id`` under ``citations``, replacing what it was indexed under before."""
+        posted = {expanded for citation in citations for expanded in expand_citation(citation)}
+        with self._lock:
+            number = self._doc_numbers.get(doc_id)
+            if number is None:
+                number = len(self.documents)
+                self.documents.append(doc_id)
+                self._doc_numbers[doc_id] = number
+            for citation in self._cited.get(number, set()) - posted:
+                self._postings[citation].discard(number)
+                if not self._postings[citation]:
+                    del self._postings[citation]
+            for citation in posted:
+                self._postings.setdefault(citation, set()).add(number)
+            self._cited[number] = posted
+            self._dirty.add(doc_id)
+
+    def citations_of(self, doc_id: str) -> List[str]:
+        number = self._doc_numbers.get(doc_id)
+        return sorted(self._cited.get(number, ())) if number is not None else []
+
+    def lookup(self, citation: str) -> List[str]:
+        """Documents citing ``citation`` (or one of its subsections)."""
+        return self.search([citation])
+
+    def refresh(self) -> None:
+        """Pick up edges another process saved since this index was loaded."""
+        if not self.path:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        disk = CitationIndex(self.path)
+        with self._lock:
+            for doc_id in self._dirty:
+                disk.add(doc_id, self._cited.get(self._doc_numbers[doc_id], set()))
+            self.documents, self._doc_numbers = disk.documents, disk._doc_numbers
+            self._postings, self._cited = disk._postings, disk._cited
+            self._loaded_mtime = disk._loaded_mtime
+
+    def search(self, citations: Iterable[str], match_all: bool = True) -> List[str]:
+        """Documents citing all (or with ``match_all=False``, any) of ``citations``."""
+        self.refresh()
+        postings = sorted((self._postings.get(normalize_citation(c), set()) for c in citations), key=len)
+        if not postings:
+            return []
+        numbers = set.intersection(*postings) if match_all else set.union(*postings)
+        return sorted(self.documents[number] for number in numbers)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of citing documents per citation."""
+        return {citation: len(numbers) for citation, numbers in self._postings.items()}
+
+    def _lock_file(self, path: str) -> str:
+        """Take the cross-process lock for ``path``; returns the lock file to remove."""
+        lock_path = f"{path}.lock"
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock_path
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.05)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Merge the documents added since the last save into the file, atomically.
+
+        The file is re-read under a lock file, this process's changes are
+        applied on top, and the merged index is written to a temporary file
+        and swapped in. The in-memory index then holds the merged state too.
+        """
+        path = path or self.path
+        with self._save_lock:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            lock_path = self._lock_file(path)
+            try:
+                merged = CitationIndex(path)
+                with self._lock:
+                    changed = {doc_id: self._cited.get(self._doc_numbers[doc_id], set())
+                               for doc_id in self._dirty}
+                    for doc_id, citations in changed.items():
+                        merged.add(doc_id, citations)
+                    self.documents, self._doc_numbers = merged.documents, merged._doc_numbers
+                    self._postings, self._cited = merged._postings, merged._cited
+                    self._dirty = set()
+                    self._loaded_mtime = None
+                    data = {
+                        'version': FORMAT_VERSION,
+                        'documents': list(self.documents),
+                        'postings': {citation: sorted(numbers)
+                                     for citation, numbers in sorted(self._postings.items())}
+                    }
+                temp_path = f"{path}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, separators=(',', ':'), ensure_ascii=False)
+                os.replace(temp_path, path)
+                if path == self.path:
+                    self._loaded_mtime = os.path.getmtime(path)
+            finally:
+                os.remove(lock_path)
+
+
+def index_directory(index: CitationIndex, pdf_dir: str) -> int:
+    """Index citations of every PDF in ``pdf_dir`` and save; needs text extraction only."""
+    import fitz  # PyMuPDF
+
+    indexed = 0
+    for pdf_file in sorted(os.listdir(pdf_dir)):
+        if not pdf_file.lower().endswith('.pdf'):
+            continue
+        try:
+            with fitz.open(os.path.join(pdf_dir, pdf_file)) as doc:
+                text = "".join(page.get_text() for page in doc)
+            index.add(pdf_file, extract_citations(text))
+            indexed += 1
+        except Exception as e:
+            logger.error(f"Failed to index citations for {pdf_file}: {str(e)}")
+    index.save()
+    return indexed
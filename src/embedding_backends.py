@@ -0,0 +1,202 @@
+# Embedding runtime backends for the shared sentence embedding model
+#
+# ``torch`` runs the stock SentenceTransformer. ``onnx`` runs a locally
+# cached ONNX export of the same model on ONNX Runtime's CPU provider,
+# optionally with dynamic int8 weights. Both return the same mean-pooled
+# embeddings, so collections built with one can be queried with the other.
+
+import logging
+import os
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx")
+ONNX_MODEL_DIR = os.path.join("models", "all-MiniLM-L6-v2-onnx")
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_int8.onnx"
+# all-MiniLM-L6-v2 truncates inputs to 256 word pieces
+MAX_SEQ_LENGTH = 256
+WARMUP_TEXTS = ["Issue: Landlord failed to repair the heating system",
+                "Issue: Rent increase exceeded the allowed annual adjustment"]
+
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def backend_options() -> Dict:
+    """Backend settings from the environment.
+
+    ``EMBEDDING_BACKEND`` (torch|onnx), ``EMBEDDING_DEVICE`` (torch only,
+    default cpu), ``EMBEDDING_ONNX_DIR``, ``EMBEDDING_QUANTIZE`` (1 for
+    int8 ONNX weights), ``EMBEDDING_THREADS`` (intra-op) and
+    ``EMBEDDING_INTEROP_THREADS``.
+    """
+    return {
+        'backend': os.getenv('EMBEDDING_BACKEND', 'torch').lower(),
+        'device': os.getenv('EMBEDDING_DEVICE', 'cpu'),
+        'model_dir': os.getenv('EMBEDDING_ONNX_DIR', ONNX_MODEL_DIR),
+        'quantize': os.getenv('EMBEDDING_QUANTIZE', '0').lower() in ('1', 'true', 'yes', 'int8'),
+        'intra_op_threads': _int_env('EMBEDDING_THREADS'),
+        'inter_op_threads': _int_env('EMBEDDING_INTEROP_THREADS'),
+    }
+
+
+class TorchEmbeddingBackend:
+    """The stock PyTorch SentenceTransformer, pinned to ``device``."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, device: str = "cpu",
+                 intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None, **_):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if intra_op_threads:
+            torch.set_num_threads(intra_op_threads)
+        if inter_op_threads:
+            try:
+                torch.set_num_interop_threads(inter_op_threads)
+            except RuntimeError as e:
+                # Only allowed before torch starts any parallel work
+                logger.warning(f"Could not set inter-op threads: {str(e)}")
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def encode(self, texts: List[str], normalize: bool = True, batch_size: int = 32, **kwargs):
+        return self.model.encode(texts, normalize_embeddings=normalize, batch_size=batch_size, **kwargs)
+
+    def warmup(self) -> None:
+        self.encode(WARMUP_TEXTS)
+
+
+class OnnxEmbeddingBackend:
+    """ONNX Runtime CPU inference over a locally cached model export.
+
+    ``model_dir`` holds ``model.onnx`` and the fast tokenizer's
+    ``tokenizer.json`` as written by ``export_onnx``; nothing is fetched at
+    runtime. Batches are formed from length-sorted texts to keep padding
+    small, and token embeddings are mean-pooled over the attention mask
+    exactly like the SentenceTransformer pooling layer.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, quantize: bool = False,
+                 intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None,
+                 max_seq_length: int = MAX_SEQ_LENGTH, **_):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"No ONNX model at {model_path}; "
+                                    f"run 'python main.py export-onnx' first")
+        if quantize:
+            model_path = quantize_onnx(model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+            if inter_op_threads > 1:
+                options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.model_path = model_path
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+        logger.info(f"Loaded ONNX embedding model {model_path}")
+
+    def _embed_batch(self, texts: List[str]):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        output = self.session.run(None, feeds)[0]
+        if output.ndim == 2:
+            # Export already includes pooling
+            return output.astype(np.float32)
+        mask = attention_mask[..., None].astype(np.float32)
+        return (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: List[str], normalize: bool = True, batch_size: int = 32, **kwargs):
+        import numpy as np
+        from quantized_store import normalize as unit_normalize
+
+        texts = list(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = None
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            embedded = self._embed_batch([texts[i] for i in batch])
+            if vectors is None:
+                vectors = np.empty((len(texts), embedded.shape[1]), dtype=np.float32)
+            vectors[batch] = embedded
+        if vectors is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return unit_normalize(vectors) if normalize else vectors
+
+    def warmup(self) -> None:
+        self.encode(WARMUP_TEXTS)
+
+
+def export_onnx(model_name: str, model_dir: str = ONNX_MODEL_DIR, opset: int = 14) -> str:
+    """Export ``model_name``'s transformer and tokenizer to ``model_dir``.
+
+    Needs torch and sentence-transformers once, on any machine; the
+    resulting directory can then be copied to hosts that only have ONNX
+    Runtime.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    os.makedirs(model_dir, exist_ok=True)
+
+    sample = tokenizer(WARMUP_TEXTS, padding=True, return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in names), model_path,
+                          input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+    tokenizer.save_pretrained(model_dir)
+    logger.info(f"Exported {model_name} to {model_path}")
+    return model_path
+
+
+def quantize_onnx(model_path: str) -> str:
+    """Dynamic int8 weight quantization of an ONNX model, cached next to it."""
+    quantized_path = os.path.join(os.path.dirname(model_path), ONNX_QUANTIZED_FILE)
+    if os.path.exists(quantized_path) and os.path.getmtime(quantized_path) >= os.path.getmtime(model_path):
+        return quantized_path
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise ImportError("int8 quantization needs the 'onnx' package (pip install onnx)") from e
+    logger.info(f"Quantizing {model_path} to int8")
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def create_backend(model_name: str, backend: str = "torch", **options):
+    """Instantiate the embedding backend called ``backend``."""
+    if backend == "torch":
+        return TorchEmbeddingBackend(model_name, **options)
+    if backend == "onnx":
+        return OnnxEmbeddingBackend(**options)
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(BACKENDS)})")
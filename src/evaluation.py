@@ -0,0 +1,241 @@
+# Offline retrieval-quality evaluation against a labeled relevance set
+
+import json
+import logging
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from case_metadata import parse_filename
+
+logger = logging.getLogger(__name__)
+
+# One judgment per line: {"query": "...pdf", "document": "...pdf", "relevance": 0-3}
+JUDGMENTS_PATH = os.path.join("data", "relevance_judgments.jsonl")
+K_VALUES = [1, 3, 5, 10]
+# Grades derived from case families
+APPEAL_CHAIN_GRADE = 2
+SAME_PROPERTY_GRADE = 1
+
+# Named retrieval configurations: ``LegalDocumentRAG`` keyword arguments.
+# Index paths are filled in by ``configuration_kwargs``.
+CONFIGURATIONS: Dict[str, Dict] = {
+    'vector': {},
+    'maxsim': {'issue_matching': 'maxsim'},
+    'assignment': {'issue_matching': 'assignment'},
+    'quantized': {'quantized_index': True},
+    'ivf': {'ivf_index': True},
+    'snapshot': {'snapshot': True},
+    'rerank': {'rerank_candidates': 20},
+}
+
+Judgments = Dict[str, Dict[str, int]]
+
+
+def case_family(filename: str) -> str:
+    """Property key shared by related decisions, e.g. ``1260 montecito``."""
+    address = parse_filename(filename)['property_address']
+    if address:
+        return address.lower()
+    return os.path.basename(filename).split(' ')[0].lower()
+
+
+def family_judgments(filenames: Sequence[str]) -> Judgments:
+    """Graded relevance between decisions of the same property.
+
+    A decision and another stage of the same dispute (hearing officer
+    decision, compliance decision, appeal, remand) are highly relevant to
+    each other; two decisions of the same kind for the same property are
+    relevant. The filenames do not carry the unit, so units of one building
+    share a family; ``load_judgments`` can correct individual pairs.
+    """
+    families: Dict[str, List[str]] = {}
+    for filename in filenames:
+        families.setdefault(case_family(filename), []).append(filename)
+    judgments: Judgments = {}
+    for members in families.values():
+        for query in members:
+            kind = parse_filename(query)['decision_type']
+            for document in members:
+                if document == query:
+                    continue
+                same_kind = kind is not None and parse_filename(document)['decision_type'] == kind
+                judgments.setdefault(query, {})[document] = (SAME_PROPERTY_GRADE if same_kind
+                                                             else APPEAL_CHAIN_GRADE)
+    return judgments
+
+
+def load_judgments(path: str = JUDGMENTS_PATH) -> Judgments:
+    """User-supplied judgments; a relevance of 0 marks a pair as not relevant."""
+    judgments: Judgments = {}
+    if not os.path.exists(path):
+        return judgments
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                judgments.setdefault(record['query'], {})[record['document']] = int(record['relevance'])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Skipping judgment on line {line_number} of {path}: {str(e)}")
+    return judgments
+
+
+def relevance_set(filenames: Sequence[str], path: str = JUDGMENTS_PATH) -> Judgments:
+    """Family judgments over ``filenames`` overridden by the user's, restricted to ``filenames``.
+
+    Queries without any relevant document are dropped, since no ranking can
+    score on them.
+    """
+    indexed = set(filenames)
+    judgments = family_judgments(filenames)
+    for query, documents in load_judgments(path).items():
+        for document, grade in documents.items():
+            judgments.setdefault(query, {})[document] = grade
+    return {
+        query: {document: grade for document, grade in documents.items() if grade > 0 and document in indexed}
+        for query, documents in judgments.items()
+        if query in indexed and any(grade > 0 and document in indexed for document, grade in documents.items())
+    }
+
+
+def recall_at_k(ranked: Sequence[str], grades: Dict[str, int], k: int) -> float:
+    """Fraction of the relevant documents found in the first ``k``."""
+    if not grades:
+        return 0.0
+    return len(set(ranked[:k]) & set(grades)) / len(grades)
+
+
+def reciprocal_rank(ranked: Sequence[str], grades: Dict[str, int]) -> float:
+    """1 / rank of the first relevant document, 0 if none was returned."""
+    for rank, document in enumerate(ranked, 1):
+        if grades.get(document, 0) > 0:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked: Sequence[str], grades: Dict[str, int], k: int) -> float:
+    """Normalised discounted cumulative gain with gains ``2**grade - 1``."""
+    dcg = sum((2 ** grades.get(document, 0) - 1) / math.log2(rank + 1)
+              for rank, document in enumerate(ranked[:k], 1))
+    ideal = sum((2 ** grade - 1) / math.log2(rank + 1)
+                for rank, grade in enumerate(sorted(grades.values(), reverse=True)[:k], 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def score_rankings(rankings: Dict[str, List[str]], judgments: Judgments,
+                   k_values: Sequence[int] = K_VALUES) -> Dict[str, float]:
+    """Mean recall@k, MRR and nDCG@k of ``rankings`` over the judged queries."""
+    queries = [query for query in judgments if query in rankings]
+    metrics: Dict[str, float] = {'queries': len(queries)}
+    if not queries:
+        return metrics
+    metrics['mrr'] = sum(reciprocal_rank(rankings[q], judgments[q]) for q in queries) / len(queries)
+    for k in k_values:
+        metrics[f'recall@{k}'] = sum(recall_at_k(rankings[q], judgments[q], k) for q in queries) / len(queries)
+        metrics[f'ndcg@{k}'] = sum(ndcg_at_k(rankings[q], judgments[q], k) for q in queries) / len(queries)
+    return metrics
+
+
+def configuration_kwargs(spec: str) -> Dict:
+    """``LegalDocumentRAG`` arguments for ``name[:key=value,...]``, e.g. ``ivf:nprobe=4``.
+
+    Overrides are any constructor argument; numbers are converted.
+    """
+    from rag_processor import IVF_INDEX_PATH, QUANTIZED_INDEX_PATH, SNAPSHOT_PATH
+
+    name, _, overrides = spec.partition(':')
+    if name not in CONFIGURATIONS:
+        raise ValueError(f"Unknown retrieval configuration {name!r}; choose from {', '.join(CONFIGURATIONS)}")
+    kwargs = dict(CONFIGURATIONS[name])
+    defaults = {'quantized_index': QUANTIZED_INDEX_PATH, 'ivf_index': IVF_INDEX_PATH, 'snapshot': SNAPSHOT_PATH}
+    for key, path in defaults.items():
+        if kwargs.get(key) is True:
+            kwargs[key] = path
+    for override in filter(None, overrides.split(',')):
+        key, _, value = override.partition('=')
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                continue
+        kwargs[key.strip().replace('-', '_')] = None if value in ('', 'none') else value
+    return kwargs
+
+
+def evaluate(rank: Callable[[str], List[str]], queries: Dict[str, str], judgments: Judgments,
+             k_values: Sequence[int] = K_VALUES) -> Dict:
+    """Run every judged query through ``rank`` and score the rankings.
+
+    ``queries`` maps a query filename to its petitioner issues and ``rank``
+    returns filenames best first. The query itself is removed from its
+    ranking. The result holds the metrics and the per-query latencies in
+    seconds.
+    """
+    rankings: Dict[str, List[str]] = {}
+    latencies: List[float] = []
+    for query, issues in queries.items():
+        if query not in judgments:
+            continue
+        start = time.perf_counter()
+        ranked = rank(issues)
+        latencies.append(time.perf_counter() - start)
+        rankings[query] = [document for document in ranked if document != query]
+    return {'metrics': score_rankings(rankings, judgments, k_values), 'latencies': latencies,
+            'rankings': rankings}
+
+
+def indexed_queries(rag) -> Dict[str, str]:
+    """Stored petitioner issues of every indexed case, keyed by filename.
+
+    Replaying these keeps the evaluation free of Gemini calls, so runs are
+    fast, repeatable and compare only the retrieval settings.
+    """
+    queries = {}
+    for name in rag.document_collections():
+        records = rag._get_collection(name).get(include=["metadatas", "documents"])
+        for metadata, document in zip(records['metadatas'], records['documents']):
+            if metadata and document:
+                queries[metadata['filename']] = document
+    return queries
+
+
+def evaluate_configurations(api_key: str, specs: Sequence[str], k_values: Sequence[int] = K_VALUES,
+                            judgments_path: str = JUDGMENTS_PATH,
+                            chroma_path: Optional[str] = None,
+                            sharding: Optional[str] = None) -> List[Dict]:
+    """Evaluate several retrieval configurations on the same queries and judgments.
+
+    Each configuration gets its own ``LegalDocumentRAG`` (the embedder and
+    Chroma client are shared) and ranks the stored issues of every judged
+    case, retrieving one extra result so dropping the query itself still
+    leaves ``max(k_values)``.
+    """
+    from rag_processor import LegalDocumentRAG
+
+    base = LegalDocumentRAG(api_key, chroma_path=chroma_path, sharding=sharding)
+    queries = indexed_queries(base)
+    judgments = relevance_set(list(queries), judgments_path)
+    logger.info(f"Evaluating {len(specs)} configuration(s) on {len(judgments)} judged queries "
+                f"out of {len(queries)} indexed cases")
+    depth = max(k_values) + 1
+
+    reports = []
+    for spec in specs:
+        try:
+            rag = LegalDocumentRAG(api_key, chroma_path=chroma_path,
+                                   **{'sharding': sharding, **configuration_kwargs(spec)})
+
+            def rank(issues: str) -> List[str]:
+                return [doc['filename'] for doc in rag.rank_issues(issues, top_k=depth)]
+
+            # One untimed query loads the models this configuration uses
+            if queries:
+                rank(next(iter(queries.values())))
+            reports.append({'configuration': spec, **evaluate(rank, queries, judgments, k_values)})
+        except Exception as e:
+            logger.error(f"Could not evaluate configuration {spec}: {str(e)}")
+    return reports
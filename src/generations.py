@@ -0,0 +1,219 @@
+# Versioned index generations with an atomically flipped CURRENT pointer
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GENERATIONS_ROOT = "index_generations"
+# Index used until the first generation is published
+LEGACY_INDEX_PATH = "chroma_db"
+POINTER_NAME = "CURRENT"
+MANIFEST_NAME = "manifest.json"
+RETAIN_GENERATIONS = 3
+# Readers look at the pointer at most this often
+CHECK_INTERVAL = 1.0
+# Search distance at which validation accepts another record with the same embedding
+DUPLICATE_DISTANCE = 1e-5
+# Manifest statuses of generations no build is writing to any more
+FINAL_STATUSES = ("published", "rejected")
+
+
+class IndexGenerations:
+    """Build-then-publish generations of the Chroma index.
+
+    Each build writes a new ``gen-<timestamp>`` directory under ``root``
+    (seeded with a copy of the live index, so incremental builds keep
+    their journal semantics), is validated, and is then published by
+    atomically replacing the ``CURRENT`` pointer file. Readers resolve the
+    pointer with ``index_path`` and never see a half-built index. Until a
+    generation is published, ``index_path`` is the legacy ``chroma_db``.
+    """
+
+    def __init__(self, root: str = GENERATIONS_ROOT, legacy_path: str = LEGACY_INDEX_PATH,
+                 retain: int = RETAIN_GENERATIONS):
+        self.root = root
+        self.legacy_path = legacy_path
+        self.retain = max(1, retain)
+        self._checked_at = 0.0
+        self._live_path: Optional[str] = None
+        self._check_lock = threading.Lock()
+
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.root, POINTER_NAME)
+
+    def path(self, name: str) -> str:
+        """Chroma directory of generation ``name``."""
+        return os.path.join(self.root, name, "chroma")
+
+    def current(self) -> Optional[str]:
+        """Name of the published generation, or None before the first publish."""
+        try:
+            with open(self.pointer_path, encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def index_path(self) -> str:
+        """Chroma directory readers should open."""
+        name = self.current()
+        return self.path(name) if name else self.legacy_path
+
+    def live_path(self) -> str:
+        """``index_path``, re-reading the pointer at most every ``CHECK_INTERVAL`` seconds.
+
+        Cheap enough for long-lived readers to call on every query and
+        compare with the path they have open.
+        """
+        now = time.monotonic()
+        if self._live_path is None or now - self._checked_at >= CHECK_INTERVAL:
+            with self._check_lock:
+                if self._live_path is None or now - self._checked_at >= CHECK_INTERVAL:
+                    self._live_path = self.index_path()
+                    self._checked_at = now
+        return self._live_path
+
+    def generations(self) -> List[str]:
+        """Generation names, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith("gen-") and os.path.isdir(os.path.join(self.root, name)))
+
+    def manifest(self, name: str) -> Dict:
+        try:
+            with open(os.path.join(self.root, name, MANIFEST_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_manifest(self, name: str, manifest: Dict) -> None:
+        path = os.path.join(self.root, name, MANIFEST_NAME)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, path)
+
+    def create(self, seed: bool = True) -> str:
+        """Create a new generation, seeded with a copy of the live index."""
+        os.makedirs(self.root, exist_ok=True)
+        name = time.strftime("gen-%Y%m%d-%H%M%S")
+        suffix = 0
+        while os.path.exists(os.path.join(self.root, name + (f"-{suffix}" if suffix else ""))):
+            suffix += 1
+        name += f"-{suffix}" if suffix else ""
+        base = self.current()
+        source = self.path(base) if base else self.legacy_path
+        if seed and os.path.isdir(source):
+            shutil.copytree(source, self.path(name))
+        else:
+            os.makedirs(self.path(name))
+        self._write_manifest(name, {'status': 'building', 'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                    'seeded_from': source if seed else None, 'base': base})
+        logger.info(f"Building index generation {name}")
+        return name
+
+    def validate(self, name: str, collection_names: List[str], min_documents: int = 1) -> List[str]:
+        """Problems that should stop ``name`` from being published; empty if it is sound.
+
+        The collections must open and hold at least ``min_documents``
+        records between them (callers pass the seeded count so a build
+        cannot shrink the index), and in each non-empty collection a stored
+        embedding must find its own record (or an exact duplicate). A generation seeded from a
+        generation that is no longer live would drop whatever was published
+        since, so it is rejected too.
+        """
+        import chromadb
+
+        problems = []
+        manifest, current = self.manifest(name), self.current()
+        if 'base' in manifest and manifest['base'] != current:
+            problems.append(f"seeded from {manifest['base'] or self.legacy_path}, "
+                            f"but {current} was published since")
+        total = 0
+        try:
+            client = chromadb.PersistentClient(path=self.path(name))
+            for collection_name in collection_names:
+                collection = client.get_collection(collection_name)
+                count = collection.count()
+                total += count
+                if not count:
+                    continue
+                sample = collection.get(limit=1, include=["embeddings"])
+                hits = collection.query(query_embeddings=[list(sample['embeddings'][0])], n_results=1,
+                                        include=["distances"])
+                # A duplicate embedding may be returned instead, at the same (zero) distance
+                found = hits['ids'][0][:1] == sample['ids'][:1] or (
+                    bool(hits['distances'][0]) and hits['distances'][0][0] <= DUPLICATE_DISTANCE)
+                if not found:
+                    problems.append(f"{collection_name} search did not return the record queried for")
+            if total < min_documents:
+                problems.append(f"index has {total} documents, expected at least {min_documents}")
+        except Exception as e:
+            problems.append(f"index could not be read: {str(e)}")
+        manifest = self.manifest(name)
+        manifest.update({'status': 'rejected' if problems else 'validated', 'documents': total,
+                         'problems': problems})
+        self._write_manifest(name, manifest)
+        return problems
+
+    def publish(self, name: str) -> None:
+        """Atomically point readers at generation ``name``."""
+        if not os.path.isdir(self.path(name)):
+            raise ValueError(f"No index generation {name}")
+        manifest = self.manifest(name)
+        manifest.update({'status': 'published', 'published_at': time.strftime('%Y-%m-%d %H:%M:%S')})
+        self._write_manifest(name, manifest)
+        temp_path = f"{self.pointer_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.pointer_path)
+        logger.info(f"Published index generation {name}")
+
+    def discard(self, name: str) -> None:
+        """Delete generation ``name``, which must not be the published one."""
+        if name == self.current():
+            raise ValueError(f"Cannot discard the published generation {name}")
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        logger.info(f"Discarded index generation {name}")
+
+    def collect_garbage(self) -> List[str]:
+        """Delete generations older than the newest ``retain`` published ones.
+
+        The current generation, anything newer than it and any generation
+        still being built (status ``building``, e.g. a watcher's staged
+        generation that predates the last publish) are never removed;
+        those left behind by a crashed build are deleted with ``discard``.
+        """
+        current = self.current()
+        names = self.generations()
+        if current not in names:
+            return []
+        older = names[:names.index(current)]
+        statuses = {name: self.manifest(name).get('status') for name in older}
+        published = [name for name in older if statuses[name] == 'published']
+        keep = set(published[-(self.retain - 1):]) if self.retain > 1 else set()
+        removed = []
+        for name in older:
+            if name not in keep and statuses[name] in FINAL_STATUSES:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                removed.append(name)
+        if removed:
+            logger.info(f"Removed {len(removed)} old index generation(s)")
+        return removed
+
+
+_default = IndexGenerations()
+
+
+def default_generations() -> IndexGenerations:
+    """Process-wide generations of the default index."""
+    return _default
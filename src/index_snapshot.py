@@ -0,0 +1,268 @@
+# Single-file, memory-mappable snapshot of the vector index
+
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from quantized_store import pairwise_distances, prepare_vectors, vector_norms
+from sharding import matches_where
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LCRAGIDX"
+FORMAT_VERSION = 2
+# Version 1 files lack the issue-vector and citation sections
+READABLE_VERSIONS = (1, 2)
+ALIGNMENT = 64
+# magic, format version, header length
+PREAMBLE = struct.Struct("<8sII")
+EXPORT_BATCH_SIZE = 1000
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class IndexSnapshot:
+    """Read-only view of an exported index file.
+
+    The file holds a small JSON header followed by 64-byte aligned sections:
+    the float32 embedding matrix, its norms, a row offset table and the
+    concatenated JSON records (id, metadata and extracted issues). Opening
+    it maps the file and parses only the header; arrays are zero-copy views
+    and records are decoded on demand. Optional sections carry the
+    per-issue vectors and the citation index, so an export/import round
+    trip keeps them; search only uses the document vectors.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Snapshot {path} is empty")
+
+        magic, version, header_length = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an index snapshot")
+        if version not in READABLE_VERSIONS:
+            self.close()
+            raise ValueError(f"Unsupported snapshot version {version} in {path}")
+        self.header = json.loads(self._mmap[PREAMBLE.size:PREAMBLE.size + header_length])
+
+        self.count = self.header['count']
+        self.dim = self.header['dim']
+        self.space = self.header['space']
+        self.vectors = self._section('vectors', np.float32).reshape(self.count, self.dim)
+        self.norms = self._section('norms', np.float32)
+        self._record_offsets = self._section('record_offsets', np.uint64)
+        self._records_start = self.header['sections']['records'][0]
+        self.issue_count = self.header.get('issue_count', 0)
+
+    def _section(self, name: str, dtype) -> np.ndarray:
+        offset, length = self.header['sections'][name]
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                             offset=offset)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "IndexSnapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Views into the map must be dropped before it can be closed
+        for attr in ('vectors', 'norms', '_record_offsets'):
+            self.__dict__.pop(attr, None)
+        if getattr(self, '_mmap', None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A caller still holds an array view; the map is released with it
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def record(self, row: int) -> Dict:
+        """Decode the ``{'id', 'metadata', 'document'}`` record for ``row``."""
+        start = self._records_start + int(self._record_offsets[row])
+        end = self._records_start + int(self._record_offsets[row + 1])
+        return json.loads(self._mmap[start:end])
+
+    def batches(self, batch_size: int = EXPORT_BATCH_SIZE,
+                issues: bool = False) -> Iterator[Tuple[List[str], np.ndarray, List[Dict], List[str]]]:
+        """``(ids, embeddings, metadatas, documents)`` batches of the documents, or of the issue vectors."""
+        if issues:
+            if not self.issue_count:
+                return
+            count = self.issue_count
+            vectors = self._section('issue_vectors', np.float32).reshape(count, self.dim)
+            offsets = self._section('issue_record_offsets', np.uint64)
+            records_start = self.header['sections']['issue_records'][0]
+        else:
+            count, vectors = self.count, self.vectors
+            offsets, records_start = self._record_offsets, self._records_start
+        for start in range(0, count, batch_size):
+            end = min(start + batch_size, count)
+            batch = [json.loads(self._mmap[records_start + int(offsets[row]):records_start + int(offsets[row + 1])])
+                     for row in range(start, end)]
+            yield ([item['id'] for item in batch], vectors[start:end],
+                   [item['metadata'] for item in batch], [item['document'] for item in batch])
+
+    def citations(self) -> Dict[str, List[str]]:
+        """Citations of each document, empty for snapshots written without them."""
+        if 'citations' not in self.header['sections']:
+            return {}
+        offset, length = self.header['sections']['citations']
+        return json.loads(self._mmap[offset:offset + length])
+
+    def records(self) -> Iterator[Dict]:
+        for row in range(self.count):
+            yield self.record(row)
+
+    def search(self, query, top_k: int = 5, where: Optional[Dict] = None) -> List[Tuple[Dict, float]]:
+        """Exact nearest-neighbour search returning ``(record, distance)`` pairs.
+
+        With a Chroma ``where`` filter, records are decoded nearest first
+        until ``top_k`` of them match.
+        """
+        if self.count == 0:
+            return []
+        query = prepare_vectors(query, self.space).ravel()
+        distances = pairwise_distances(query, self.vectors @ query, self.norms, self.space)
+        if where:
+            hits = []
+            for row in np.argsort(distances):
+                record = self.record(int(row))
+                if matches_where(record['metadata'] or {}, where):
+                    hits.append((record, float(distances[row])))
+                    if len(hits) == top_k:
+                        break
+            return hits
+        top_k = min(top_k, self.count)
+        rows = np.argpartition(distances, top_k - 1)[:top_k]
+        rows = rows[np.argsort(distances[rows])]
+        return [(self.record(int(row)), float(distances[row])) for row in rows]
+
+    def import_into(self, collection, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+        """Upsert every record and embedding into a Chroma collection."""
+        for ids, embeddings, metadatas, documents in self.batches(batch_size):
+            collection.upsert(ids=ids, embeddings=embeddings.tolist(), metadatas=metadatas,
+                              documents=documents)
+        logger.info(f"Imported {self.count} records into {collection.name}")
+        return self.count
+
+
+def _encode_records(ids: Sequence[str], metadatas: Sequence[Optional[Dict]],
+                    documents: Sequence[Optional[str]]) -> Tuple[bytes, bytes]:
+    """Row offset table and concatenated JSON records."""
+    records = [
+        json.dumps({'id': doc_id, 'metadata': metadata, 'document': document},
+                   ensure_ascii=False).encode('utf-8')
+        for doc_id, metadata, document in zip(ids, metadatas, documents)
+    ]
+    record_offsets = np.zeros(len(records) + 1, dtype=np.uint64)
+    np.cumsum([len(record) for record in records], out=record_offsets[1:])
+    return record_offsets.tobytes(), b"".join(records)
+
+
+def write_snapshot(path: str, ids: Sequence[str], embeddings, metadatas: Sequence[Optional[Dict]],
+                   documents: Sequence[Optional[str]], space: str = "l2",
+                   collection_name: Optional[str] = None, issues: Optional[Dict] = None,
+                   citations: Optional[Dict[str, List[str]]] = None) -> None:
+    """Write an index snapshot to ``path`` atomically.
+
+    ``issues`` holds the per-issue vectors as a Chroma ``get`` result (ids,
+    embeddings, metadatas, documents); ``citations`` maps each document to
+    the citations it makes.
+    """
+    vectors = np.ascontiguousarray(prepare_vectors(embeddings, space))
+    if vectors.ndim != 2 or len(vectors) != len(ids):
+        raise ValueError("Expected one embedding row per id")
+
+    record_offsets, records = _encode_records(ids, metadatas, documents)
+    norms = vector_norms(vectors, space).astype(np.float32)
+
+    payloads = [
+        ('vectors', vectors.tobytes()),
+        ('norms', norms.tobytes()),
+        ('record_offsets', record_offsets),
+        ('records', records)
+    ]
+    issue_count = len(issues['ids']) if issues else 0
+    if issue_count:
+        issue_vectors = np.ascontiguousarray(prepare_vectors(issues['embeddings'], space))
+        if issue_vectors.shape != (issue_count, vectors.shape[1]):
+            raise ValueError("Expected one issue embedding row per issue id")
+        issue_offsets, issue_records = _encode_records(issues['ids'], issues['metadatas'], issues['documents'])
+        payloads += [('issue_vectors', issue_vectors.tobytes()),
+                     ('issue_record_offsets', issue_offsets),
+                     ('issue_records', issue_records)]
+    if citations:
+        payloads.append(('citations', json.dumps(citations, ensure_ascii=False).encode('utf-8')))
+    header = {
+        'count': len(ids),
+        'issue_count': issue_count,
+        'dim': int(vectors.shape[1]) if vectors.size else 0,
+        'space': space,
+        'collection': collection_name,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'sections': {}
+    }
+
+    # Section offsets depend on the header size, which depends on the
+    # offsets; reserve room for the digits and recompute until stable
+    header_length = 0
+    while True:
+        offset = _align(PREAMBLE.size + header_length)
+        for name, payload in payloads:
+            header['sections'][name] = [offset, len(payload)]
+            offset = _align(offset + len(payload))
+        encoded = json.dumps(header).encode('utf-8')
+        if len(encoded) <= header_length:
+            encoded = encoded.ljust(header_length)
+            break
+        header_length = len(encoded) + 16
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_length))
+        f.write(encoded)
+        for name, payload in payloads:
+            f.seek(header['sections'][name][0])
+            f.write(payload)
+        f.truncate(_align(f.tell()))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.info(f"Exported {len(ids)} records to {path}")
+
+
+def export_collection(collection, path: str) -> int:
+    """Export a Chroma collection to a snapshot file."""
+    records = collection.get(include=["embeddings", "metadatas", "documents"])
+    embeddings = records['embeddings']
+    if embeddings is None or len(embeddings) == 0:
+        raise ValueError(f"Collection {collection.name} has no embeddings")
+    write_snapshot(
+        path,
+        records['ids'],
+        embeddings,
+        records['metadatas'],
+        records['documents'],
+        space=(collection.metadata or {}).get("hnsw:space", "l2"),
+        collection_name=collection.name
+    )
+    return len(records['ids'])
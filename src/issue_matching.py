@@ -0,0 +1,93 @@
+# Per-issue matching between a query case and candidate cases
+
+import re
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+METHODS = ("maxsim", "assignment")
+
+_ISSUE_PREFIX = re.compile(r'^\s*(?:[-*•]|\d+[.)])?\s*\**\s*issue\s*\d*\s*\**\s*:\s*\**\s*', re.IGNORECASE)
+_LIST_PREFIX = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+
+
+def split_issues(issues_text: str) -> List[str]:
+    """Split ``extract_petitioner_issues`` output into individual issues.
+
+    Lines starting with "Issue:" (optionally numbered or bulleted) are the
+    expected format; a plain numbered or bulleted list is accepted too, and
+    anything else is kept as a single issue.
+    """
+    lines = [line.strip() for line in (issues_text or '').splitlines() if line.strip()]
+    issues = [_ISSUE_PREFIX.sub('', line).strip() for line in lines if _ISSUE_PREFIX.match(line)]
+    if not issues:
+        issues = [_LIST_PREFIX.sub('', line).strip() for line in lines if _LIST_PREFIX.match(line)]
+    if not issues and issues_text and issues_text.strip():
+        issues = [issues_text.strip()]
+    return [issue for issue in issues if issue]
+
+
+def _assign(block: np.ndarray) -> np.ndarray:
+    """Best one-to-one query issue -> case issue assignment for a block.
+
+    Returns the matched column per row, -1 where a row is left unmatched
+    because the case has fewer issues than the query.
+    """
+    matched = np.full(block.shape[0], -1)
+    try:
+        from scipy.optimize import linear_sum_assignment
+        rows, cols = linear_sum_assignment(block, maximize=True)
+        matched[rows] = cols
+        return matched
+    except ImportError:
+        pass
+    # Greedy fallback: take the globally best remaining pair each step
+    remaining = block.astype(np.float64).copy()
+    for _ in range(min(block.shape)):
+        row, col = np.unravel_index(np.argmax(remaining), remaining.shape)
+        matched[row] = col
+        remaining[row, :] = -np.inf
+        remaining[:, col] = -np.inf
+    return matched
+
+
+def score_cases(query_vectors: np.ndarray, case_vectors: np.ndarray,
+                case_offsets: Sequence[int], method: str = "maxsim") -> Dict[str, np.ndarray]:
+    """Score every candidate case against the query issues at once.
+
+    ``case_vectors`` holds the unit-normalized issue embeddings of all
+    candidate cases back to back, case ``k`` occupying rows
+    ``case_offsets[k]:case_offsets[k + 1]``. The full query-issue x
+    case-issue similarity matrix is a single matrix product; ``maxsim``
+    takes each query issue's best issue per case with one segmented
+    ``np.maximum.reduceat``, while ``assignment`` matches issues one-to-one.
+
+    Returns ``scores`` (per case mean similarity over query issues),
+    ``similarity`` (query issue x case) and ``matches`` (query issue x case
+    index into ``case_vectors``, -1 if unmatched).
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown matching method: {method}")
+    offsets = np.asarray(case_offsets, dtype=np.int64)
+    starts = offsets[:-1]
+    similarity_matrix = query_vectors @ case_vectors.T
+
+    if method == "maxsim":
+        best = np.maximum.reduceat(similarity_matrix, starts, axis=1)
+        # Column of each maximum: first position in the segment equal to it
+        case_of_column = np.repeat(np.arange(len(starts)), np.diff(offsets))
+        is_best = similarity_matrix == best[:, case_of_column]
+        columns = np.arange(similarity_matrix.shape[1])
+        candidates = np.where(is_best, columns, similarity_matrix.shape[1])
+        matches = np.minimum.reduceat(candidates, starts, axis=1)
+        return {'scores': best.mean(axis=0), 'similarity': best, 'matches': matches}
+
+    best = np.zeros((len(query_vectors), len(starts)), dtype=similarity_matrix.dtype)
+    matches = np.full(best.shape, -1)
+    for case, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        matched = _assign(similarity_matrix[:, start:end])
+        rows = np.nonzero(matched >= 0)[0]
+        best[rows, case] = similarity_matrix[rows, start + matched[rows]]
+        matches[rows, case] = start + matched[rows]
+    # Unmatched query issues count as zero similarity
+    return {'scores': best.mean(axis=0), 'similarity': best, 'matches': matches}
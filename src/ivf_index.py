@@ -0,0 +1,368 @@
+# IVF (inverted file) index: k-means coarse quantizer over stored embeddings
+
+import json
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from quantized_store import pairwise_distances, prepare_vectors, vector_norms
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+DEFAULT_NPROBE = 8
+# Rows per block when assigning vectors to centroids, one block per task
+ASSIGN_BLOCK_ROWS = 8192
+# Retrain once the mean distance to assigned centroids grows by this factor
+DRIFT_THRESHOLD = 1.25
+
+
+def default_nlist(count: int) -> int:
+    """About 4 * sqrt(n) lists, the usual starting point for IVF."""
+    return max(1, min(count, int(4 * math.sqrt(count))))
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, space: str,
+            workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest centroid and distance to it for every row, in parallel blocks.
+
+    NumPy releases the GIL inside the matrix products, so blocks assigned
+    on a thread pool use several cores.
+    """
+    centroid_norms = vector_norms(centroids, space)
+    vector_norms_ = vector_norms(vectors, space) if space == "l2" else None
+
+    def assign_block(start: int) -> Tuple[np.ndarray, np.ndarray]:
+        block = vectors[start:start + ASSIGN_BLOCK_ROWS]
+        dots = block @ centroids.T
+        if space == "l2":
+            distances = centroid_norms[None, :] - 2 * dots + vector_norms_[start:start + len(block), None]
+        else:
+            distances = 1 - dots
+        labels = np.argmin(distances, axis=1)
+        return labels, distances[np.arange(len(block)), labels]
+
+    starts = range(0, len(vectors), ASSIGN_BLOCK_ROWS)
+    if len(starts) == 1:
+        return assign_block(0)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        parts = list(executor.map(assign_block, starts))
+    return np.concatenate([labels for labels, _ in parts]), np.concatenate([d for _, d in parts])
+
+
+def kmeans(vectors: np.ndarray, nlist: int, space: str = "l2", iterations: int = 20,
+           sample_size: Optional[int] = 100000, seed: int = 0,
+           workers: Optional[int] = None) -> np.ndarray:
+    """Train ``nlist`` centroids with Lloyd's algorithm.
+
+    Training runs on a random sample of at most ``sample_size`` rows,
+    starting from randomly chosen rows. Centroids of empty lists are
+    reseeded from the rows farthest from their centroid. In cosine space
+    centroids are re-normalized each step (spherical k-means).
+    """
+    rng = np.random.default_rng(seed)
+    if sample_size and len(vectors) > sample_size:
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for iteration in range(iterations):
+        labels, distances = _assign(vectors, centroids, space, workers)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = np.nonzero(counts == 0)[0]
+        nonempty = counts > 0
+        # Per-list sums as one segmented reduction over rows sorted by list
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        updated = centroids.copy()
+        updated[nonempty] = np.add.reduceat(vectors[order], starts, axis=0) / counts[nonempty, None]
+        if len(empty):
+            updated[empty] = vectors[np.argsort(distances)[-len(empty):]]
+        if space == "cosine":
+            updated = prepare_vectors(updated, space)
+        shift = float(np.abs(updated - centroids).max())
+        centroids = updated
+        if shift < 1e-5:
+            logger.info(f"k-means converged after {iteration + 1} iterations")
+            break
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Embeddings grouped into inverted lists by their nearest k-means centroid.
+
+    Vectors are stored sorted by list, with ``list_offsets`` marking where
+    each list starts, so probing a list is one contiguous slice. A query
+    ranks the centroids, scans only the ``nprobe`` nearest lists with exact
+    float32 distances, and returns the best ``top_k``; ``nprobe`` trades
+    recall for latency independently of Chroma's HNSW settings.
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, norms: np.ndarray,
+                 centroids: np.ndarray, list_offsets: np.ndarray, space: str = "l2",
+                 train_error: float = 0.0):
+        self.ids = ids
+        self.vectors = vectors
+        self.norms = norms
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.space = space
+        # Mean distance to the assigned centroid when trained, for drift checks
+        self.train_error = train_error
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], embeddings, space: str = "l2", nlist: Optional[int] = None,
+              iterations: int = 20, workers: Optional[int] = None) -> "IVFIndex":
+        """Train the coarse quantizer on ``embeddings`` and fill the lists."""
+        vectors = np.ascontiguousarray(prepare_vectors(embeddings, space))
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding row per id")
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+        centroids = kmeans(vectors, nlist, space, iterations, workers=workers)
+        labels, distances = _assign(vectors, centroids, space, workers)
+        return cls._from_assignment(list(ids), vectors, centroids, labels, space, float(distances.mean()))
+
+    @classmethod
+    def _from_assignment(cls, ids: List[str], vectors: np.ndarray, centroids: np.ndarray,
+                         labels: np.ndarray, space: str, train_error: float) -> "IVFIndex":
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=len(centroids))
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        vectors = np.ascontiguousarray(vectors[order])
+        return cls([ids[i] for i in order], vectors, vector_norms(vectors, space).astype(np.float32),
+                   centroids, list_offsets, space, train_error)
+
+    @classmethod
+    def from_collection(cls, collection, nlist: Optional[int] = None,
+                        iterations: int = 20) -> "IVFIndex":
+        """Build an index from every embedding in a Chroma collection."""
+        records = collection.get(include=["embeddings"])
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        embeddings = records['embeddings']
+        if embeddings is None or len(embeddings) == 0:
+            raise ValueError(f"Collection {collection.name} has no embeddings")
+        return cls.build(records['ids'], embeddings, space, nlist, iterations)
+
+    def add(self, ids: Sequence[str], embeddings) -> "IVFIndex":
+        """New index with ``ids`` assigned to the current lists, without retraining.
+
+        Existing ids are replaced. The original index is left untouched, so
+        it can keep serving queries until the caller swaps in the result.
+        """
+        vectors = prepare_vectors(embeddings, self.space)
+        replaced = set(ids)
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in replaced]
+        all_ids = [self.ids[i] for i in keep] + list(ids)
+        all_vectors = np.concatenate([np.asarray(self.vectors[keep], dtype=np.float32), vectors])
+        old_labels = np.repeat(np.arange(self.nlist), np.diff(self.list_offsets))[keep]
+        new_labels, _ = _assign(vectors, self.centroids, self.space)
+        return self._from_assignment(all_ids, all_vectors, self.centroids,
+                                     np.concatenate([old_labels, new_labels]), self.space, self.train_error)
+
+    def remove(self, ids: Sequence[str]) -> "IVFIndex":
+        """New index without ``ids``; the lists and centroids are otherwise unchanged."""
+        removed = set(ids)
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in removed]
+        labels = np.repeat(np.arange(self.nlist), np.diff(self.list_offsets))[keep]
+        return self._from_assignment([self.ids[i] for i in keep], np.asarray(self.vectors[keep], dtype=np.float32),
+                                     self.centroids, labels, self.space, self.train_error)
+
+    def drift(self) -> float:
+        """Current mean distance to assigned centroids relative to training time.
+
+        Values well above 1 mean the data moved away from the centroids
+        (new kinds of cases, or many additions) and the index should be retrained.
+        """
+        if not self.train_error or not len(self.ids):
+            return 1.0
+        labels = np.repeat(np.arange(self.nlist), np.diff(self.list_offsets))
+        dots = np.einsum('ij,ij->i', np.asarray(self.vectors, dtype=np.float32), self.centroids[labels])
+        if self.space == "l2":
+            distances = self.norms - 2 * dots + vector_norms(self.centroids, self.space)[labels]
+        else:
+            distances = 1 - dots
+        return float(distances.mean() / self.train_error)
+
+    def save(self, path: str) -> None:
+        """Write the index to ``path`` (a directory).
+
+        Every file is written under a temporary name and renamed into place,
+        so an index that memory-maps the previous files keeps working.
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            'vectors.npy': np.asarray(self.vectors, dtype=np.float32),
+            'norms.npy': self.norms,
+            'centroids.npy': self.centroids,
+            'list_offsets.npy': self.list_offsets
+        }
+        for name, array in arrays.items():
+            temp_path = os.path.join(path, f"{name}.tmp")
+            with open(temp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(temp_path, os.path.join(path, name))
+        # Metadata last: it names the ids in the order of the files above
+        temp_path = os.path.join(path, 'meta.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'space': self.space,
+                'count': len(self.ids),
+                'nlist': self.nlist,
+                'train_error': self.train_error,
+                'ids': self.ids
+            }, f)
+        os.replace(temp_path, os.path.join(path, 'meta.json'))
+        logger.info(f"Saved IVF index with {len(self.ids)} vectors in {self.nlist} lists to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        """Load an index; vectors are memory-mapped, so only probed lists are paged in."""
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported IVF index version: {meta.get('version')}")
+        return cls(
+            meta['ids'],
+            np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'norms.npy')),
+            np.load(os.path.join(path, 'centroids.npy')),
+            np.load(os.path.join(path, 'list_offsets.npy')),
+            meta['space'],
+            meta.get('train_error', 0.0)
+        )
+
+    def search(self, query, top_k: int = 5, nprobe: int = DEFAULT_NPROBE) -> List[Tuple[str, float]]:
+        """Return ``(id, distance)`` pairs for the nearest ``top_k`` vectors in the probed lists."""
+        if not self.ids:
+            return []
+        query = prepare_vectors(query, self.space).ravel()
+        nprobe = min(max(1, nprobe), self.nlist)
+        centroid_distances = pairwise_distances(query, self.centroids @ query,
+                                                vector_norms(self.centroids, self.space), self.space)
+        if nprobe < self.nlist:
+            probed = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        else:
+            probed = np.arange(self.nlist)
+        probed.sort()  # sequential reads from the memory-mapped vectors
+
+        rows = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in probed])
+        if not len(rows):
+            return []
+        candidates = np.asarray(self.vectors[rows], dtype=np.float32)
+        distances = pairwise_distances(query, candidates @ query, self.norms[rows], self.space)
+        top_k = min(top_k, len(rows))
+        best = np.argpartition(distances, top_k - 1)[:top_k]
+        best = best[np.argsort(distances[best])]
+        return [(self.ids[rows[i]], float(distances[i])) for i in best]
+
+
+class IVFMaintainer:
+    """Background job keeping an IVF index in step with the stored embeddings.
+
+    Every ``interval`` seconds, newly added and re-embedded (upserted)
+    documents are assigned to the existing lists and deleted ones are
+    dropped from theirs. When ``drift`` exceeds ``threshold``, or the number
+    of lists falls well behind the corpus size, the coarse quantizer is
+    retrained from scratch. Each refreshed index is saved to ``path`` and
+    handed to ``on_update`` while the previous one keeps serving queries.
+
+    ``load_records`` returns the current embeddings as a Chroma ``get``
+    result; it is called on every refresh, so a reader that switches to a
+    new index generation (or adds shards) is followed without rebinding.
+    """
+
+    def __init__(self, load_records: Callable[[], Dict], path: str, on_update, space: str = "l2",
+                 interval: float = 300.0, threshold: float = DRIFT_THRESHOLD, iterations: int = 20):
+        self.load_records = load_records
+        self.space = space
+        self.path = path
+        self.on_update = on_update
+        self.interval = interval
+        self.threshold = threshold
+        self.iterations = iterations
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self, index: Optional[IVFIndex]) -> IVFIndex:
+        """Bring ``index`` up to date with the stored embeddings; returns the index to serve."""
+        records = self.load_records()
+        if records['embeddings'] is None or len(records['ids']) == 0:
+            return index
+        if index is None:
+            return self._retrain(records, "no index yet")
+
+        fresh, changed, removed = self.diff(index, records)
+        stale = fresh + changed
+        if stale:
+            index = index.add([records['ids'][i] for i in stale],
+                              np.asarray([records['embeddings'][i] for i in stale], dtype=np.float32))
+        if removed:
+            index = index.remove(removed)
+        drift = index.drift()
+        if drift > self.threshold:
+            return self._retrain(records, f"drift {drift:.2f}")
+        if index.nlist < default_nlist(len(records['ids'])) / 2:
+            return self._retrain(records, f"{len(records['ids'])} vectors for {index.nlist} lists")
+        if stale or removed:
+            index.save(self.path)
+            logger.info(f"IVF index: {len(fresh)} added, {len(changed)} re-embedded, "
+                        f"{len(removed)} removed (drift {drift:.2f})")
+        return index
+
+    @staticmethod
+    def diff(index: IVFIndex, records) -> Tuple[List[int], List[int], List[str]]:
+        """Rows of ``records`` missing from ``index``, rows whose embedding changed, and ids deleted.
+
+        Stored vectors are compared with the collection's current ones, so
+        an upsert that re-embedded a document is detected even though its
+        id is unchanged.
+        """
+        position = {doc_id: row for row, doc_id in enumerate(index.ids)}
+        current = set(records['ids'])
+        fresh = [i for i, doc_id in enumerate(records['ids']) if doc_id not in position]
+        common = [i for i, doc_id in enumerate(records['ids']) if doc_id in position]
+        changed = []
+        if common:
+            vectors = prepare_vectors(np.asarray([records['embeddings'][i] for i in common], dtype=np.float32),
+                                      index.space)
+            stored = np.asarray(index.vectors[[position[records['ids'][i]] for i in common]], dtype=np.float32)
+            differs = np.abs(vectors - stored).max(axis=1) > 1e-6
+            changed = [common[j] for j in np.nonzero(differs)[0]]
+        removed = [doc_id for doc_id in index.ids if doc_id not in current]
+        return fresh, changed, removed
+
+    def _retrain(self, records, reason: str) -> IVFIndex:
+        logger.info(f"Retraining IVF index: {reason}")
+        index = IVFIndex.build(records['ids'], records['embeddings'], self.space, iterations=self.iterations)
+        index.save(self.path)
+        return index
+
+    def _run(self, index: Optional[IVFIndex]) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                updated = self.refresh(index)
+                if updated is not index:
+                    index = updated
+                    self.on_update(index)
+            except Exception as e:
+                logger.error(f"IVF maintenance failed: {str(e)}")
+
+    def start(self, index: Optional[IVFIndex]) -> None:
+        self._thread = threading.Thread(target=self._run, args=(index,), name="ivf-maintainer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop maintaining, waiting for a refresh in progress to finish."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
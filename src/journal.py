@@ -0,0 +1,154 @@
+# Durable build journal with a dead-letter queue for failed documents
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.path.join("data", "build_journal.db")
+RESULTS_PATH = os.path.join("data", "results.jsonl")
+
+# Ingestion stages in order; a document's ``stage`` is the last one completed
+STAGES = ("pending", "extracted", "issues_extracted", "embedded", "written")
+
+
+class BuildJournal:
+    """SQLite write-ahead journal of per-document ingestion progress.
+
+    Every stage transition is committed before the next stage starts, so a
+    crashed build resumes each document from its last completed stage
+    instead of starting over. Documents that raise are dead-lettered with
+    their error and left alone by ``build`` until ``retry-failed``.
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                path TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                sha256 TEXT,
+                stage TEXT NOT NULL DEFAULT 'pending',
+                failed INTEGER NOT NULL DEFAULT 0,
+                failed_stage TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                issues TEXT,
+                embedding TEXT,
+                updated_at TEXT
+            )
+        """)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params=()) -> List[sqlite3.Row]:
+        # Rows are fetched under the lock; the connection is shared between threads
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _fetchone(self, sql: str, params=()) -> Optional[sqlite3.Row]:
+        rows = self._execute(sql, params)
+        return rows[0] if rows else None
+
+    def register(self, path: str, sha256: Optional[str] = None) -> None:
+        """Track ``path``; a changed content hash restarts it from scratch."""
+        record = self.get(path)
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        if record is None:
+            self._execute(
+                "INSERT INTO documents (path, filename, sha256, updated_at) VALUES (?, ?, ?, ?)",
+                (path, os.path.basename(path), sha256, now)
+            )
+        elif sha256 and record['sha256'] != sha256:
+            logger.info(f"{record['filename']} changed since last build; reprocessing")
+            self._execute(
+                """UPDATE documents SET sha256 = ?, stage = 'pending', failed = 0, failed_stage = NULL,
+                   error = NULL, attempts = 0, issues = NULL, embedding = NULL, updated_at = ?
+                   WHERE path = ?""",
+                (sha256, now, path)
+            )
+
+    def get(self, path: str) -> Optional[Dict]:
+        row = self._fetchone("SELECT * FROM documents WHERE path = ?", (path,))
+        if row is None:
+            return None
+        record = dict(row)
+        record['embedding'] = json.loads(record['embedding']) if record['embedding'] else None
+        return record
+
+    def advance(self, path: str, stage: str, issues: Optional[str] = None,
+                embedding: Optional[List[float]] = None) -> None:
+        """Mark ``stage`` complete for ``path``, storing any stage output."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        self._execute(
+            """UPDATE documents SET stage = ?, failed = 0, failed_stage = NULL, error = NULL,
+               issues = COALESCE(?, issues), embedding = COALESCE(?, embedding), updated_at = ?
+               WHERE path = ?""",
+            (stage, issues, json.dumps(embedding) if embedding is not None else None,
+             time.strftime('%Y-%m-%d %H:%M:%S'), path)
+        )
+
+    def fail(self, path: str, stage: str, error: str) -> None:
+        """Dead-letter ``path`` after an error while running ``stage``."""
+        self._execute(
+            """UPDATE documents SET failed = 1, failed_stage = ?, error = ?, attempts = attempts + 1,
+               updated_at = ? WHERE path = ?""",
+            (stage, error, time.strftime('%Y-%m-%d %H:%M:%S'), path)
+        )
+
+    def release(self, path: str) -> None:
+        """Take ``path`` out of the dead-letter queue so it can be retried."""
+        self._execute("UPDATE documents SET failed = 0 WHERE path = ?", (path,))
+
+    def pending(self) -> List[Dict]:
+        """Documents not yet written and not dead-lettered."""
+        rows = self._execute(
+            "SELECT path FROM documents WHERE stage != 'written' AND failed = 0 ORDER BY filename"
+        )
+        return [self.get(row['path']) for row in rows]
+
+    def failed(self) -> List[Dict]:
+        """Dead-lettered documents with their error reasons."""
+        rows = self._execute("SELECT path FROM documents WHERE failed = 1 ORDER BY filename")
+        return [self.get(row['path']) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of documents per stage, plus ``failed``."""
+        counts = {stage: 0 for stage in STAGES}
+        for row in self._execute(
+                "SELECT stage, COUNT(*) AS n FROM documents WHERE failed = 0 GROUP BY stage"):
+            counts[row['stage']] = row['n']
+        counts['failed'] = self._fetchone(
+            "SELECT COUNT(*) AS n FROM documents WHERE failed = 1")['n']
+        return counts
+
+
+class ResultsWriter:
+    """Appends one JSON line per processed document to ``data/results.jsonl``."""
+
+    def __init__(self, path: str = RESULTS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+
+    def write(self, result: Dict) -> None:
+        line = json.dumps(result, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
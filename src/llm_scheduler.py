@@ -0,0 +1,250 @@
+# Priority scheduling of LLM calls between interactive and batch work
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Touched while interactive work is queued or running, so batch work in
+# other processes (a nightly build next to the app) backs off too
+ACTIVITY_PATH = os.path.join("data", "llm_interactive.heartbeat")
+HEARTBEAT_SECONDS = 1.0
+HEARTBEAT_TTL = 5.0
+SHARE_WINDOW = 60.0
+
+
+class PriorityClass:
+    """Dispatch settings for one class of LLM work.
+
+    Lower ``rank`` is served first. ``concurrency`` caps the calls of this
+    class in flight, ``min_share`` is the fraction of recent dispatches the
+    class is guaranteed while it has work queued, and an item that has
+    waited ``max_wait`` seconds is dispatched ahead of higher ranks.
+    """
+
+    def __init__(self, name: str, rank: int, concurrency: int, min_share: float = 0.0,
+                 max_wait: Optional[float] = None):
+        self.name = name
+        self.rank = rank
+        self.concurrency = max(1, concurrency)
+        self.min_share = min_share
+        self.max_wait = max_wait
+
+
+def default_classes(max_concurrency: int, batch_share: float = 0.2,
+                    batch_max_wait: float = 30.0) -> Tuple[PriorityClass, ...]:
+    """Interactive work may use every slot; batch work leaves some free for it."""
+    return (
+        PriorityClass(INTERACTIVE, 0, concurrency=max_concurrency),
+        PriorityClass(BATCH, 1, concurrency=max(1, max_concurrency - max(1, max_concurrency // 4)),
+                      min_share=batch_share, max_wait=batch_max_wait),
+    )
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "enqueued")
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    """Local scheduler for LLM calls with priority classes and quota shares.
+
+    Calls are queued per class and run on ``max_concurrency`` worker
+    threads. Interactive items are dispatched before any queued batch item,
+    but batch work keeps its ``min_share`` of recent dispatches and its
+    oldest item jumps the line after ``max_wait`` seconds, so a stream of
+    uploads cannot starve a build. ``requests_per_minute`` paces all
+    dispatches to the API quota. While interactive work is active in any
+    other process sharing ``activity_path``, batch concurrency here drops
+    to ``contended_batch_concurrency``.
+
+    The scheduler only sees callables, so it runs the same against a fake
+    backend (see ``benchmarks.py llm-scheduler``).
+    """
+
+    def __init__(self, max_concurrency: int = 8, classes: Optional[Iterable[PriorityClass]] = None,
+                 requests_per_minute: Optional[float] = None, activity_path: Optional[str] = ACTIVITY_PATH,
+                 contended_batch_concurrency: int = 1, share_window: float = SHARE_WINDOW):
+        self.max_concurrency = max(1, max_concurrency)
+        self.classes: Dict[str, PriorityClass] = {
+            cls.name: cls for cls in (classes or default_classes(self.max_concurrency))}
+        self.requests_per_minute = requests_per_minute
+        self.activity_path = activity_path
+        self.contended_batch_concurrency = max(1, contended_batch_concurrency)
+        self.share_window = share_window
+
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_Job]] = {name: deque() for name in self.classes}
+        self._in_flight = {name: 0 for name in self.classes}
+        self._dispatched = {name: 0 for name in self.classes}
+        self._recent: Deque[Tuple[float, str]] = deque()
+        self._waits: Dict[str, Deque[float]] = {name: deque(maxlen=1000) for name in self.classes}
+        self._next_start = 0.0
+        self._workers: List[threading.Thread] = []
+        self._closed = False
+        self._heartbeat_at = 0.0
+        self._contended_checked = 0.0
+        self._contended = False
+
+    def submit(self, fn: Callable, *args, priority: str = BATCH, **kwargs) -> Future:
+        """Queue ``fn(*args, **kwargs)`` under ``priority`` and return its future."""
+        if priority not in self.classes:
+            raise ValueError(f"Unknown priority class: {priority}")
+        job = _Job(fn, args, kwargs)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("LLM scheduler is shut down")
+            self._queues[priority].append(job)
+            self._start_workers()
+            self._cond.notify()
+        if priority == INTERACTIVE:
+            self._heartbeat()
+        return job.future
+
+    def call(self, fn: Callable, *args, priority: str = BATCH, **kwargs):
+        """Run ``fn`` through the scheduler and wait for its result."""
+        return self.submit(fn, *args, priority=priority, **kwargs).result()
+
+    def generate(self, model, prompt: str, priority: str = BATCH):
+        """``model.generate_content(prompt)`` scheduled under ``priority``."""
+        return self.call(model.generate_content, prompt, priority=priority)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Queue depth, calls in flight, dispatch counts and queueing delay per class."""
+        with self._cond:
+            stats = {}
+            for name in self.classes:
+                waits = sorted(self._waits[name])
+                stats[name] = {
+                    'queued': len(self._queues[name]),
+                    'in_flight': self._in_flight[name],
+                    'dispatched': self._dispatched[name],
+                    'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+                    'wait_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                }
+            return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work; queued items still run."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def _start_workers(self) -> None:
+        # Caller holds ``self._cond``
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._work, daemon=True,
+                                      name=f"llm-scheduler-{len(self._workers)}")
+            self._workers.append(worker)
+            worker.start()
+
+    def _heartbeat(self) -> None:
+        now = time.time()
+        if not self.activity_path or now - self._heartbeat_at < HEARTBEAT_SECONDS:
+            return
+        self._heartbeat_at = now
+        try:
+            os.makedirs(os.path.dirname(self.activity_path) or '.', exist_ok=True)
+            with open(self.activity_path, 'a'):
+                os.utime(self.activity_path, (now, now))
+        except OSError as e:
+            logger.warning(f"Could not record interactive LLM activity: {str(e)}")
+
+    def _interactive_elsewhere(self, now: float) -> bool:
+        # Caller holds ``self._cond``; the heartbeat file is checked at most twice a second.
+        # In-process interactive work is already served first, so only
+        # heartbeats written by other processes count.
+        if not self.activity_path:
+            return False
+        if now - self._contended_checked >= 0.5:
+            self._contended_checked = now
+            try:
+                mtime = os.path.getmtime(self.activity_path)
+                self._contended = time.time() - mtime < HEARTBEAT_TTL and abs(mtime - self._heartbeat_at) > 0.01
+            except OSError:
+                self._contended = False
+        return self._contended
+
+    def _limit(self, cls: PriorityClass, now: float) -> int:
+        if cls.name == BATCH and self._interactive_elsewhere(now):
+            return min(cls.concurrency, self.contended_batch_concurrency)
+        return cls.concurrency
+
+    def _share(self, name: str, now: float) -> Optional[float]:
+        while self._recent and now - self._recent[0][0] > self.share_window:
+            self._recent.popleft()
+        if not self._recent:
+            return None
+        return sum(1 for _, dispatched in self._recent if dispatched == name) / len(self._recent)
+
+    def _pick(self, now: float) -> Tuple[Optional[str], Optional[float]]:
+        """Class to dispatch from next, or None and how long to wait before retrying."""
+        if sum(self._in_flight.values()) >= self.max_concurrency:
+            return None, None
+        eligible = [cls for name, cls in self.classes.items()
+                    if self._queues[name] and self._in_flight[name] < self._limit(cls, now)]
+        if not eligible:
+            # Batch work held back by another process's interactive traffic rechecks later
+            return None, 0.5 if any(self._queues.values()) else None
+        if self.requests_per_minute and now < self._next_start:
+            return None, self._next_start - now
+
+        by_rank = sorted(eligible, key=lambda cls: cls.rank)
+        starving = [cls for cls in by_rank
+                    if cls.max_wait is not None and now - self._queues[cls.name][0].enqueued >= cls.max_wait]
+        if starving:
+            return starving[0].name, None
+        if len(by_rank) > 1:
+            for cls in by_rank[1:]:
+                share = self._share(cls.name, now)
+                if cls.min_share and share is not None and share < cls.min_share:
+                    return cls.name, None
+        return by_rank[0].name, None
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    name, delay = self._pick(now)
+                    if name is not None:
+                        break
+                    if self._closed and not any(self._queues.values()):
+                        return
+                    self._cond.wait(delay)
+                job = self._queues[name].popleft()
+                self._in_flight[name] += 1
+                self._dispatched[name] += 1
+                self._recent.append((now, name))
+                self._waits[name].append(now - job.enqueued)
+                if self.requests_per_minute:
+                    self._next_start = max(now, self._next_start) + 60.0 / self.requests_per_minute
+
+            if name == INTERACTIVE:
+                self._heartbeat()
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+                except BaseException as e:
+                    job.future.set_exception(e)
+
+            with self._cond:
+                self._in_flight[name] -= 1
+                self._cond.notify_all()
@@ -55,67 +55,441 @@
 # RAG -src/main.py
 
 import os
+import sys
 from dotenv import load_dotenv
-from rag_processor import LegalDocumentRAG
+# Only lightweight modules here; model, vector store and PDF libraries are
+# imported on first use so usage and cheap subcommands start instantly
+import resources
+from rag_processor import LegalDocumentRAG, IVF_INDEX_PATH, QUANTIZED_INDEX_PATH, SNAPSHOT_PATH
+from triage import REPORT_PATH, file_sha256, valid_files, validate_directory
+from journal import BuildJournal, ResultsWriter
+from citations import CitationIndex, index_directory, normalize_citation
+from generations import default_generations
 import logging
-from tqdm import tqdm
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar('T')
 
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def build_rag_database(pdf_dir: str, api_key: str):
-    """Build RAG database from PDFs."""
-    rag = LegalDocumentRAG(api_key)
+def build_rag_database(pdf_dir: str, api_key: str, sharding: Optional[str] = None,
+                       workers: int = 1, validate: bool = True, in_place: bool = False):
+    """Build RAG database from PDFs.
+
+    PDFs are triaged first so broken, encrypted, empty or scanned files are
+    skipped before any extraction or LLM call. Progress is journaled per
+    document, so rerunning after a crash resumes where it stopped; failed
+    documents are dead-lettered for ``retry-failed``. With sharding, each
+    shard's files are ingested by their own worker so shards are written
+    independently and in parallel. The embedding model loads on a
+    background thread while PDFs are triaged and their issues extracted.
+
+    Unless ``in_place`` is set, the build writes a new index generation
+    seeded with the live index and only publishes it once it validates, so
+    the app and other readers never query a half-built index.
+    """
+    from tqdm import tqdm
+
+    resources.preload_embedding_model()
+    generations = default_generations()
+    generation = None if in_place else generations.create()
+    rag = LegalDocumentRAG(api_key, sharding=sharding,
+                           chroma_path=generations.path(generation) if generation else None)
+    seeded_count = rag.document_count() if generation else 0
+    journal = BuildJournal()
+    results = ResultsWriter()
     
     # Get list of PDFs
-    pdf_files = [f for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
-    logger.info(f"Found {len(pdf_files)} PDF files")
+    if validate:
+        triaged = validate_directory(pdf_dir)
+        hashes = {os.path.basename(path): record['sha256'] for path, record in triaged.items()
+                  if record['status'] == 'valid'}
+    else:
+        hashes = {f: file_sha256(os.path.join(pdf_dir, f))
+                  for f in os.listdir(pdf_dir) if f.endswith('.pdf')}
+    for pdf_file, sha256 in hashes.items():
+        journal.register(os.path.join(pdf_dir, pdf_file), sha256)
+    pdf_files = [record['filename'] for record in journal.pending() if record['filename'] in hashes
+                 and record['path'] == os.path.join(pdf_dir, record['filename'])]
+    logger.info(f"Found {len(hashes)} PDF files, {len(pdf_files)} left to process")
+
+    # One worker per shard, keyed by the shard add_to_rag will write to
+    groups = defaultdict(list)
+    for pdf_file in pdf_files:
+        try:
+            key = rag.shard_for_file(os.path.join(pdf_dir, pdf_file))
+        except Exception as e:
+            # add_to_rag dead-letters the file; keep it out of the other shards' workers
+            logger.error(f"Could not read the caption of {pdf_file}: {str(e)}")
+            key = pdf_file
+        groups[key].append(pdf_file)
     
     # Process each PDF
-    for pdf_file in tqdm(pdf_files, desc="Processing PDFs"):
+    with tqdm(total=len(pdf_files), desc="Processing PDFs") as progress:
+        def ingest(group: List[str]) -> None:
+            for pdf_file in group:
+                try:
+                    pdf_path = os.path.join(pdf_dir, pdf_file)
+                    rag.add_to_rag(pdf_path, journal=journal, results=results)
+                except Exception as e:
+                    logger.error(f"Failed to process {pdf_file}: {str(e)}")
+                progress.update(1)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(ingest, groups.values()))
+    rag.save_citations()
+
+    counts = journal.counts()
+    logger.info(f"Build finished: {counts['written']} written, {counts['failed']} failed")
+    if counts['failed']:
+        logger.warning("Run 'python main.py retry-failed' to reprocess failed documents")
+    if generation:
+        written = [os.path.join(pdf_dir, pdf_file) for pdf_file in pdf_files
+                   if (journal.get(os.path.join(pdf_dir, pdf_file)) or {}).get('stage') == 'written']
+        publish_generation(generation, rag, journal, written, seeded_count)
+
+def publish_generation(generation: str, rag: LegalDocumentRAG, journal: BuildJournal,
+                       written: List[str], seeded_count: int) -> bool:
+    """Validate a freshly built generation and publish it, or leave the live index alone.
+
+    When the generation is rejected, the documents written into it are
+    moved back to the ``embedded`` stage so the next build rewrites them
+    (from their journaled embeddings, without new LLM calls).
+    """
+    generations = default_generations()
+    problems = generations.validate(generation, rag.document_collections(),
+                                    min_documents=max(1, seeded_count))
+    if problems:
+        for path in written:
+            journal.advance(path, 'embedded')
+        logger.error(f"Index generation {generation} not published: {'; '.join(problems)}")
+        return False
+    generations.publish(generation)
+    generations.collect_garbage()
+    return True
+
+def run_in_generation(api_key: str, operation: Callable[[LegalDocumentRAG], T],
+                      sharding: Optional[str] = None, in_place: bool = False) -> T:
+    """Apply ``operation`` to a new generation seeded with the live index, then publish it.
+
+    For maintenance commands that rewrite collections (migration, import,
+    issue splitting): readers keep the live index until the changed copy
+    validates. With ``in_place`` the live index is changed directly.
+    """
+    if in_place:
+        return operation(LegalDocumentRAG(api_key, sharding=sharding))
+    generations = default_generations()
+    generation = generations.create()
+    rag = LegalDocumentRAG(api_key, sharding=sharding, chroma_path=generations.path(generation))
+    try:
+        seeded_count = rag.document_count()
+        result = operation(rag)
+    except Exception:
+        resources.release_chroma_client(rag.index_path, delay=0)
+        generations.discard(generation)
+        raise
+    if not publish_generation(generation, rag, BuildJournal(), [], seeded_count):
+        raise RuntimeError(f"Index generation {generation} was not published; the live index is unchanged")
+    return result
+
+def list_generations() -> None:
+    """Print the index generations and which one is live."""
+    generations = default_generations()
+    current = generations.current()
+    names = generations.generations()
+    if not names:
+        print(f"No index generations yet; readers use {generations.legacy_path}")
+        return
+    for name in names:
+        manifest = generations.manifest(name)
+        marker = "*" if name == current else " "
+        print(f"{marker} {name}  {manifest.get('status', 'unknown'):10} "
+              f"documents={manifest.get('documents', '?')}  created {manifest.get('created_at', '?')}")
+
+def retry_failed_documents(api_key: str, sharding: Optional[str] = None, in_place: bool = False):
+    """Reprocess only the dead-lettered documents from the build journal.
+
+    Like ``build``, this writes a new index generation and publishes it
+    once it validates, unless ``in_place`` is set.
+    """
+    journal = BuildJournal()
+    failed = journal.failed()
+    if not failed:
+        print("No failed documents")
+        return
+
+    generations = default_generations()
+    generation = None if in_place else generations.create()
+    rag = LegalDocumentRAG(api_key, sharding=sharding,
+                           chroma_path=generations.path(generation) if generation else None)
+    seeded_count = rag.document_count() if generation else 0
+    results = ResultsWriter()
+    recovered = 0
+    recovered_paths = []
+    for record in failed:
+        print(f"Retrying {record['filename']} (failed at {record['failed_stage']} after "
+              f"{record['attempts']} attempt(s): {record['error']})")
+        if not os.path.exists(record['path']):
+            print("  File no longer exists; skipping")
+            continue
+        journal.release(record['path'])
         try:
-            pdf_path = os.path.join(pdf_dir, pdf_file)
-            rag.add_to_rag(pdf_path)
+            rag.add_to_rag(record['path'], journal=journal, results=results)
+            recovered += 1
+            recovered_paths.append(record['path'])
         except Exception as e:
-            logger.error(f"Failed to process {pdf_file}: {str(e)}")
+            print(f"  Failed again: {str(e)}")
+    rag.save_citations()
+    print(f"Recovered {recovered}/{len(failed)} documents")
+    if generation:
+        if recovered_paths:
+            publish_generation(generation, rag, journal, recovered_paths, seeded_count)
+        else:
+            resources.release_chroma_client(rag.index_path, delay=0)
+            generations.discard(generation)
+
+def watch_directory(pdf_dir: str, api_key: str, sharding: Optional[str] = None, workers: int = 2,
+                    interval: float = 1.0, settle: float = 2.0,
+                    ivf_retrain_interval: Optional[float] = None, in_place: bool = False,
+                    publish_interval: float = 60.0):
+    """Ingest new and changed PDFs in ``pdf_dir`` until interrupted.
+
+    Unless ``in_place`` is set, documents are written into a staged index
+    generation that is validated and published every ``publish_interval``
+    seconds, after which the watcher carries on in a fresh generation
+    seeded from it. With ``ivf_retrain_interval`` the IVF index is also
+    kept current with the new documents and retrained when they shift
+    the distribution.
+    """
+    from watcher import FolderWatcher
+
+    resources.preload_embedding_model()
+    generations = default_generations()
+    journal = BuildJournal()
+    staged = {'generation': None if in_place else generations.create()}
+    rag = LegalDocumentRAG(api_key, sharding=sharding,
+                           chroma_path=generations.path(staged['generation']) if staged['generation'] else None,
+                           ivf_index=IVF_INDEX_PATH if ivf_retrain_interval else None,
+                           ivf_retrain_interval=ivf_retrain_interval)
+    staged['seeded_count'] = rag.document_count()
+
+    def publish(written: List[str]) -> bool:
+        rag.save_citations()
+        generation = staged['generation']
+        published = publish_generation(generation, rag, journal, written, staged['seeded_count'])
+        # Carry on in a generation seeded from whatever is live now
+        staged['generation'] = generations.create()
+        rag.switch_index(generations.path(staged['generation']))
+        staged['seeded_count'] = rag.document_count()
+        if not published:
+            generations.discard(generation)
+        return published
 
-def find_similar_documents(query_pdf: str, api_key: str):
-    """Find similar documents for a query PDF."""
-    rag = LegalDocumentRAG(api_key)
+    watcher = FolderWatcher(pdf_dir, rag, journal, ResultsWriter(), workers=workers,
+                            interval=interval, settle=settle,
+                            publish=publish if staged['generation'] else None,
+                            publish_interval=publish_interval)
+    try:
+        watcher.run()
+    finally:
+        if rag.ivf_maintainer is not None:
+            rag.ivf_maintainer.stop()
+        # The last publish already happened; the generation opened after it is empty
+        generation = staged['generation']
+        if generation and generation != generations.current():
+            resources.release_chroma_client(rag.index_path, delay=0)
+            generations.discard(generation)
+
+def find_similar_documents(query_pdf: str, api_key: str, quantized: bool = False,
+                           snapshot: Optional[str] = None, sharding: Optional[str] = None,
+                           where: Optional[Dict] = None, rerank_candidates: int = 0,
+                           rerank_budget: float = 0.5, ivf: bool = False, nprobe: int = 8,
+                           issue_matching: Optional[str] = None):
+    """Find similar documents for a query PDF.
+
+    ``issue_matching`` ("maxsim" or "assignment") ranks by issue-to-issue
+    matches instead of searching the selected whole-document index.
+    """
+    rag = LegalDocumentRAG(api_key, quantized_index=QUANTIZED_INDEX_PATH if quantized else None,
+                           snapshot=snapshot, sharding=sharding,
+                           ivf_index=IVF_INDEX_PATH if ivf else None, nprobe=nprobe,
+                           issue_matching=issue_matching,
+                           rerank_candidates=rerank_candidates, rerank_budget=rerank_budget)
     
-    similar_docs = rag.find_similar(query_pdf)
+    similar_docs = rag.find_similar(query_pdf, where=where)
     
     print("\nSimilar Documents:")
     for doc in similar_docs:
         print(f"\nFilename: {doc['filename']}")
         print(f"Similarity Score: {doc['similarity_score']}%")
+        for match in doc.get('matches', []):
+            print(f"  {match['score']:.1f}%  {match['query_issue']}  <->  {match['matched_issue']}")
 
-def main():
-    # Load environment variables
-    load_dotenv()
-    api_key = os.getenv('GOOGLE_API_KEY')
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+def find_citing_documents(citations: List[str], match_all: bool = True):
+    """Print the decisions citing all (or any) of ``citations``."""
+    index = CitationIndex()
+    start = time.perf_counter()
+    documents = index.search(citations, match_all)
+    elapsed = (time.perf_counter() - start) * 1000
+    query = (" AND " if match_all else " OR ").join(normalize_citation(c) for c in citations)
+    print(f"\n{len(documents)} decision(s) citing {query} ({elapsed:.3f}ms):")
+    for filename in documents:
+        print(f"  {filename}")
+
+def option_value(options: List[str], flag: str, default: Optional[str] = None) -> Optional[str]:
+    """Value following ``flag`` in ``options``; ``default`` if absent or without a value."""
+    if flag not in options:
+        return default
+    position = options.index(flag) + 1
+    if position < len(options) and not options[position].startswith("--"):
+        return options[position]
+    return default
 
-    import sys
+def metadata_filter(options: List[str]) -> Optional[Dict]:
+    """Build a Chroma ``where`` filter from ``--city`` and ``--year`` options."""
+    clauses = []
+    if "--city" in options:
+        clauses.append({"city": option_value(options, "--city")})
+    if "--year" in options:
+        clauses.append({"year": int(option_value(options, "--year"))})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def main():
     if len(sys.argv) < 2:
         print("Usage:")
-        print("  Build database: python main.py build")
-        print("  Find similar: python main.py find path/to/query.pdf")
+        print("  Validate PDFs: python main.py validate [--workers N]")
+        print("  Build database: python main.py build [--shard city_year|hash] [--workers N]")
+        print("                  [--skip-validation] [--in-place]")
+        print("  List index generations: python main.py generations [--publish NAME] [--discard NAME] [--gc]")
+        print("  Retry dead-lettered documents: python main.py retry-failed [--in-place]")
+        print("  Ingest PDFs as they arrive: python main.py watch [--workers N] [--interval SECONDS]")
+        print("                              [--settle SECONDS] [--shard city_year|hash]")
+        print("                              [--ivf-retrain SECONDS] [--publish-every SECONDS]")
+        print("                              [--in-place]")
+        print("  Find similar: python main.py find path/to/query.pdf [--quantized | --snapshot [file]")
+        print("                | --ivf [--nprobe N] | --match-issues [maxsim|assignment]]")
+        print("                [--shard city_year|hash] [--city NAME] [--year YYYY]")
+        print("                [--rerank N] [--rerank-budget SECONDS]")
+        print("  Build int8 index: python main.py quantize")
+        print("  Train IVF index: python main.py ivf [--nlist N] [--iterations N]")
+        print("  Export ONNX embedding model: python main.py export-onnx [--dir DIR] [--quantize]")
+        print("  Migrate chroma_db to cosine space: python main.py migrate-cosine [--in-place]")
+        print("  Store per-issue vectors for indexed cases: python main.py split-issues [--in-place]")
+        print("  Decisions citing sections/cases: python main.py citations '§1707(a)' [C23240003 ...] [--any]")
+        print("  Index citations of existing PDFs: python main.py index-citations")
+        print(f"  Export index: python main.py export [file]  (default {SNAPSHOT_PATH})")
+        print(f"  Import index: python main.py import [file] [--in-place]  (default {SNAPSHOT_PATH})")
         return
 
     command = sys.argv[1]
+    options = sys.argv[2:]
+    sharding = option_value(options, "--shard", "city_year") if "--shard" in options else None
+
+    if command == "validate":
+        workers = option_value(options, "--workers")
+        results = validate_directory("data/pdfs", workers=int(workers) if workers else None)
+        print(f"{len(valid_files(results))}/{len(results)} PDFs valid; report written to {REPORT_PATH}")
+        return
+    if command == "citations":
+        citations = [option for option in options if not option.startswith("--")]
+        if not citations:
+            print("Please provide one or more citations, e.g. '§1707(a)' or C23240003")
+            return
+        find_citing_documents(citations, match_all="--any" not in options)
+        return
+    if command == "generations":
+        generations = default_generations()
+        if "--publish" in options:
+            generations.publish(option_value(options, "--publish"))
+        if "--discard" in options:
+            generations.discard(option_value(options, "--discard"))
+        if "--gc" in options:
+            removed = generations.collect_garbage()
+            print(f"Removed {len(removed)} old generation(s)")
+        list_generations()
+        return
+    if command == "export-onnx":
+        from embedding_backends import ONNX_MODEL_DIR, export_onnx, quantize_onnx
+        model_dir = option_value(options, "--dir", ONNX_MODEL_DIR)
+        model_path = export_onnx(resources.EMBEDDING_MODEL_NAME, model_dir)
+        if "--quantize" in options:
+            model_path = quantize_onnx(model_path)
+        print(f"Exported embedding model to {model_path}; set EMBEDDING_BACKEND=onnx to use it")
+        return
+
+    # Load environment variables
+    load_dotenv()
+    api_key = os.getenv('GOOGLE_API_KEY')
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables")
     
     if command == "build":
         pdf_dir = "data/pdfs"
-        build_rag_database(pdf_dir, api_key)
+        workers = int(option_value(options, "--workers", "1"))
+        build_rag_database(pdf_dir, api_key, sharding=sharding, workers=workers,
+                           validate="--skip-validation" not in options,
+                           in_place="--in-place" in options)
+    elif command == "watch":
+        watch_directory("data/pdfs", api_key, sharding=sharding,
+                        workers=int(option_value(options, "--workers", "2")),
+                        interval=float(option_value(options, "--interval", "1.0")),
+                        settle=float(option_value(options, "--settle", "2.0")),
+                        ivf_retrain_interval=float(option_value(options, "--ivf-retrain", "300"))
+                        if "--ivf-retrain" in options else None,
+                        in_place="--in-place" in options,
+                        publish_interval=float(option_value(options, "--publish-every", "60")))
+    elif command == "retry-failed":
+        retry_failed_documents(api_key, sharding=sharding, in_place="--in-place" in options)
     elif command == "find":
         if len(sys.argv) < 3:
             print("Please provide path to query PDF")
             return
         query_pdf = sys.argv[2]
-        find_similar_documents(query_pdf, api_key)
+        snapshot = option_value(options, "--snapshot", SNAPSHOT_PATH) if "--snapshot" in options else None
+        find_similar_documents(query_pdf, api_key, quantized="--quantized" in options,
+                               snapshot=snapshot, sharding=sharding,
+                               where=metadata_filter(options),
+                               rerank_candidates=int(option_value(options, "--rerank", "0")),
+                               rerank_budget=float(option_value(options, "--rerank-budget", "0.5")),
+                               ivf="--ivf" in options,
+                               nprobe=int(option_value(options, "--nprobe", "8")),
+                               issue_matching=option_value(options, "--match-issues", "maxsim")
+                               if "--match-issues" in options else None)
+    elif command == "quantize":
+        LegalDocumentRAG(api_key, sharding=sharding).build_quantized_index(QUANTIZED_INDEX_PATH)
+    elif command == "ivf":
+        nlist = option_value(options, "--nlist")
+        LegalDocumentRAG(api_key, sharding=sharding).build_ivf_index(
+            IVF_INDEX_PATH, nlist=int(nlist) if nlist else None,
+            iterations=int(option_value(options, "--iterations", "20")))
+    elif command == "migrate-cosine":
+        migrated = run_in_generation(api_key, lambda rag: rag.migrate_to_cosine(), sharding=sharding,
+                                     in_place="--in-place" in options)
+        print(f"Migrated {len(migrated)} collection(s) to cosine space: {', '.join(migrated) or 'none'}")
+    elif command == "split-issues":
+        count = run_in_generation(api_key, lambda rag: rag.backfill_issue_vectors(), sharding=sharding,
+                                  in_place="--in-place" in options)
+        print(f"Stored {count} issue vectors")
+    elif command == "index-citations":
+        # Only the citation index file changes; the vector index is not opened
+        count = index_directory(CitationIndex(), "data/pdfs")
+        print(f"Indexed citations of {count} documents")
+    elif command == "export":
+        path = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith("--") else SNAPSHOT_PATH
+        count = LegalDocumentRAG(api_key, sharding=sharding).export_index(path)
+        print(f"Exported {count} documents to {path}")
+    elif command == "import":
+        path = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith("--") else SNAPSHOT_PATH
+        count = run_in_generation(api_key, lambda rag: rag.import_index(path), sharding=sharding,
+                                  in_place="--in-place" in options)
+        print(f"Imported {count} documents from {path}")
     else:
         print("Unknown command")
 
@@ -0,0 +1,131 @@
+# On-demand PDF page rendering with an on-disk image cache
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+from triage import file_sha256
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_DIR = os.path.join("data", "page_cache")
+THUMBNAIL_ZOOM = 0.3
+PAGE_ZOOM = 1.5
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# Renders between checks of the cache size
+PRUNE_INTERVAL = 50
+
+
+class PageRenderer:
+    """Renders PDF pages to PNG with PyMuPDF ``get_pixmap``, cached on disk.
+
+    Images are keyed by the file's content hash, page number and zoom, so a
+    renamed copy of a decision reuses its renders and an edited file never
+    serves stale ones. Each page is rendered at most once even when several
+    sessions ask for it at the same time; the least recently used images
+    are evicted once the cache grows past ``max_cache_bytes``.
+    """
+
+    def __init__(self, cache_dir: str = PAGE_CACHE_DIR, max_cache_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self._lock = threading.Lock()
+        self._render_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._hashes: Dict[Tuple[str, int, float], str] = {}
+        self._page_counts: Dict[str, int] = {}
+        self._renders_since_prune = 0
+
+    def file_hash(self, pdf_path: str) -> str:
+        """Content hash of ``pdf_path``, recomputed only when size or mtime change."""
+        stat = os.stat(pdf_path)
+        key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime)
+        digest = self._hashes.get(key)
+        if digest is None:
+            digest = file_sha256(pdf_path)
+            with self._lock:
+                self._hashes[key] = digest
+        return digest
+
+    def page_count(self, pdf_path: str) -> int:
+        import fitz  # PyMuPDF
+
+        digest = self.file_hash(pdf_path)
+        count = self._page_counts.get(digest)
+        if count is None:
+            with fitz.open(pdf_path) as doc:
+                count = doc.page_count
+            with self._lock:
+                self._page_counts[digest] = count
+        return count
+
+    def thumbnail(self, pdf_path: str, page: int) -> str:
+        """Path of a small PNG of ``page`` (0-based), rendering it if needed."""
+        return self.render(pdf_path, page, THUMBNAIL_ZOOM)
+
+    def page_image(self, pdf_path: str, page: int) -> str:
+        """Path of a readable PNG of ``page`` (0-based), rendering it if needed."""
+        return self.render(pdf_path, page, PAGE_ZOOM)
+
+    def render(self, pdf_path: str, page: int, zoom: float) -> str:
+        digest = self.file_hash(pdf_path)
+        path = os.path.join(self.cache_dir, digest[:2], f"{digest}_p{page}_z{int(zoom * 100)}.png")
+        if os.path.exists(path):
+            # Touch so eviction keeps recently viewed pages
+            os.utime(path)
+            return path
+
+        with self._lock:
+            render_lock = self._render_locks[path]
+        with render_lock:
+            if not os.path.exists(path):
+                self._render(pdf_path, page, zoom, path)
+        with self._lock:
+            self._render_locks.pop(path, None)
+            self._renders_since_prune += 1
+            prune = self._renders_since_prune >= PRUNE_INTERVAL
+            if prune:
+                self._renders_since_prune = 0
+        if prune:
+            self.prune()
+        return path
+
+    def _render(self, pdf_path: str, page: int, zoom: float, path: str) -> None:
+        import fitz  # PyMuPDF
+
+        with fitz.open(pdf_path) as doc:
+            pixmap = doc.load_page(page).get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            data = pixmap.tobytes("png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def prune(self) -> int:
+        """Evict least recently used images until the cache fits; returns files removed."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.png'):
+                    full_path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(full_path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, full_path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, full_path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(full_path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Evicted {removed} cached page images")
+        return removed
@@ -188,16 +188,35 @@
 #             logger.error(f"Fallback extraction failed: {str(e)}")
 #         return result
 
-import fitz  # PyMuPDF
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import os
 import logging
-import google.generativeai as genai
 import json
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import resources
+from case_metadata import extract_metadata, missing_fields
+
+# Gemini runs remembered for the details page, least recently used dropped first
+MAX_LLM_RUNS = 64
+# A failed Gemini run is retried after this long, doubling per consecutive failure
+LLM_RETRY_SECONDS = 30.0
+LLM_RETRY_MAX_SECONDS = 600.0
 
 logger = logging.getLogger(__name__)
 
+# Prompt line and JSON field for each basic field, asked of the LLM only
+# when the caption rules in case_metadata could not resolve it
+BASIC_FIELD_PROMPTS = {
+    'case_number': ("Case number (format: alphanumeric identifier)", '"case_number": "string"'),
+    'petitioner_name': ("Petitioner name (full name)", '"petitioner_name": "string"'),
+    'respondent_name': ("Respondent name (full name)", '"respondent_name": "string"'),
+    'city': ("City/location (city name only)", '"city": "string"'),
+}
+
 # final 2 - 5 must sentences but no temp control
 # class LegalDocumentProcessor:
 #     def __init__(self, api_key: str):
@@ -349,14 +368,25 @@ logger = logging.getLogger(__name__)
 
 class LegalDocumentProcessor:
     def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
         # Set up model with lower temperature for more consistent outputs
         generation_config = {
             "temperature": 0.1,  # Lower temperature for more consistent output
             "top_p": 0.8,
             "top_k": 40
         }
-        self.model = genai.GenerativeModel('gemini-pro', generation_config=generation_config)
+        self.api_key = api_key
+        self.generation_config = generation_config
+        # Gemini runs for the details page, keyed by (path, mtime); failed
+        # runs are kept with (retry_at, backoff) until they may be retried
+        self._llm_runs: "OrderedDict[Tuple[str, float], Future]" = OrderedDict()
+        self._llm_retry: Dict[Tuple[str, float], Tuple[float, float]] = {}
+        self._llm_lock = threading.Lock()
+        self._llm_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def model(self):
+        """Shared Gemini model, configured on first use."""
+        return resources.get_llm_model(self.api_key, self.generation_config)
 
     def _clean_text(self, text: str) -> str:
         """Clean text and limit to reasonable length."""
@@ -366,34 +396,151 @@ class LegalDocumentProcessor:
             text = text[:30000] + "..."
         return text
 
-    def _extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF with error handling."""
+    def _extract_raw_text(self, pdf_path: str) -> str:
+        """Extract text from PDF with line breaks kept, so headings can be found."""
+        import fitz  # PyMuPDF
+
         try:
             with fitz.open(pdf_path) as doc:
                 text = ""
                 for page in doc:
                     text += page.get_text() + "\n"
-                return self._clean_text(text)
+                return text
         except Exception as e:
             logger.error(f"Failed to extract text from PDF: {str(e)}")
             raise
 
-    def process_document(self, pdf_path: str) -> Dict:
-        """Process document with consistent summary generation."""
+    def _extract_text_from_pdf(self, pdf_path: str) -> str:
+        """Extract text from PDF with error handling."""
+        return self._clean_text(self._extract_raw_text(pdf_path))
+
+    def summarize_locally(self, pdf_path: str, raw_text: Optional[str] = None) -> Dict:
+        """Extractive summaries built without the LLM, in well under a second.
+
+        Same fields as ``process_document``, with the basic fields from the
+        caption rules and ``summary_source`` set to ``'extractive'``.
+        """
+        from summarizer import summarize_decision
+
+        try:
+            text = raw_text if raw_text is not None else self._extract_raw_text(pdf_path)
+            summaries = summarize_decision(text)
+        except Exception as e:
+            logger.error(f"Failed to summarize document locally: {str(e)}")
+            return self._create_error_response(pdf_path)
+
+        filename = os.path.basename(pdf_path)
+        metadata = extract_metadata(text, filename)
+        is_appeal = bool(metadata['is_appeal'])
+        result = {
+            'filename': filename,
+            'case_number': metadata['case_number'] or 'Not available',
+            'petitioner_name': metadata['petitioner_name'] or 'Not available',
+            'respondent_name': metadata['respondent_name'] or 'Not available',
+            'city': metadata['city'] or 'Not available',
+            'is_appeal': is_appeal,
+            'appeal_subject': None,
+            'appeal_decision': summaries['final_decision_summary'] if is_appeal else None,
+            'summary_source': 'extractive'
+        }
+        for field, summary in summaries.items():
+            result[field] = summary or 'Summary not available'
+        return result
+
+    @staticmethod
+    def _llm_succeeded(future: Future) -> bool:
+        """Whether a finished run produced a Gemini summary rather than the local fallback."""
+        if future.cancelled() or future.exception() is not None:
+            return False
+        return future.result().get('summary_source') == 'gemini'
+
+    def _record_run(self, key: Tuple[str, float], future: Future) -> None:
+        # Done callback: back off a failed run so an open page does not call Gemini in a loop
+        with self._llm_lock:
+            if self._llm_runs.get(key) is not future:
+                return
+            if self._llm_succeeded(future):
+                self._llm_retry.pop(key, None)
+                return
+            previous = self._llm_retry.get(key, (0.0, 0.0))[1]
+            backoff = min(previous * 2, LLM_RETRY_MAX_SECONDS) if previous else LLM_RETRY_SECONDS
+            self._llm_retry[key] = (time.monotonic() + backoff, backoff)
+
+    def process_document_async(self, pdf_path: str) -> Tuple[Dict, Future]:
+        """The local summary now, and a future for the Gemini result.
+
+        The Gemini run is started once per file version and shared by later
+        calls, so reruns of the details page do not resubmit it. A run that
+        fell back to the local summary is returned as is until its retry
+        time (``LLM_RETRY_SECONDS``, doubling per failure) has passed, then
+        the next call retries Gemini; at most ``MAX_LLM_RUNS`` runs are
+        remembered.
+        """
+        key = (os.path.abspath(pdf_path), os.path.getmtime(pdf_path))
+        submitted = False
+        with self._llm_lock:
+            future = self._llm_runs.get(key)
+            if (future is not None and future.done() and not self._llm_succeeded(future)
+                    and time.monotonic() >= self._llm_retry.get(key, (0.0, 0.0))[0]):
+                future = None
+            if future is None:
+                if self._llm_executor is None:
+                    self._llm_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gemini")
+                future = self._llm_runs[key] = self._llm_executor.submit(self.process_document, pdf_path)
+                submitted = True
+            self._llm_runs.move_to_end(key)
+            while len(self._llm_runs) > MAX_LLM_RUNS:
+                evicted, _ = self._llm_runs.popitem(last=False)
+                self._llm_retry.pop(evicted, None)
+        if submitted:
+            # Outside the lock: the callback runs at once if the run already finished
+            future.add_done_callback(lambda done: self._record_run(key, done))
+        if future.done() and not future.cancelled() and future.exception() is None:
+            return future.result(), future
+        return self.summarize_locally(pdf_path), future
+
+    def process_document(self, pdf_path: str, priority: str = "interactive") -> Dict:
+        """Process document with consistent summary generation.
+
+        The Gemini call is scheduled under ``priority`` by the shared LLM
+        scheduler; the details page is interactive.
+        """
         logger.info(f"Processing document: {pdf_path}")
         
+        try:
+            raw_text = self._extract_raw_text(pdf_path)
+        except Exception:
+            return self._create_error_response(pdf_path)
+
         try:
             # Extract text
-            text = self._extract_text_from_pdf(pdf_path)
-            
+            text = self._clean_text(raw_text)
+
+            # Caption fields come from the rules; the LLM only fills the gaps
+            metadata = extract_metadata(raw_text, os.path.basename(pdf_path))
+            missing = missing_fields(metadata)
+            basic_lines = [BASIC_FIELD_PROMPTS[field][0] for field in missing if field in BASIC_FIELD_PROMPTS]
+            basic_section = ("Extract exactly:" + "".join(f"\n               - {line}" for line in basic_lines)
+                             if basic_lines else "Already known; do not extract.")
+            if 'is_appeal' in missing:
+                appeal_question = "Is this an appeal case? (true/false only)"
+            else:
+                appeal_question = f"This is {'' if metadata['is_appeal'] else 'not '}an appeal case"
+            json_fields = [BASIC_FIELD_PROMPTS[field][1] for field in missing if field in BASIC_FIELD_PROMPTS]
+            json_fields += ['"petitioner_issues_summary": "string (~5 sentences)"',
+                            '"respondent_issues_summary": "string (~5 sentences)"',
+                            '"hearing_points_summary": "string (~5 sentences)"',
+                            '"final_decision_summary": "string (~5 sentences)"']
+            if 'is_appeal' in missing:
+                json_fields.append('"is_appeal": boolean')
+            json_fields += ['"appeal_subject": "string or null (~5 sentences)"',
+                            '"appeal_decision": "string or null (~5 sentences)"']
+            json_template = ",\n".join(f"                {field}" for field in json_fields)
+
             # Create structured extraction prompt
             prompt = f"""Analyze this legal document and extract information following these exact guidelines:
 
-            1. BASIC INFORMATION - Extract exactly:
-               - Case number (format: alphanumeric identifier)
-               - Petitioner name (full name)
-               - Respondent name (full name)
-               - City/location (city name only)
+            1. BASIC INFORMATION - {basic_section}
 
             2. SUMMARIES - For each section below, provide approximately 5 sentences that capture the essential information:
 
@@ -422,7 +569,7 @@ class LegalDocumentProcessor:
                - Focus on actual decision only
 
             3. APPEAL INFORMATION:
-               - Is this an appeal case? (true/false only)
+               - {appeal_question}
                - If yes, state what is the appeal about
                - If yes, state appeal decision
 
@@ -431,21 +578,11 @@ class LegalDocumentProcessor:
 
             Return ONLY a JSON object with these exact fields. Each summary should be a single paragraph:
             {{
-                "case_number": "string",
-                "petitioner_name": "string",
-                "respondent_name": "string",
-                "city": "string",
-                "petitioner_issues_summary": "string (~5 sentences)",
-                "respondent_issues_summary": "string (~5 sentences)",
-                "hearing_points_summary": "string (~5 sentences)",
-                "final_decision_summary": "string (~5 sentences)",
-                "is_appeal": boolean,
-                "appeal_subject": "string or null (~5 sentences)",
-                "appeal_decision": "string or null (~5 sentences)"
+{json_template}
             }}"""
 
             # Get response from model
-            response = self.model.generate_content(prompt)
+            response = resources.get_llm_scheduler().generate(self.model, prompt, priority=priority)
             content = response.text.strip()
             
             # Clean up JSON response
@@ -460,10 +597,12 @@ class LegalDocumentProcessor:
                 logger.info("Successfully parsed JSON response")
             except json.JSONDecodeError as e:
                 logger.error(f"JSON parsing error: {str(e)}")
-                return self._create_error_response(pdf_path)
+                return self.summarize_locally(pdf_path, raw_text)
 
             # Add filename to result
             result['filename'] = os.path.basename(pdf_path)
+            result['summary_source'] = 'gemini'
+            result.update({field: value for field, value in metadata.items() if value is not None})
             
             # Validate and clean summaries
             summary_fields = ['petitioner_issues_summary', 'respondent_issues_summary', 
@@ -480,7 +619,7 @@ class LegalDocumentProcessor:
 
         except Exception as e:
             logger.error(f"Failed to process document: {str(e)}")
-            return self._create_error_response(pdf_path)
+            return self.summarize_locally(pdf_path, raw_text)
 
     def _create_error_response(self, pdf_path: str) -> Dict:
         """Create a structured error response."""
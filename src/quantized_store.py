@@ -0,0 +1,182 @@
+# Int8 scalar-quantized vector store with full-precision re-ranking
+
+import json
+import logging
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+SEARCH_CHUNK_ROWS = 4096  # rows dequantized per step, kept small to stay in cache
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows (or a single vector) to unit L2 norm."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def pairwise_distances(query: np.ndarray, dots: np.ndarray, norms: np.ndarray,
+                       space: str) -> np.ndarray:
+    """Turn dot products with ``query`` into distances for a Chroma ``hnsw:space``.
+
+    ``norms`` are squared L2 norms (see ``vector_norms``) and only used for
+    ``l2``. In ``cosine`` space vectors and query are unit-normalized up
+    front, so the distance is just one minus the dot product.
+    """
+    if space == "l2":
+        return norms - 2 * dots + float(query @ query)
+    if space in ("cosine", "ip"):
+        return 1 - dots
+    raise ValueError(f"Unsupported distance space: {space}")
+
+
+def prepare_vectors(vectors: np.ndarray, space: str) -> np.ndarray:
+    """Vectors (or a query) as stored for ``space``: unit-normalized for cosine."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return normalize(vectors).astype(np.float32) if space == "cosine" else vectors
+
+
+def vector_norms(vectors: np.ndarray, space: str) -> np.ndarray:
+    """Norm term used by ``pairwise_distances`` for ``space``."""
+    if space == "l2":
+        return np.einsum('ij,ij->i', vectors, vectors)
+    return np.ones(len(vectors), dtype=np.float32)
+
+
+class QuantizedVectorStore:
+    """Int8 copy of a collection's embeddings searched with NumPy.
+
+    Each dimension is scaled into 256 levels, so the codes take a quarter of
+    the float32 footprint. Searches scan the codes, then re-rank the best
+    ``rescore_k`` candidates against the full-precision vectors, which stay
+    memory-mapped on disk and are only paged in for those rows.
+    """
+
+    def __init__(self, ids: List[str], codes: np.ndarray, offsets: np.ndarray,
+                 scales: np.ndarray, vectors: np.ndarray, norms: np.ndarray,
+                 space: str = "l2"):
+        self.ids = ids
+        self.codes = codes
+        self.offsets = offsets
+        self.scales = scales
+        self.vectors = vectors
+        self.norms = norms
+        self.space = space
+
+    @classmethod
+    def build(cls, ids: Sequence[str], embeddings, space: str = "l2") -> "QuantizedVectorStore":
+        """Quantize ``embeddings`` (one row per id) into a new store."""
+        vectors = np.ascontiguousarray(prepare_vectors(embeddings, space))
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding row per id")
+        offsets = vectors.min(axis=0)
+        scales = (vectors.max(axis=0) - offsets) / 255.0
+        scales[scales == 0] = 1.0
+        codes = np.rint((vectors - offsets) / scales - 128).clip(-128, 127).astype(np.int8)
+        return cls(list(ids), codes, offsets.astype(np.float32), scales.astype(np.float32),
+                   vectors, vector_norms(vectors, space).astype(np.float32), space)
+
+    @classmethod
+    def from_collection(cls, collection) -> "QuantizedVectorStore":
+        """Build a store from every embedding in a Chroma collection."""
+        records = collection.get(include=["embeddings"])
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        embeddings = records['embeddings']
+        if embeddings is None or len(embeddings) == 0:
+            raise ValueError(f"Collection {collection.name} has no embeddings")
+        return cls.build(records['ids'], embeddings, space)
+
+    def save(self, path: str) -> None:
+        """Write the store to ``path`` (a directory)."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'codes.npy'), self.codes)
+        np.save(os.path.join(path, 'vectors.npy'), np.asarray(self.vectors, dtype=np.float32))
+        np.save(os.path.join(path, 'norms.npy'), self.norms)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+        np.save(os.path.join(path, 'scales.npy'), self.scales)
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'space': self.space,
+                'count': len(self.ids),
+                'dim': int(self.codes.shape[1]),
+                'ids': self.ids
+            }, f)
+        logger.info(f"Saved quantized index with {len(self.ids)} vectors to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedVectorStore":
+        """Load a store; full-precision vectors are memory-mapped, not read."""
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported quantized index version: {meta.get('version')}")
+        return cls(
+            meta['ids'],
+            np.load(os.path.join(path, 'codes.npy')),
+            np.load(os.path.join(path, 'offsets.npy')),
+            np.load(os.path.join(path, 'scales.npy')),
+            np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'norms.npy')),
+            meta['space']
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in RAM by the searchable part of the index."""
+        return self.codes.nbytes + self.norms.nbytes + self.offsets.nbytes + self.scales.nbytes
+
+    def _approximate_dots(self, query: np.ndarray) -> np.ndarray:
+        """Dot products of ``query`` with every dequantized vector."""
+        # x ~= (code + 128) * scale + offset, so q.x splits into a scaled
+        # dot with the codes plus a constant shared by every row
+        weights = (query * self.scales).astype(np.float32)
+        constant = float(query @ (128 * self.scales + self.offsets))
+        dots = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SEARCH_CHUNK_ROWS):
+            block = self.codes[start:start + SEARCH_CHUNK_ROWS]
+            dots[start:start + len(block)] = block.astype(np.float32) @ weights
+        return dots + constant
+
+    def search(self, query, top_k: int = 5, rescore_k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return ``(id, distance)`` pairs for the nearest ``top_k`` vectors.
+
+        ``rescore_k`` candidates (default ``10 * top_k``) are taken from the
+        quantized scan and re-ranked with exact distances.
+        """
+        if not self.ids:
+            return []
+        query = prepare_vectors(query, self.space).ravel()
+        rescore_k = min(len(self.ids), max(top_k, rescore_k or top_k * 10))
+
+        approx = pairwise_distances(query, self._approximate_dots(query), self.norms, self.space)
+        if rescore_k < len(approx):
+            candidates = np.argpartition(approx, rescore_k - 1)[:rescore_k]
+        else:
+            candidates = np.arange(len(approx))
+        candidates.sort()  # sequential reads from the memory-mapped vectors
+
+        exact_vectors = np.asarray(self.vectors[candidates], dtype=np.float32)
+        exact = pairwise_distances(query, exact_vectors @ query,
+                                   self.norms[candidates], self.space)
+        order = np.argsort(exact)[:top_k]
+        return [(self.ids[candidates[i]], float(exact[i])) for i in order]
+
+
+def exact_search(query, vectors: np.ndarray, top_k: int = 5, space: str = "l2",
+                 norms: Optional[np.ndarray] = None) -> np.ndarray:
+    """Brute-force float32 search returning row indices, nearest first.
+
+    ``vectors`` must already be prepared for ``space`` (see ``prepare_vectors``).
+    """
+    query = prepare_vectors(query, space).ravel()
+    if norms is None:
+        norms = vector_norms(vectors, space)
+    distances = pairwise_distances(query, vectors @ query, norms, space)
+    top_k = min(top_k, len(distances))
+    candidates = np.argpartition(distances, top_k - 1)[:top_k]
+    return candidates[np.argsort(distances[candidates])]
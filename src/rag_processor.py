@@ -2,16 +2,21 @@
 
 # similarity with the petitioners issues 
 
-import chromadb
-from chromadb.utils import embedding_functions
 from typing import List, Dict, Optional
 import os
 import json
-from sentence_transformers import SentenceTransformer
-import fitz  # PyMuPDF
+import heapq
 import logging
-import google.generativeai as genai
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+# PyMuPDF, NumPy and the model/vector-store libraries are imported where
+# they are used, so importing this module stays cheap for the CLI
+import resources
+from case_metadata import CAPTION_CHARS, extract_metadata
+from citations import CITATION_INDEX_PATH, CitationIndex, extract_citations, index_directory
+from sharding import ShardRouter, detect_strategy, shard_metadata
+from generations import default_generations
 
 logger = logging.getLogger(__name__)
 
@@ -153,10 +158,28 @@ logger = logging.getLogger(__name__)
 
 # with temperature control on the similarity score
 
+QUANTIZED_INDEX_PATH = "quantized_index"
+IVF_INDEX_PATH = "ivf_index"
+SNAPSHOT_PATH = os.path.join("data", "index_snapshot.lcidx")
+COLLECTION_METADATA = {"hnsw:space": "cosine"}
+MIGRATION_BATCH_SIZE = 1000
+MIGRATION_SUFFIX = "__cosine_tmp"
+ISSUE_COLLECTION_SUFFIX = "_items"
+# Issue vectors fetched per query issue to collect candidate cases
+ISSUE_CANDIDATES = 50
+
 class LegalDocumentRAG:
-    def __init__(self, api_key: str, collection_name: str = "petitioner_issues"):
+    def __init__(self, api_key: str, collection_name: str = "petitioner_issues",
+                 quantized_index: Optional[str] = None, snapshot: Optional[str] = None,
+                 sharding: Optional[str] = None, num_shards: int = 8,
+                 rerank_candidates: int = 0, rerank_budget: Optional[float] = 0.5,
+                 issue_matching: Optional[str] = None,
+                 citation_index: Optional[str] = CITATION_INDEX_PATH,
+                 ivf_index: Optional[str] = None, nprobe: int = 8,
+                 ivf_retrain_interval: Optional[float] = None,
+                 chroma_path: Optional[str] = None):
         self.api_key = api_key
-        genai.configure(api_key=api_key)
+        self.collection_name = collection_name
         
         # Configure Gemini with low temperature for consistent outputs
         generation_config = {
@@ -164,22 +187,392 @@ class LegalDocumentRAG:
             "top_p": 0.8,
             "top_k": 40
         }
-        self.model = genai.GenerativeModel('gemini-pro', generation_config=generation_config)
+        # Model, embedder and Chroma client are shared process-wide; the
+        # LLM and embedder are only loaded when first used
+        self.generation_config = generation_config
         
-        # Initialize embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # Initialize ChromaDB
-        self.client = chromadb.PersistentClient(path="chroma_db")
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name='all-MiniLM-L6-v2'
+        if snapshot and issue_matching:
+            raise ValueError("Issue matching needs the Chroma index and cannot serve from a snapshot")
+
+        # Initialize ChromaDB; without ``chroma_path`` the published index
+        # generation is followed and reloaded when a new one is published.
+        # A snapshot is served without opening Chroma at all.
+        self.follow_generations = chroma_path is None and not snapshot
+        self.index_path = None
+        self.client = None
+        self._collections: Dict[str, object] = {}
+        self.collection = None
+        if not snapshot:
+            self.index_path = chroma_path or default_generations().index_path()
+            self.client = resources.get_chroma_client(self.index_path, hold=True)
+            self.collection = self._get_collection(collection_name)
+
+        # Optional int8 index searched instead of the Chroma HNSW graph
+        self.quantized_store = None
+        if quantized_index:
+            from quantized_store import QuantizedVectorStore
+            self.quantized_store = QuantizedVectorStore.load(quantized_index)
+
+        # Optional IVF index probing only the ``nprobe`` nearest k-means
+        # lists; with ``ivf_retrain_interval`` a background job keeps it
+        # current and retrains it when the embeddings drift
+        self.ivf_index = None
+        self.nprobe = nprobe
+        self.ivf_maintainer = None
+        if ivf_index:
+            from ivf_index import IVFIndex, IVFMaintainer
+            if os.path.exists(os.path.join(ivf_index, 'meta.json')):
+                self.ivf_index = IVFIndex.load(ivf_index)
+            if ivf_retrain_interval and self.client is not None:
+                # Reads whatever collections this instance has open at refresh time
+                self.ivf_maintainer = IVFMaintainer(lambda: self.document_records(["embeddings"]), ivf_index,
+                                                    self._swap_ivf_index, space=self._space(),
+                                                    interval=ivf_retrain_interval)
+                self.ivf_maintainer.start(self.ivf_index)
+
+        # Optional memory-mapped snapshot served without touching Chroma
+        self.snapshot = None
+        if snapshot:
+            from index_snapshot import IndexSnapshot
+            self.snapshot = IndexSnapshot(snapshot)
+
+        # Optional sharding: documents live in per-shard collections named
+        # after ``collection_name`` and queries scatter over them. Without
+        # ``sharding``, an index that already has shards is used through them.
+        self.num_shards = num_shards
+        self.router = ShardRouter(collection_name, sharding, num_shards) if sharding else None
+        self._detect_sharding = sharding is None
+        self._detect_router()
+
+        # Optional cross-encoder stage: over-fetch ``rerank_candidates`` and
+        # re-score them within ``rerank_budget`` seconds
+        self.rerank_candidates = rerank_candidates
+        self.reranker = None
+        if rerank_candidates:
+            from reranker import CrossEncoderReranker
+            self.reranker = CrossEncoderReranker(time_budget=rerank_budget)
+
+        # One vector per petitioner issue, matched issue-to-issue at query
+        # time ("maxsim" or "assignment"); None ranks whole issue lists with
+        # the index selected above. Issue vectors sit next to the document
+        # collection (or shard) they belong to.
+        self.issue_matching = issue_matching
+        self.issue_collection = (self._get_collection(collection_name + ISSUE_COLLECTION_SUFFIX)
+                                 if self.client is not None else None)
+
+        # Ordinance sections, regulation chapters and case numbers cited by
+        # each decision, filled in at ingest
+        self.citations = CitationIndex(citation_index) if citation_index else None
+
+    @property
+    def model(self):
+        """Shared Gemini model, configured on first use."""
+        return resources.get_llm_model(self.api_key, self.generation_config)
+
+    def reload_if_published(self) -> bool:
+        """Switch to a newly published index generation; True if one was picked up."""
+        if not self.follow_generations:
+            return False
+        path = default_generations().live_path()
+        if path == self.index_path:
+            return False
+        return self.switch_index(path)
+
+    def switch_index(self, path: str) -> bool:
+        """Point this instance at the Chroma index in ``path``.
+
+        The new client and collections are opened before they replace the
+        old ones, so queries already running finish on the previous index
+        and later ones see the new one. The IVF maintainer reads through
+        this instance and follows automatically; the previous client is
+        closed once no reader holds it.
+        """
+        try:
+            client = resources.get_chroma_client(path, hold=True)
+            collections = {}
+            for name in [self.collection_name, self.collection_name + ISSUE_COLLECTION_SUFFIX]:
+                collections[name] = client.get_or_create_collection(
+                    name=name, embedding_function=resources.shared_embedding_function(),
+                    metadata=COLLECTION_METADATA)
+        except Exception as e:
+            logger.error(f"Failed to open index at {path}: {str(e)}")
+            return False
+        previous = self.index_path
+        self.client, self._collections, self.index_path = client, collections, path
+        self.collection = collections[self.collection_name]
+        self.issue_collection = collections[self.collection_name + ISSUE_COLLECTION_SUFFIX]
+        self._detect_router()
+        if previous is not None:
+            resources.release_chroma_client(previous)
+        logger.info(f"Switched to index at {path}")
+        return True
+
+    @property
+    def embedding_model(self):
+        """Shared sentence embedding model, loaded on first use."""
+        return resources.get_embedding_model()
+
+    def _get_collection(self, name: str):
+        """Return (and cache) the collection called ``name``.
+
+        New collections use cosine space; embeddings are unit-normalized, so
+        ``1 - distance`` is their cosine similarity.
+        """
+        collection = self._collections.get(name)
+        if collection is None:
+            if self.client is None:
+                raise RuntimeError("This index is served from a read-only snapshot")
+            collection = self.client.get_or_create_collection(
+                name=name,
+                embedding_function=resources.shared_embedding_function(),
+                metadata=COLLECTION_METADATA
+            )
+            if (collection.metadata or {}).get("hnsw:space", "l2") != "cosine":
+                logger.warning(f"Collection {name} uses L2 space and reports skewed similarity "
+                               f"scores; run 'python main.py migrate-cosine'")
+            self._collections[name] = collection
+        return collection
+
+    def collection_for(self, doc_id: str, metadata: Dict):
+        """Collection a document is written to."""
+        if self.router is None:
+            return self.collection
+        return self._get_collection(self.router.shard_for(doc_id, metadata))
+
+    def _detect_router(self) -> None:
+        """Route through the shards of the open index when no strategy was given."""
+        if not self._detect_sharding or self.client is None:
+            return
+        names = [getattr(collection, 'name', collection) for collection in self.client.list_collections()]
+        strategy = detect_strategy(self.collection_name, names)
+        self.router = ShardRouter(self.collection_name, strategy, self.num_shards) if strategy else None
+
+    def shard_names(self, where: Optional[Dict] = None) -> List[str]:
+        """Existing shard collections that may match ``where``."""
+        names = [
+            getattr(collection, 'name', collection)
+            for collection in self.client.list_collections()
+        ]
+        return self.router.prune(names, where)
+
+    def document_collections(self) -> List[str]:
+        """Names of the collections holding whole documents (not issue vectors)."""
+        if self.router is None:
+            return [self.collection_name]
+        return [self.collection_name] + self.shard_names()
+
+    def document_count(self) -> int:
+        return sum(self._get_collection(name).count() for name in self.document_collections())
+
+    def document_records(self, include: List[str]) -> Dict:
+        """``collection.get`` over every document collection (the base and all shards)."""
+        records: Dict[str, list] = {'ids': [], **{key: [] for key in include}}
+        for name in self.document_collections():
+            found = self._get_collection(name).get(include=include)
+            records['ids'].extend(found['ids'])
+            for key in include:
+                if found[key] is not None:
+                    records[key].extend(found[key])
+        return records
+
+    def _remove_from_other_shards(self, doc_id: str, shard: str) -> None:
+        """Drop copies of ``doc_id`` left in other shards when its routing changed."""
+        for name in self.document_collections():
+            if name == shard:
+                continue
+            collection = self._get_collection(name)
+            if collection.get(ids=[doc_id], include=[])['ids']:
+                collection.delete(ids=[doc_id])
+                self.issue_collection_for(name).delete(where={"parent": doc_id})
+
+    def issue_collection_for(self, collection_name: str):
+        """Issue-vector collection paired with the document collection ``collection_name``."""
+        return self._get_collection(collection_name + ISSUE_COLLECTION_SUFFIX)
+
+    def issue_collections(self, where: Optional[Dict] = None) -> List:
+        """Issue-vector collections a query with ``where`` has to search."""
+        if self.router is None:
+            return [self.issue_collection]
+        return [self.issue_collection_for(name) for name in self.shard_names(where)]
+
+    def add_issue_vectors(self, doc_id: str, petitioner_issues: str, metadata: Dict,
+                          collection_name: Optional[str] = None) -> int:
+        """Store one vector per issue of a case, replacing any previous ones.
+
+        ``collection_name`` is the document collection (or shard) holding
+        the case; its issue vectors go to the paired issue collection.
+        """
+        from issue_matching import split_issues
+
+        issues = split_issues(petitioner_issues)
+        issue_collection = self.issue_collection_for(collection_name or self.collection_name)
+        issue_collection.delete(where={"parent": doc_id})
+        if issues:
+            issue_collection.add(
+                ids=[f"{doc_id}#{index}" for index in range(len(issues))],
+                documents=issues,
+                metadatas=[{**metadata, 'parent': doc_id, 'issue_index': index}
+                           for index in range(len(issues))]
+            )
+        return len(issues)
+
+    def backfill_issue_vectors(self) -> int:
+        """Split the issue lists already stored in the index into issue vectors."""
+        total = 0
+        for name in self.document_collections():
+            records = self._get_collection(name).get(include=["metadatas", "documents"])
+            for doc_id, metadata, issues in zip(records['ids'], records['metadatas'], records['documents']):
+                total += self.add_issue_vectors(doc_id, issues, metadata or {}, name)
+        logger.info(f"Stored {total} issue vectors")
+        return total
+
+    def _space(self) -> str:
+        return (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    def _document_embeddings(self) -> Dict:
+        records = self.document_records(["embeddings"])
+        if not records['ids']:
+            raise ValueError(f"Collection {self.collection_name} has no embeddings")
+        return records
+
+    def build_quantized_index(self, path: str = QUANTIZED_INDEX_PATH) -> None:
+        """Write an int8 quantized copy of the index's embeddings (all shards) to ``path``."""
+        from quantized_store import QuantizedVectorStore
+        records = self._document_embeddings()
+        store = QuantizedVectorStore.build(records['ids'], records['embeddings'], self._space())
+        store.save(path)
+        logger.info(f"Quantized index uses {store.nbytes / 1e6:.1f}MB in memory "
+                    f"for {len(store.ids)} vectors")
+
+    def build_ivf_index(self, path: str = IVF_INDEX_PATH, nlist: Optional[int] = None,
+                        iterations: int = 20) -> None:
+        """Train a k-means IVF index over the index's embeddings (all shards) and write it to ``path``."""
+        from ivf_index import IVFIndex
+        records = self._document_embeddings()
+        index = IVFIndex.build(records['ids'], records['embeddings'], self._space(), nlist, iterations)
+        index.save(path)
+        self.ivf_index = index
+
+    def _swap_ivf_index(self, index) -> None:
+        # Attribute assignment is atomic; in-flight searches finish on the old index
+        self.ivf_index = index
+
+    def migrate_to_cosine(self) -> List[str]:
+        """Rebuild every L2-space collection in place in cosine space.
+
+        Stored embeddings are unit-normalized and copied into a temporary
+        cosine collection, which then replaces the original under its name.
+        The original is only dropped once the copy is complete, and a rerun
+        after a crash picks up from whichever step was interrupted.
+        """
+        import numpy as np
+        from quantized_store import normalize
+
+        names = [getattr(collection, 'name', collection) for collection in self.client.list_collections()]
+        migrated = []
+        for name in names:
+            if name.endswith(MIGRATION_SUFFIX):
+                original = name[:-len(MIGRATION_SUFFIX)]
+                if original not in names:
+                    # Crashed between dropping the original and renaming the copy
+                    self.client.get_collection(name).modify(name=original)
+                    migrated.append(original)
+                continue
+
+            collection = self.client.get_collection(name)
+            if (collection.metadata or {}).get("hnsw:space", "l2") == "cosine":
+                continue
+
+            temp_name = name + MIGRATION_SUFFIX
+            if temp_name in names:
+                self.client.delete_collection(temp_name)
+            temp = self.client.create_collection(
+                name=temp_name,
+                embedding_function=resources.shared_embedding_function(),
+                metadata={**(collection.metadata or {}), **COLLECTION_METADATA}
             )
-        )
+
+            records = collection.get(include=["embeddings", "metadatas", "documents"])
+            embeddings = records['embeddings']
+            if embeddings is not None and len(embeddings):
+                vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+                for start in range(0, len(records['ids']), MIGRATION_BATCH_SIZE):
+                    end = start + MIGRATION_BATCH_SIZE
+                    temp.add(
+                        ids=records['ids'][start:end],
+                        embeddings=vectors[start:end].tolist(),
+                        metadatas=records['metadatas'][start:end],
+                        documents=records['documents'][start:end]
+                    )
+            if temp.count() != len(records['ids']):
+                raise RuntimeError(f"Migration of {name} copied {temp.count()} of "
+                                   f"{len(records['ids'])} records")
+
+            self.client.delete_collection(name)
+            temp.modify(name=name)
+            self._collections.pop(name, None)
+            migrated.append(name)
+            logger.info(f"Migrated {name} ({len(records['ids'])} records) to cosine space")
+
+        self.collection = self._get_collection(self.collection_name)
+        return migrated
+
+    def export_index(self, path: str = SNAPSHOT_PATH) -> int:
+        """Export every shard's embeddings, ids, metadata and issues to a snapshot file.
+
+        The per-issue vectors and the citations of the exported documents
+        are written too, so ``import_index`` restores all of them.
+        """
+        from index_snapshot import write_snapshot
+        records = self.document_records(["embeddings", "metadatas", "documents"])
+        if not records['ids']:
+            raise ValueError(f"Collection {self.collection_name} has no embeddings")
+        issues = {'ids': [], 'embeddings': [], 'metadatas': [], 'documents': []}
+        for collection in self.issue_collections():
+            found = collection.get(include=["embeddings", "metadatas", "documents"])
+            for key in issues:
+                issues[key].extend(found[key])
+        citations = ({doc_id: self.citations.citations_of(doc_id) for doc_id in records['ids']
+                      if doc_id in self.citations} if self.citations is not None else None)
+        write_snapshot(path, records['ids'], records['embeddings'], records['metadatas'], records['documents'],
+                       space=self._space(), collection_name=self.collection_name,
+                       issues=issues, citations=citations)
+        return len(records['ids'])
+
+    def import_index(self, path: str = SNAPSHOT_PATH) -> int:
+        """Load a snapshot file into the index, routing documents to their shards.
+
+        Issue vectors and citations are restored when the snapshot has them
+        (snapshots written before they were exported only carry documents).
+        """
+        from index_snapshot import IndexSnapshot
+        with IndexSnapshot(path) as snapshot:
+            for issues in (False, True):
+                for ids, embeddings, metadatas, documents in snapshot.batches(issues=issues):
+                    groups: Dict[str, List[int]] = {}
+                    for row, (doc_id, metadata) in enumerate(zip(ids, metadatas)):
+                        owner = (metadata or {}).get('parent', doc_id) if issues else doc_id
+                        name = getattr(self.collection_for(owner, metadata or {}), 'name', self.collection_name)
+                        groups.setdefault(name, []).append(row)
+                    for name, rows in groups.items():
+                        target = self.issue_collection_for(name) if issues else self._get_collection(name)
+                        target.upsert(ids=[ids[row] for row in rows],
+                                      embeddings=embeddings[rows].tolist(),
+                                      metadatas=[metadatas[row] for row in rows],
+                                      documents=[documents[row] for row in rows])
+            if self.citations is not None:
+                citations = snapshot.citations()
+                for doc_id, cited in citations.items():
+                    self.citations.add(doc_id, cited)
+                if citations:
+                    self.citations.save()
+            logger.info(f"Imported {snapshot.count} documents and {snapshot.issue_count} issue vectors from {path}")
+            return snapshot.count
 
     def extract_text(self, pdf_path: str) -> str:
         """Extract text content from PDF file."""
+        import fitz  # PyMuPDF
+
         try:
             with fitz.open(pdf_path) as doc:
                 text = ""
@@ -190,8 +583,67 @@ class LegalDocumentRAG:
             logger.error(f"Failed to extract text from PDF {pdf_path}: {str(e)}")
             raise
 
-    def extract_petitioner_issues(self, text: str) -> Optional[str]:
-        """Extract petitioner issues with consistent output."""
+    def extract_caption(self, pdf_path: str) -> str:
+        """Text of the first pages, enough for ``case_metadata.extract_metadata``."""
+        import fitz  # PyMuPDF
+
+        with fitz.open(pdf_path) as doc:
+            text = ""
+            for page in doc:
+                text += page.get_text()
+                if len(text) >= CAPTION_CHARS:
+                    break
+            return text
+
+    def routing_metadata(self, pdf_path: str, text: Optional[str] = None) -> Dict:
+        """Shard fields of a decision, with the city from its caption (DEFAULT_CITY when it names none)."""
+        filename = os.path.basename(pdf_path)
+        case = extract_metadata(text if text is not None else self.extract_caption(pdf_path), filename)
+        return shard_metadata(filename, case['city'])
+
+    def shard_for_file(self, pdf_path: str) -> Optional[str]:
+        """Collection ``add_to_rag`` writes ``pdf_path`` to, or None without sharding."""
+        if self.router is None:
+            return None
+        return self.router.shard_for(os.path.basename(pdf_path), self.routing_metadata(pdf_path))
+
+    def index_citations(self, doc_id: str, text: str) -> int:
+        """Record the citations in ``text`` for ``doc_id``; returns how many were found."""
+        if self.citations is None:
+            return 0
+        found = extract_citations(text)
+        self.citations.add(doc_id, found)
+        return len(found)
+
+    def save_citations(self) -> None:
+        """Merge citations indexed since the last save into the shared index file.
+
+        Called once per build or ingest batch rather than per document.
+        """
+        if self.citations is not None and self.citations.dirty:
+            try:
+                self.citations.save()
+            except Exception as e:
+                logger.error(f"Failed to save citation index: {str(e)}")
+
+    def documents_citing(self, citation: str) -> List[str]:
+        """Decisions citing ``citation``, e.g. ``§1707(a)``, ``Chapter 2`` or ``C23240003``."""
+        return self.citations.lookup(citation) if self.citations is not None else []
+
+    def search_citations(self, citations: List[str], match_all: bool = True) -> List[str]:
+        """Decisions citing all (or any, with ``match_all=False``) of ``citations``."""
+        return self.citations.search(citations, match_all) if self.citations is not None else []
+
+    def backfill_citations(self, pdf_dir: str) -> int:
+        """Index citations for every PDF in ``pdf_dir``; needs text extraction only."""
+        return index_directory(self.citations, pdf_dir)
+
+    def extract_petitioner_issues(self, text: str, priority: str = "batch") -> Optional[str]:
+        """Extract petitioner issues with consistent output.
+
+        The Gemini call goes through the shared LLM scheduler; queries pass
+        ``priority="interactive"`` so they are served ahead of ingestion.
+        """
         max_retries = 3
         retry_delay = 2
         
@@ -219,7 +671,8 @@ class LegalDocumentRAG:
                 
                 Return ONLY the numbered list of main issues, no additional text or commentary."""
                 
-                response = self.model.generate_content(prompt.format(text=text[:5000]))
+                response = resources.get_llm_scheduler().generate(
+                    self.model, prompt.format(text=text[:5000]), priority=priority)
                 return response.text.strip()
             
             except Exception as e:
@@ -229,55 +682,120 @@ class LegalDocumentRAG:
                     return None
         return None
 
-    def add_to_rag(self, pdf_path: str) -> None:
-        """Add document to RAG with consistent processing."""
+    def add_to_rag(self, pdf_path: str, journal=None, results=None) -> None:
+        """Add document to RAG with consistent processing.
+
+        With a ``BuildJournal`` every completed stage (extracted, issues
+        extracted, embedded, written) is recorded, and a document that was
+        interrupted resumes from its last completed stage. Failures are
+        dead-lettered in the journal and re-raised. Written documents are
+        appended to ``results`` (a ``ResultsWriter``) when given.
+        """
+        filename = os.path.basename(pdf_path)
+        record = journal.get(pdf_path) if journal is not None else None
+        if record and record['stage'] == 'written':
+            return
+        petitioner_issues = record['issues'] if record else None
+        embedding = record['embedding'] if record else None
+
+        stage = 'extracted'
+        text = None
         try:
-            filename = os.path.basename(pdf_path)
-            text = self.extract_text(pdf_path)
-            
-            # Extract petitioner issues
-            petitioner_issues = self.extract_petitioner_issues(text)
-            if not petitioner_issues:
-                logger.warning(f"Skipping {filename} - could not extract petitioner issues")
-                return
-            
+            if petitioner_issues is None:
+                text = self.extract_text(pdf_path)
+                self.index_citations(filename, text)
+                if journal is not None:
+                    journal.advance(pdf_path, 'extracted')
+
+                # Extract petitioner issues
+                stage = 'issues_extracted'
+                petitioner_issues = self.extract_petitioner_issues(text)
+                time.sleep(1)  # Rate limiting
+                if not petitioner_issues:
+                    raise ValueError("Could not extract petitioner issues")
+                if journal is not None:
+                    journal.advance(pdf_path, 'issues_extracted', issues=petitioner_issues)
+
+            elif self.citations is not None and filename not in self.citations:
+                # Resumed past extraction before citations were indexed
+                text = self.extract_text(pdf_path)
+                self.index_citations(filename, text)
+
+            if embedding is None:
+                stage = 'embedded'
+                embedding = resources.encode([petitioner_issues])[0].tolist()
+                if journal is not None:
+                    journal.advance(pdf_path, 'embedded', embedding=embedding)
+
+            stage = 'written'
             metadata = {
                 'filename': filename,
                 'path': pdf_path,
-                'processed_at': time.strftime('%Y-%m-%d %H:%M:%S')
+                'processed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                **self.routing_metadata(pdf_path, text)
             }
             
-            # Add to collection
-            self.collection.add(
+            # Add to collection (or the document's shard); upsert keeps a
+            # resumed write idempotent
+            target = self.collection_for(filename, metadata)
+            target.upsert(
                 documents=[petitioner_issues],
+                embeddings=[embedding],
                 metadatas=[metadata],
                 ids=[filename]
             )
+            self.add_issue_vectors(filename, petitioner_issues, metadata, target.name)
+            if self.router is not None:
+                self._remove_from_other_shards(filename, target.name)
+            if journal is not None:
+                journal.advance(pdf_path, 'written')
+            if results is not None:
+                results.write({**metadata, 'petitioner_issues': petitioner_issues})
             
             logger.info(f"Successfully processed {filename}")
-            time.sleep(1)  # Rate limiting
             
         except Exception as e:
-            logger.error(f"Failed to process {pdf_path}: {str(e)}")
+            logger.error(f"Failed to process {pdf_path} at stage {stage}: {str(e)}")
+            if journal is not None:
+                journal.fail(pdf_path, stage, str(e))
+            raise
+
+    def find_similar(self, query_pdf: str, top_k: int = 5, where: Optional[Dict] = None) -> List[Dict]:
+        """Find similar documents with consistent similarity scoring.
 
-    def find_similar(self, query_pdf: str, top_k: int = 5) -> List[Dict]:
-        """Find similar documents with consistent similarity scoring."""
+        ``where`` is an optional Chroma metadata filter such as
+        ``{"$and": [{"city": "Mountain View"}, {"year": 2023}]}``; with
+        sharding enabled it also prunes the shards that are queried.
+        """
+        self.reload_if_published()
         try:
             # Extract query document's petitioner issues
             query_text = self.extract_text(query_pdf)
-            query_issues = self.extract_petitioner_issues(query_text)
+            query_issues = self.extract_petitioner_issues(query_text, priority="interactive")
             
             if not query_issues:
                 logger.error("Could not extract petitioner issues from query document")
                 return []
-            
-            # Get similar documents
-            results = self.collection.query(
-                query_texts=[query_issues],
-                n_results=top_k,
-                include=["metadatas", "distances", "documents"]
-            )
-            
+
+            return self.rank_issues(query_issues, top_k, where)
+
+        except Exception as e:
+            logger.error(f"Error in similarity search: {str(e)}")
+            return []
+
+    def rank_issues(self, query_issues: str, top_k: int = 5, where: Optional[Dict] = None) -> List[Dict]:
+        """Rank indexed cases against already extracted petitioner issues.
+
+        This is ``find_similar`` without the PDF and LLM steps, so the
+        evaluation harness can replay stored issues through any index
+        configuration.
+        """
+        # Get similar documents
+        candidates = max(top_k, self.rerank_candidates)
+        if self.issue_matching and any(c.count() > 0 for c in self.issue_collections(where)):
+            similar_docs = self._match_issues(query_issues, candidates, where)
+        else:
+            results = self._search(query_issues, candidates, where)
             similar_docs = []
             if results['distances'] and results['distances'][0]:
                 for metadata, distance, issues in zip(
@@ -291,13 +809,198 @@ class LegalDocumentRAG:
                         'similarity_score': round(similarity_score, 2),
                         'petitioner_issues': issues
                     })
-                
+        
+        if similar_docs:
+            if self.reranker is not None:
+                similar_docs = self._rerank(query_issues, similar_docs)
+            else:
                 # Sort by similarity score
                 similar_docs.sort(key=lambda x: x['similarity_score'], reverse=True)
-                similar_docs = similar_docs[:5]  # Keep only top 5
-            
-            return similar_docs
-            
-        except Exception as e:
-            logger.error(f"Error in similarity search: {str(e)}")
+            similar_docs = similar_docs[:top_k]
+        
+        return similar_docs
+
+    def _match_issues(self, query_issues: str, top_k: int, where: Optional[Dict] = None) -> List[Dict]:
+        """Rank cases by matching each query issue against each case issue.
+
+        Candidate cases are those owning one of the nearest issue vectors of
+        any query issue; all their issues are then scored against the query
+        issues in one matrix operation (see ``issue_matching.score_cases``).
+        Each result lists which query issue matched which case issue. With
+        sharding, the issue collections of the matching shards are searched.
+        """
+        import numpy as np
+        from issue_matching import score_cases, split_issues
+
+        issues = split_issues(query_issues)
+        query_vectors = np.asarray(resources.encode(issues), dtype=np.float32)
+        collections = [c for c in self.issue_collections(where) if c.count() > 0]
+        parents = set()
+        for collection in collections:
+            nearest = collection.query(
+                query_embeddings=query_vectors.tolist(),
+                n_results=min(ISSUE_CANDIDATES, collection.count()),
+                where=where,
+                include=["metadatas"]
+            )
+            parents.update(metadata['parent'] for hits in nearest['metadatas'] for metadata in hits)
+        if not parents:
             return []
+
+        records = {'ids': [], 'embeddings': [], 'metadatas': [], 'documents': []}
+        for collection in collections:
+            found = collection.get(
+                where={"parent": {"$in": sorted(parents)}},
+                include=["embeddings", "metadatas", "documents"]
+            )
+            for key in records:
+                records[key].extend(found[key])
+        order = sorted(range(len(records['ids'])),
+                       key=lambda i: (records['metadatas'][i]['parent'],
+                                      records['metadatas'][i]['issue_index']))
+        case_vectors = np.asarray(records['embeddings'], dtype=np.float32)[order]
+        case_parents = [records['metadatas'][i]['parent'] for i in order]
+        case_issues = [records['documents'][i] for i in order]
+        case_metadatas = [records['metadatas'][i] for i in order]
+        starts = [i for i in range(len(order)) if i == 0 or case_parents[i] != case_parents[i - 1]]
+        offsets = starts + [len(order)]
+
+        result = score_cases(query_vectors, case_vectors, offsets, self.issue_matching)
+        ranked = np.argsort(-result['scores'])[:top_k]
+        similar_docs = []
+        for case in ranked:
+            start, end = offsets[case], offsets[case + 1]
+            matches = []
+            for q, query_issue in enumerate(issues):
+                row = int(result['matches'][q, case])
+                if row >= 0:
+                    matches.append({
+                        'query_issue': query_issue,
+                        'matched_issue': case_issues[row],
+                        'score': round(float(result['similarity'][q, case]) * 100, 2)
+                    })
+            similar_docs.append({
+                'filename': case_metadatas[start].get('filename', case_parents[start]),
+                'similarity_score': round(float(result['scores'][case]) * 100, 2),
+                'petitioner_issues': "\n".join(f"Issue: {issue}" for issue in case_issues[start:end]),
+                'matches': matches
+            })
+        return similar_docs
+
+    def _rerank(self, query_issues: str, similar_docs: List[Dict]) -> List[Dict]:
+        """Order candidates by cross-encoder relevance.
+
+        The bi-encoder score is kept as ``vector_score``; candidates the time
+        budget left unscored keep their vector score and rank after the
+        re-scored ones.
+        """
+        ranked = self.reranker.rerank(query_issues, [doc['petitioner_issues'] for doc in similar_docs])
+        reranked = []
+        for index, score in ranked:
+            doc = dict(similar_docs[index], vector_score=similar_docs[index]['similarity_score'])
+            if score is not None:
+                doc['similarity_score'] = round(score * 100, 2)
+            doc['reranked'] = score is not None
+            reranked.append(doc)
+        return reranked
+
+    def _search(self, query_issues: str, top_k: int, where: Optional[Dict] = None) -> Dict:
+        """Query the active index, returning results in Chroma's query format.
+
+        The snapshot, IVF and quantized indexes cover every shard, so they
+        are used ahead of the shard scatter-gather when selected. The IVF
+        and quantized indexes hold no metadata: filtered queries go to
+        Chroma (or the shards) instead. The snapshot applies the filter to
+        its records.
+        """
+        if self.snapshot is not None:
+            query_embedding = resources.encode([query_issues])[0]
+            hits = self.snapshot.search(query_embedding, top_k, where)
+            return {
+                'ids': [[record['id'] for record, _ in hits]],
+                'distances': [[distance for _, distance in hits]],
+                'metadatas': [[record['metadata'] for record, _ in hits]],
+                'documents': [[record['document'] for record, _ in hits]]
+            }
+
+        ivf_index = self.ivf_index
+        if ivf_index is not None and where is None:
+            query_embedding = resources.encode([query_issues])[0]
+            return self._hits_to_results(ivf_index.search(query_embedding, top_k, self.nprobe))
+
+        quantized_store = self.quantized_store if where is None else None
+        if self.router is not None and quantized_store is None:
+            return self._search_shards(query_issues, top_k, where)
+
+        if quantized_store is None:
+            return self.collection.query(
+                query_texts=[query_issues],
+                n_results=top_k,
+                where=where,
+                include=["metadatas", "distances", "documents"]
+            )
+
+        query_embedding = resources.encode([query_issues])[0]
+        return self._hits_to_results(quantized_store.search(query_embedding, top_k))
+
+    def _hits_to_results(self, hits: List[tuple]) -> Dict:
+        """``(id, distance)`` hits from a local index, in Chroma's query format."""
+        ids = [doc_id for doc_id, _ in hits]
+        by_id = {}
+        for name in self.document_collections():
+            missing = [doc_id for doc_id in ids if doc_id not in by_id]
+            if not missing:
+                break
+            records = self._get_collection(name).get(ids=missing, include=["metadatas", "documents"])
+            by_id.update({
+                doc_id: (metadata, document)
+                for doc_id, metadata, document in zip(
+                    records['ids'], records['metadatas'], records['documents']
+                )
+            })
+        hits = [(doc_id, distance) for doc_id, distance in hits if doc_id in by_id]
+        return {
+            'ids': [[doc_id for doc_id, _ in hits]],
+            'distances': [[distance for _, distance in hits]],
+            'metadatas': [[by_id[doc_id][0] for doc_id, _ in hits]],
+            'documents': [[by_id[doc_id][1] for doc_id, _ in hits]]
+        }
+
+    def _search_shards(self, query_issues: str, top_k: int, where: Optional[Dict] = None) -> Dict:
+        """Scatter a query over the matching shards and merge the global top-k."""
+        shards = self.shard_names(where)
+        if not shards:
+            return {'ids': [[]], 'distances': [[]], 'metadatas': [[]], 'documents': [[]]}
+
+        # Embed once and send the vector to every shard
+        query_embedding = resources.encode([query_issues])[0].tolist()
+
+        def query_shard(name: str) -> List[tuple]:
+            collection = self._get_collection(name)
+            count = collection.count()
+            if count == 0:
+                return []
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=min(top_k, count),
+                where=where,
+                include=["metadatas", "distances", "documents"]
+            )
+            return list(zip(
+                results['distances'][0],
+                results['ids'][0],
+                results['metadatas'][0],
+                results['documents'][0]
+            ))
+
+        with ThreadPoolExecutor(max_workers=min(len(shards), os.cpu_count() or 4)) as executor:
+            shard_hits = list(executor.map(query_shard, shards))
+
+        merged = heapq.nsmallest(top_k, (hit for hits in shard_hits for hit in hits),
+                                 key=lambda hit: hit[0])
+        return {
+            'ids': [[hit[1] for hit in merged]],
+            'distances': [[hit[0] for hit in merged]],
+            'metadatas': [[hit[2] for hit in merged]],
+            'documents': [[hit[3] for hit in merged]]
+        }
@@ -0,0 +1,89 @@
+# Cross-encoder re-ranking of retrieved candidates
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import resources
+
+logger = logging.getLogger(__name__)
+
+CROSS_ENCODER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+
+class CrossEncoderReranker:
+    """Re-scores (query, candidate) pairs with a small local cross-encoder.
+
+    Pairs are scored in batches in the order the bi-encoder ranked them and
+    scoring stops once ``time_budget`` seconds are spent, so a slow host
+    degrades to the vector ranking instead of blowing the latency target.
+    Pair scores are kept in an LRU cache, so repeated queries are free.
+    """
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL_NAME, batch_size: int = 16,
+                 time_budget: Optional[float] = 0.5, cache_size: int = 4096):
+        self.model = resources.get_cross_encoder(model_name)
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _pair_key(query: str, candidate: str) -> str:
+        return hashlib.sha1(f"{query}\0{candidate}".encode('utf-8')).hexdigest()
+
+    def _cached(self, key: str) -> Optional[float]:
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _remember(self, key: str, score: float) -> None:
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, query: str, candidates: Sequence[str],
+              time_budget: Optional[float] = None) -> List[Optional[float]]:
+        """Relevance probability (0-1) for each candidate, None if unscored in time."""
+        budget = self.time_budget if time_budget is None else time_budget
+        deadline = time.perf_counter() + budget if budget else None
+
+        keys = [self._pair_key(query, candidate) for candidate in candidates]
+        scores = [self._cached(key) for key in keys]
+        pending = [i for i, score in enumerate(scores) if score is None]
+
+        for start in range(0, len(pending), self.batch_size):
+            if deadline is not None and time.perf_counter() >= deadline:
+                logger.info(f"Re-rank budget exhausted with {len(pending) - start} "
+                            f"of {len(candidates)} candidates unscored")
+                break
+            batch = pending[start:start + self.batch_size]
+            logits = resources.predict_pairs(self.model, [(query, candidates[i]) for i in batch],
+                                             batch_size=self.batch_size)
+            for i, logit in zip(batch, logits):
+                scores[i] = 1 / (1 + math.exp(-float(logit)))
+                self._remember(keys[i], scores[i])
+        return scores
+
+    def rerank(self, query: str, candidates: Sequence[str],
+               time_budget: Optional[float] = None) -> List[tuple]:
+        """Return ``(index, score)`` pairs, best first.
+
+        Scored candidates come first by cross-encoder score; any left
+        unscored by the time budget follow in their original order with a
+        score of None.
+        """
+        scores = self.score(query, candidates, time_budget)
+        scored = sorted(((i, s) for i, s in enumerate(scores) if s is not None),
+                        key=lambda item: item[1], reverse=True)
+        unscored = [(i, None) for i, s in enumerate(scores) if s is None]
+        return scored + unscored
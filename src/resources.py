@@ -0,0 +1,261 @@
+# Process-wide shared resources (embedding model, vector store client, LLM clients)
+#
+# The embedding backend (see embedding_backends), chromadb and the Gemini SDK
+# are imported on first use, so importing this module stays cheap for CLI
+# commands that never touch them.
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from generations import default_generations
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+LLM_MODEL_NAME = 'gemini-pro'
+
+_lock = threading.RLock()
+# One lock per resource so a slow model load does not block the others
+_embedding_load_lock = threading.Lock()
+_cross_encoder_load_lock = threading.Lock()
+_chroma_lock = threading.Lock()
+_llm_lock = threading.Lock()
+
+_embedding_model = None
+_embedding_lock = threading.Lock()
+_embedding_function_class = None
+_cross_encoders: Dict[str, object] = {}
+_cross_encoder_lock = threading.Lock()
+_chroma_clients: Dict[str, object] = {}
+# Readers holding each client; the last release closes it
+_chroma_holders: Dict[str, int] = {}
+# Queries started on a released client get this long to finish before it is closed
+CHROMA_CLOSE_DELAY = 30.0
+_llm_models: Dict[Tuple, object] = {}
+_llm_scheduler = None
+_configured_api_key: Optional[str] = None
+_rag_processors: Dict[Tuple, object] = {}
+_doc_processors: Dict[str, object] = {}
+
+
+def get_embedding_model():
+    """Return the shared embedding backend, loading and warming it up on first use.
+
+    The backend (PyTorch or ONNX Runtime), device and thread counts come
+    from the environment; see ``embedding_backends.backend_options``.
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_load_lock:
+            if _embedding_model is None:
+                from embedding_backends import backend_options, create_backend
+                options = backend_options()
+                logger.info(f"Loading embedding model {EMBEDDING_MODEL_NAME} "
+                            f"({options['backend']} backend)")
+                model = create_backend(EMBEDDING_MODEL_NAME, **options)
+                model.warmup()
+                _embedding_model = model
+    return _embedding_model
+
+
+def preload_embedding_model() -> threading.Thread:
+    """Start loading the embedding model on a background thread.
+
+    Later ``get_embedding_model`` calls wait for the load if it is still
+    running, so callers can overlap it with PDF triage and extraction.
+    """
+    thread = threading.Thread(target=get_embedding_model, name="embedding-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def encode(texts: List[str], normalize: bool = True, **kwargs):
+    """Encode texts with the shared model, serializing access across threads.
+
+    Embeddings are unit-normalized by default so cosine similarity is a
+    plain dot product.
+    """
+    model = get_embedding_model()
+    with _embedding_lock:
+        return model.encode(texts, normalize=normalize, **kwargs)
+
+
+def shared_embedding_function():
+    """Chroma embedding function backed by the shared embedding model.
+
+    Using this instead of ``SentenceTransformerEmbeddingFunction`` keeps a
+    single copy of the model in memory for the whole process. It reports
+    the same name and config as Chroma's sentence-transformer function, so
+    collections created by either remain interchangeable. The class
+    subclasses a chromadb type, so it is only defined on first use.
+    """
+    global _embedding_function_class
+    if _embedding_function_class is None:
+        from chromadb.api.types import EmbeddingFunction
+
+        class SharedEmbeddingFunction(EmbeddingFunction):
+            def __init__(self):
+                pass
+
+            def __call__(self, input: List[str]) -> List[List[float]]:
+                return encode(list(input)).tolist()
+
+            @staticmethod
+            def name() -> str:
+                return "sentence_transformer"
+
+            def get_config(self) -> Dict:
+                return {
+                    "model_name": EMBEDDING_MODEL_NAME,
+                    "device": "cpu",
+                    "normalize_embeddings": True,
+                    "kwargs": {}
+                }
+
+            @staticmethod
+            def build_from_config(config: Dict) -> "SharedEmbeddingFunction":
+                return SharedEmbeddingFunction()
+
+            def default_space(self) -> str:
+                return "cosine"
+
+        _embedding_function_class = SharedEmbeddingFunction
+    return _embedding_function_class()
+
+
+def get_cross_encoder(model_name: str):
+    """Return the shared cross-encoder ``model_name``, loading it on first use."""
+    model = _cross_encoders.get(model_name)
+    if model is None:
+        with _cross_encoder_load_lock:
+            model = _cross_encoders.get(model_name)
+            if model is None:
+                from sentence_transformers import CrossEncoder
+                logger.info(f"Loading cross-encoder {model_name}")
+                model = CrossEncoder(model_name, device='cpu')
+                _cross_encoders[model_name] = model
+    return model
+
+
+def predict_pairs(model, pairs: List[Tuple[str, str]], **kwargs):
+    """Score text pairs with a shared cross-encoder, serializing access across threads."""
+    with _cross_encoder_lock:
+        return model.predict(pairs, **kwargs)
+
+
+def get_chroma_client(path: Optional[str] = None, hold: bool = False):
+    """Return the shared persistent Chroma client for ``path``.
+
+    ``path`` defaults to the published index generation (see generations).
+    Readers that switch generations pass ``hold=True`` and later call
+    ``release_chroma_client``.
+    """
+    path = path or default_generations().index_path()
+    client = _chroma_clients.get(path)
+    if client is None or hold:
+        with _chroma_lock:
+            client = _chroma_clients.get(path)
+            if client is None:
+                import chromadb
+                client = chromadb.PersistentClient(path=path)
+                _chroma_clients[path] = client
+            if hold:
+                _chroma_holders[path] = _chroma_holders.get(path, 0) + 1
+    return client
+
+
+def _close_chroma_client(path: str, client) -> None:
+    close = getattr(client, 'close', None)
+    if close is None:
+        return
+    try:
+        close()
+        logger.info(f"Closed Chroma client for {path}")
+    except Exception as e:
+        logger.warning(f"Could not close Chroma client for {path}: {str(e)}")
+
+
+def release_chroma_client(path: str, delay: float = CHROMA_CLOSE_DELAY) -> None:
+    """Drop a hold on the client for ``path``; the last one closes it after ``delay`` seconds."""
+    with _chroma_lock:
+        holders = _chroma_holders.get(path, 0) - 1
+        if holders > 0:
+            _chroma_holders[path] = holders
+            return
+        _chroma_holders.pop(path, None)
+        client = _chroma_clients.pop(path, None)
+    if client is None:
+        return
+    if delay > 0:
+        timer = threading.Timer(delay, _close_chroma_client, args=(path, client))
+        timer.daemon = True
+        timer.start()
+    else:
+        _close_chroma_client(path, client)
+
+
+def get_llm_model(api_key: str, generation_config: Optional[Dict] = None):
+    """Return a shared Gemini model for the given generation config."""
+    global _configured_api_key
+    config = generation_config or {}
+    key = (LLM_MODEL_NAME, tuple(sorted(config.items())))
+    with _llm_lock:
+        import google.generativeai as genai
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+            _llm_models.clear()
+        model = _llm_models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(LLM_MODEL_NAME, generation_config=config)
+            _llm_models[key] = model
+    return model
+
+
+def get_llm_scheduler():
+    """Return the process-wide LLM scheduler.
+
+    ``LLM_MAX_CONCURRENCY`` (default 8) caps concurrent Gemini calls,
+    ``LLM_REQUESTS_PER_MINUTE`` paces them to the API quota and
+    ``LLM_BATCH_SHARE`` (default 0.2) is the share of calls batch work
+    keeps while interactive requests are waiting.
+    """
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        with _llm_lock:
+            if _llm_scheduler is None:
+                from llm_scheduler import LLMScheduler, default_classes
+                max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+                rpm = os.getenv('LLM_REQUESTS_PER_MINUTE')
+                _llm_scheduler = LLMScheduler(
+                    max_concurrency,
+                    classes=default_classes(max_concurrency, float(os.getenv('LLM_BATCH_SHARE', '0.2'))),
+                    requests_per_minute=float(rpm) if rpm else None)
+    return _llm_scheduler
+
+
+def get_rag_processor(api_key: str, collection_name: str = "petitioner_issues"):
+    """Return the process-wide ``LegalDocumentRAG`` for a collection."""
+    from rag_processor import LegalDocumentRAG
+
+    key = (api_key, collection_name)
+    with _lock:
+        rag = _rag_processors.get(key)
+        if rag is None:
+            rag = LegalDocumentRAG(api_key, collection_name=collection_name)
+            _rag_processors[key] = rag
+    return rag
+
+
+def get_doc_processor(api_key: str):
+    """Return the process-wide ``LegalDocumentProcessor``."""
+    from processor import LegalDocumentProcessor
+
+    with _lock:
+        processor = _doc_processors.get(api_key)
+        if processor is None:
+            processor = LegalDocumentProcessor(api_key)
+            _doc_processors[api_key] = processor
+    return processor
@@ -0,0 +1,178 @@
+# Shard routing for the petitioner issues index
+
+import hashlib
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_CITY = os.getenv('DEFAULT_CITY', 'Mountain View')
+SHARD_SEPARATOR = "__"
+STRATEGIES = ("city_year", "hash")
+
+# Decision filenames carry the decision date, e.g. "Wright_1725 2023.10.12 AppealDecision"
+_DATE_PATTERN = re.compile(r'(?<!\d)((?:19|20)\d{2})\.\d{2}\.\d{2}(?!\d)')
+_SLUG_PATTERN = re.compile(r'[^a-z0-9]+')
+
+
+def year_from_filename(filename: str) -> Optional[int]:
+    """Decision year encoded in a filename, if any."""
+    match = _DATE_PATTERN.search(filename)
+    return int(match.group(1)) if match else None
+
+
+def slugify(value) -> str:
+    """Lowercase ``value`` into a token usable inside a collection name."""
+    return _SLUG_PATTERN.sub('_', str(value).lower()).strip('_') or 'unknown'
+
+
+def shard_metadata(filename: str, city: Optional[str] = None) -> Dict:
+    """Metadata fields used to route a document to its shard."""
+    year = year_from_filename(filename)
+    return {
+        'city': city or DEFAULT_CITY,
+        # Chroma metadata cannot be None
+        'year': year if year is not None else 0
+    }
+
+
+class ShardRouter:
+    """Maps documents to shard collections and prunes shards for queries.
+
+    ``city_year`` puts each city and decision year in its own collection so
+    filtered queries only touch matching shards. ``hash`` spreads documents
+    evenly over ``num_shards`` collections by id.
+    """
+
+    def __init__(self, base_name: str, strategy: str = "city_year", num_shards: int = 8):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown sharding strategy: {strategy}")
+        self.base_name = base_name
+        self.strategy = strategy
+        self.num_shards = num_shards
+
+    def shard_for(self, doc_id: str, metadata: Dict) -> str:
+        """Collection name that stores ``doc_id``."""
+        if self.strategy == "hash":
+            digest = hashlib.md5(doc_id.encode('utf-8')).digest()
+            shard = int.from_bytes(digest[:4], 'little') % self.num_shards
+            return f"{self.base_name}{SHARD_SEPARATOR}h{shard:03d}"
+        return SHARD_SEPARATOR.join([
+            self.base_name,
+            slugify(metadata.get('city', DEFAULT_CITY)),
+            str(metadata.get('year', 0))
+        ])
+
+    def owns(self, collection_name: str) -> bool:
+        """Whether ``collection_name`` is one of this router's shards."""
+        prefix = self.base_name + SHARD_SEPARATOR
+        if not collection_name.startswith(prefix):
+            return False
+        suffix = collection_name[len(prefix):]
+        if self.strategy == "hash":
+            return re.fullmatch(r'h\d{3}', suffix) is not None
+        return re.fullmatch(r'[a-z0-9_]+__\d+', suffix) is not None
+
+    def prune(self, shard_names: Iterable[str], where: Optional[Dict] = None) -> List[str]:
+        """Shards that can contain documents matching a Chroma ``where`` filter."""
+        shards = sorted(name for name in shard_names if self.owns(name))
+        if not where or self.strategy == "hash":
+            return shards
+
+        cities = _allowed_values(where, 'city')
+        years = _allowed_values(where, 'year')
+        if cities is not None:
+            cities = {slugify(city) for city in cities}
+        if years is not None:
+            years = {str(year) for year in years}
+
+        selected = []
+        prefix_length = len(self.base_name) + len(SHARD_SEPARATOR)
+        for name in shards:
+            city, year = name[prefix_length:].rsplit(SHARD_SEPARATOR, 1)
+            if cities is not None and city not in cities:
+                continue
+            if years is not None and year not in years:
+                continue
+            selected.append(name)
+        return selected
+
+
+def detect_strategy(base_name: str, collection_names: Iterable[str]) -> Optional[str]:
+    """Strategy of the shards of ``base_name`` already in an index, or None if it is unsharded."""
+    names = list(collection_names)
+    for strategy in STRATEGIES:
+        router = ShardRouter(base_name, strategy)
+        if any(router.owns(name) for name in names):
+            return strategy
+    return None
+
+
+def _allowed_values(where: Dict, field: str) -> Optional[set]:
+    """Values of ``field`` a filter can match, or None when unconstrained.
+
+    Understands equality, ``$eq``, ``$in`` and ``$and``; anything else
+    (``$or``, ranges) leaves the field unconstrained so no shard is wrongly
+    pruned.
+    """
+    if '$and' in where:
+        allowed = None
+        for clause in where['$and']:
+            values = _allowed_values(clause, field)
+            if values is not None:
+                allowed = values if allowed is None else allowed & values
+        return allowed
+
+    condition = where.get(field)
+    if condition is None:
+        return None
+    if not isinstance(condition, dict):
+        return {condition}
+    if '$eq' in condition:
+        return {condition['$eq']}
+    if '$in' in condition:
+        return set(condition['$in'])
+    return None
+
+
+_COMPARISONS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$gt': lambda value, operand: value > operand,
+    '$gte': lambda value, operand: value >= operand,
+    '$lt': lambda value, operand: value < operand,
+    '$lte': lambda value, operand: value <= operand,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand,
+}
+
+
+def matches_where(metadata: Dict, where: Dict) -> bool:
+    """Whether ``metadata`` satisfies a Chroma ``where`` filter.
+
+    For indexes searched outside Chroma (snapshots). As in Chroma, a field
+    missing from ``metadata`` only matches ``$ne`` and ``$nin``.
+    """
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == '$or':
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for operator, operand in condition.items():
+            if operator not in _COMPARISONS:
+                raise ValueError(f"Unsupported filter operator {operator}")
+            if key not in metadata:
+                if operator not in ('$ne', '$nin'):
+                    return False
+                continue
+            try:
+                if not _COMPARISONS[operator](metadata[key], operand):
+                    return False
+            except TypeError:
+                return False
+    return True
@@ -0,0 +1,162 @@
+# Local extractive summaries of hearing decisions (no LLM)
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SUMMARY_SENTENCES = 5
+MAX_SENTENCE_CHARS = 600
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERATIONS = 50
+
+# Section headings of Rental Housing Committee decisions mapped to the
+# summary fields they feed, checked in order
+SECTION_FIELDS: List[Tuple[str, re.Pattern]] = [
+    ('hearing_points_summary', re.compile(
+        r'\b(evidence|testimony|witness(es)?|findings? of fact|discussion|analysis|hearing attendance)\b',
+        re.IGNORECASE)),
+    # Anchored, so titles like "Hearing Officer Decision Pursuant to ..." do not count
+    ('final_decision_summary', re.compile(
+        r'^(decision|conclusions? of law|award|conclusion|it is so ordered|order)\b', re.IGNORECASE)),
+    ('petitioner_issues_summary', re.compile(
+        r'\b(issues? (presented|to be determined)|statement of the case|procedural history|'
+        r'appealed elements|summary of proceedings)\b', re.IGNORECASE)),
+]
+# Who a sentence is about, for the petitioner and respondent summaries
+ROLE_PATTERNS = {
+    'petitioner_issues_summary': re.compile(r'\b(petitioners?|tenants?)\b', re.IGNORECASE),
+    'respondent_issues_summary': re.compile(r'\b(respondents?|landlords?|property manager)\b', re.IGNORECASE),
+}
+SUMMARY_FIELDS = ['petitioner_issues_summary', 'respondent_issues_summary',
+                  'hearing_points_summary', 'final_decision_summary']
+
+_NUMBERING = r'^\s*(?:[IVX]+\.|[A-H]\.)?\s*'
+_HEADING = re.compile(_NUMBERING + r'([A-Z][A-Za-z’\'(),/ ]{2,80})\s*$')
+_NUMBER_ONLY = re.compile(r'^\s*(?:[IVX]+|[A-H])\.\s*$')
+_SENTENCE_END = re.compile(r'(?<=[.!?])[)"”’]?\s+(?=[A-Z(“"])')
+# A period after these does not end a sentence
+_ABBREVIATION = re.compile(r'\b(No|Mr|Ms|Mrs|Dr|Sec|St|Apt|Inc|v|vs|[A-Z])\.$')
+_WORD = re.compile(r"[a-z][a-z']+")
+_STOPWORDS = frozenset("""
+a an and are as at be been by for from had has have he her his in is it its of on or that the
+their there this to was were which with who will would not no shall may any all also than such
+""".split())
+
+
+def _heading(line: str) -> Optional[str]:
+    """The heading text of ``line`` without its numbering, or None if it is not a heading."""
+    match = _HEADING.match(line)
+    if not match:
+        return None
+    title = match.group(1).strip()
+    # All-caps headings, or short numbered ones like "IV. Summary of Relevant Evidence"
+    if title.isupper() or (len(title.split()) <= 8 and re.match(r'^\s*(?:[IVX]+|[A-H])\.', line)):
+        return title
+    return None
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """``(heading, body)`` pairs in document order; text before any heading has heading ''."""
+    sections = [('', [])]
+    numbering = ''
+    for line in text.splitlines():
+        # Numbering printed on its own line ("I." then "Summary of Proceedings")
+        if _NUMBER_ONLY.match(line):
+            numbering = line.strip() + ' '
+            continue
+        heading = _heading(numbering + line)
+        numbering = ''
+        if heading:
+            sections.append((heading, []))
+        else:
+            sections[-1][1].append(line)
+    return [(heading, ' '.join(' '.join(lines).split())) for heading, lines in sections]
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of ``text``; fragments of fewer than five words are dropped."""
+    sentences, pending = [], ''
+    for piece in _SENTENCE_END.split(text):
+        pending = f"{pending} {piece}" if pending else piece
+        if _ABBREVIATION.search(pending):
+            continue
+        if len(_WORD.findall(pending.lower())) >= 5:
+            sentences.append(pending.strip()[:MAX_SENTENCE_CHARS])
+        pending = ''
+    if len(_WORD.findall(pending.lower())) >= 5:
+        sentences.append(pending.strip()[:MAX_SENTENCE_CHARS])
+    return sentences
+
+
+def textrank(sentences: List[str]) -> np.ndarray:
+    """TextRank scores over a TF-IDF cosine similarity graph, computed with matrix products."""
+    tokens = [[word for word in _WORD.findall(s.lower()) if word not in _STOPWORDS] for s in sentences]
+    vocabulary: Dict[str, int] = {}
+    for words in tokens:
+        for word in words:
+            vocabulary.setdefault(word, len(vocabulary))
+    if not vocabulary:
+        return np.ones(len(sentences)) / max(1, len(sentences))
+
+    counts = np.zeros((len(sentences), len(vocabulary)), dtype=np.float32)
+    for row, words in enumerate(tokens):
+        for word in words:
+            counts[row, vocabulary[word]] += 1
+    idf = np.log((1 + len(sentences)) / (1 + (counts > 0).sum(axis=0))) + 1
+    weights = counts * idf
+    weights /= np.maximum(np.linalg.norm(weights, axis=1, keepdims=True), 1e-12)
+
+    similarity = weights @ weights.T
+    np.fill_diagonal(similarity, 0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    transition = np.divide(similarity, out_weight, out=np.zeros_like(similarity), where=out_weight > 0)
+    n = len(sentences)
+    scores = np.full(n, 1 / n, dtype=np.float32)
+    for _ in range(TEXTRANK_ITERATIONS):
+        updated = (1 - TEXTRANK_DAMPING) / n + TEXTRANK_DAMPING * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < 1e-6:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+
+def summarize(sentences: List[str], count: int = SUMMARY_SENTENCES) -> str:
+    """The ``count`` highest-ranked sentences, in their original order."""
+    if not sentences:
+        return ''
+    scores = textrank(sentences)
+    best = sorted(np.argsort(-scores)[:count])
+    return ' '.join(sentences[i] for i in best)
+
+
+def summarize_decision(text: str, count: int = SUMMARY_SENTENCES) -> Dict[str, Optional[str]]:
+    """Extractive petitioner, respondent, hearing and decision summaries of a decision.
+
+    Sections are found from the decision's headings; each summary ranks
+    the sentences of its sections (filtered by party for the petitioner and
+    respondent summaries) and falls back to the whole text when no
+    matching section exists.
+    """
+    by_field: Dict[str, List[str]] = {field: [] for field in SUMMARY_FIELDS}
+    all_sentences = []
+    for heading, body in split_sections(text):
+        sentences = split_sentences(body)
+        all_sentences.extend(sentences)
+        for field, pattern in SECTION_FIELDS:
+            if heading and pattern.search(heading):
+                by_field[field].extend(sentences)
+                break
+
+    # Party positions are mostly stated in the evidence and testimony
+    hearing = by_field['hearing_points_summary'] or all_sentences
+    for field, pattern in ROLE_PATTERNS.items():
+        pool = by_field[field] + hearing if field == 'petitioner_issues_summary' else hearing
+        by_field[field] = [s for s in pool if pattern.search(s)]
+
+    summaries = {}
+    for field in SUMMARY_FIELDS:
+        sentences = by_field[field] or all_sentences
+        summaries[field] = summarize(sentences, count) or None
+    return summaries
@@ -0,0 +1,163 @@
+# PDF triage and validation pass run before ingestion
+
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REPORT_PATH = os.path.join("data", "validation_report.json")
+DETAILS_PATH = os.path.join("data", "validation_report.jsonl")
+
+# A page with fewer extractable characters than this is treated as textless
+MIN_PAGE_CHARS = 50
+# Documents where more than this share of pages is textless are not ingested
+MAX_TEXTLESS_RATIO = 0.5
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def triage_pdf(pdf_path: str) -> Dict:
+    """Inspect a PDF without running any extraction models.
+
+    Returns page count, characters per page, encryption, content hash and a
+    ``status`` of ``valid``, ``scanned`` (mostly image-only pages),
+    ``empty``, ``encrypted`` or ``broken``.
+    """
+    import fitz  # PyMuPDF
+
+    stat = os.stat(pdf_path)
+    record = {
+        'filename': os.path.basename(pdf_path),
+        'path': pdf_path,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': file_sha256(pdf_path),
+        'encrypted': False,
+        'page_count': 0,
+        'chars_per_page': [],
+        'image_pages': 0,
+        'status': 'valid',
+        'reason': None
+    }
+    try:
+        with fitz.open(pdf_path) as doc:
+            record['encrypted'] = bool(doc.is_encrypted)
+            if doc.needs_pass:
+                record.update(status='encrypted', reason='Password required')
+                return record
+            record['page_count'] = doc.page_count
+            for page in doc:
+                record['chars_per_page'].append(len(page.get_text().strip()))
+                if page.get_images(full=False):
+                    record['image_pages'] += 1
+    except Exception as e:
+        record.update(status='broken', reason=str(e))
+        return record
+
+    pages = record['page_count']
+    textless = sum(1 for chars in record['chars_per_page'] if chars < MIN_PAGE_CHARS)
+    if pages == 0:
+        record.update(status='empty', reason='No pages')
+    elif textless / pages > MAX_TEXTLESS_RATIO:
+        if record['image_pages']:
+            record.update(status='scanned', reason=f'{textless}/{pages} pages have no text layer; needs OCR')
+        else:
+            record.update(status='empty', reason=f'{textless}/{pages} pages have no text')
+    return record
+
+
+def _load_details(details_path: str) -> Dict[str, Dict]:
+    """Previously written triage records keyed by path."""
+    records = {}
+    if not os.path.exists(details_path):
+        return records
+    with open(details_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash may leave a truncated last line
+                continue
+            records[record['path']] = record
+    return records
+
+
+def validate_directory(pdf_dir: str, report_path: str = REPORT_PATH,
+                       details_path: str = DETAILS_PATH,
+                       workers: Optional[int] = None) -> Dict[str, Dict]:
+    """Triage every PDF in ``pdf_dir`` in a process pool.
+
+    Each result is appended to ``details_path`` (JSONL) as soon as it is
+    ready, and files whose size and mtime are unchanged since the last run
+    are not reopened. The summary report keeps the ``valid_pdfs`` /
+    ``invalid_pdfs`` layout of ``data/validation_report.json``.
+    """
+    pdf_paths = sorted(
+        os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')
+    )
+    previous = _load_details(details_path)
+    results = {}
+    pending = []
+    for path in pdf_paths:
+        record = previous.get(path)
+        stat = os.stat(path)
+        if record and record['size'] == stat.st_size and record['mtime'] == stat.st_mtime:
+            results[path] = record
+        else:
+            pending.append(path)
+    logger.info(f"Triaging {len(pending)} PDFs ({len(results)} unchanged since last run)")
+
+    os.makedirs(os.path.dirname(details_path) or '.', exist_ok=True)
+    # Rewrite the details file so it only lists files still present
+    with open(details_path, 'w', encoding='utf-8') as details:
+        for record in results.values():
+            details.write(json.dumps(record, ensure_ascii=False) + '\n')
+        details.flush()
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(triage_pdf, path): path for path in pending}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        record = {'filename': os.path.basename(path), 'path': path,
+                                  'status': 'broken', 'reason': str(e)}
+                    results[path] = record
+                    details.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    details.flush()
+                    if record['status'] != 'valid':
+                        logger.warning(f"{record['filename']}: {record['status']} ({record['reason']})")
+
+    ordered = [results[path] for path in pdf_paths]
+    report = {
+        'valid_pdfs': [r['filename'] for r in ordered if r['status'] == 'valid'],
+        'invalid_pdfs': [r['filename'] for r in ordered if r['status'] != 'valid'],
+        'invalid_reasons': {r['filename']: f"{r['status']}: {r['reason']}"
+                            for r in ordered if r['status'] != 'valid'},
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info(f"Validation: {len(report['valid_pdfs'])} valid, "
+                f"{len(report['invalid_pdfs'])} invalid")
+    return results
+
+
+def valid_files(results: Dict[str, Dict]) -> List[str]:
+    """Filenames that passed triage."""
+    return [record['filename'] for record in results.values() if record['status'] == 'valid']
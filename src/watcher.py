@@ -0,0 +1,268 @@
+# Watch-folder continuous ingestion
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from triage import triage_pdf
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = os.path.join("data", "watch_metrics.json")
+# A file must keep the same size and mtime this long before it is ingested
+SETTLE_SECONDS = 2.0
+POLL_INTERVAL = 1.0
+REPORT_INTERVAL = 30.0
+# Ingested documents are published (see ``FolderWatcher.publish``) at most this often
+PUBLISH_INTERVAL = 60.0
+
+
+class _FileState:
+    __slots__ = ("signature", "changed_at", "queued", "processed")
+
+    def __init__(self, signature, changed_at: float):
+        # ``signature`` is (size, mtime); ``processed`` the last one ingested
+        self.signature = signature
+        self.changed_at = changed_at
+        self.queued = False
+        self.processed = None
+
+    def pending(self) -> bool:
+        return self.processed != self.signature
+
+
+class FolderWatcher:
+    """Ingests PDFs as they appear in or change inside ``pdf_dir``.
+
+    The directory is rescanned every ``interval`` seconds, or as soon as an
+    inotify/FSEvents notification arrives when the optional ``watchdog``
+    package is installed. A file is only picked up once its size and mtime
+    have been stable for ``settle`` seconds, so partially copied PDFs are
+    not ingested. Up to ``workers`` documents are processed at a time
+    through ``LegalDocumentRAG.add_to_rag`` with the build journal, so
+    unchanged files are skipped and changed ones are reprocessed.
+
+    With ``publish``, ``rag`` writes into a staged index generation: every
+    ``publish_interval`` seconds new submissions pause, the documents in
+    flight finish, and ``publish`` is called with the paths ingested since
+    the last call. It returns False when the generation was not published;
+    those files are then ingested again into the next staged generation.
+    """
+
+    def __init__(self, pdf_dir: str, rag, journal, results=None, workers: int = 2,
+                 interval: float = POLL_INTERVAL, settle: float = SETTLE_SECONDS,
+                 metrics_path: Optional[str] = METRICS_PATH, report_interval: float = REPORT_INTERVAL,
+                 publish: Optional[Callable[[List[str]], bool]] = None,
+                 publish_interval: float = PUBLISH_INTERVAL):
+        self.pdf_dir = pdf_dir
+        self.rag = rag
+        self.journal = journal
+        self.results = results
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.settle = settle
+        self.metrics_path = metrics_path
+        self.report_interval = report_interval
+        self.publish = publish
+        self.publish_interval = publish_interval
+
+        self._files: Dict[str, _FileState] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queued = 0
+        self._in_flight = 0
+        self._counts = {'ingested': 0, 'unchanged': 0, 'invalid': 0, 'failed': 0}
+        self._last_lag: Optional[float] = None
+        # Ingested since the last publish; submissions pause while draining for one
+        self._unpublished: List[str] = []
+        self._draining = False
+        self._last_publish = time.monotonic()
+
+    def _scan(self) -> float:
+        """Queue settled files; returns seconds until the next file settles."""
+        now = time.time()
+        next_check = self.interval
+        present = set()
+        for entry in os.scandir(self.pdf_dir):
+            if not entry.name.lower().endswith('.pdf') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            present.add(entry.path)
+            with self._lock:
+                state = self._files.get(entry.path)
+                if state is None:
+                    state = self._files[entry.path] = _FileState(signature, now)
+                elif state.signature != signature:
+                    # A change while queued is picked up again once the current run ends
+                    state.signature = signature
+                    state.changed_at = now
+                if self._draining or state.queued or not state.pending() or stat.st_size == 0:
+                    continue
+                waited = now - state.changed_at
+                if waited < self.settle:
+                    next_check = min(next_check, self.settle - waited)
+                    continue
+                self._submit(entry.path, state)
+        with self._lock:
+            for path in set(self._files) - present:
+                if not self._files[path].queued:
+                    del self._files[path]
+        return max(next_check, 0.05)
+
+    def _submit(self, path: str, state: _FileState) -> None:
+        # Caller holds ``self._lock``
+        state.queued = True
+        self._queued += 1
+        self._executor.submit(self._ingest, path, state, state.signature)
+
+    def _ingest(self, path: str, state: _FileState, signature) -> None:
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+            detected_at = state.changed_at
+        outcome = 'failed'
+        try:
+            record = triage_pdf(path)
+            if record['status'] != 'valid':
+                logger.warning(f"Skipping {record['filename']}: {record['status']} ({record['reason']})")
+                outcome = 'invalid'
+            else:
+                self.journal.register(path, record['sha256'])
+                current = self.journal.get(path)
+                if current['stage'] == 'written' or current['failed']:
+                    # Unchanged since it was written, or dead-lettered until retry-failed
+                    outcome = 'unchanged'
+                else:
+                    self.rag.add_to_rag(path, journal=self.journal, results=self.results)
+                    outcome = 'ingested'
+        except Exception as e:
+            logger.error(f"Failed to ingest {os.path.basename(path)}: {str(e)}")
+        with self._lock:
+            self._in_flight -= 1
+            self._counts[outcome] += 1
+            if outcome == 'ingested':
+                self._unpublished.append(path)
+                self._last_lag = time.time() - detected_at
+                logger.info(f"Ingested {os.path.basename(path)} {self._last_lag:.1f}s after it changed")
+            state.queued = False
+            state.processed = signature
+        self._wake.set()
+
+    def _maybe_publish(self, force: bool = False) -> None:
+        """Publish the ingested documents once the interval passed and nothing is in flight."""
+        if self.publish is None:
+            return
+        with self._lock:
+            if not self._unpublished:
+                return
+            if not force and time.monotonic() - self._last_publish < self.publish_interval:
+                return
+            self._draining = True
+            if self._queued or self._in_flight:
+                return
+            written = list(self._unpublished)
+        published = False
+        try:
+            published = self.publish(written)
+        except Exception as e:
+            logger.error(f"Failed to publish ingested documents: {str(e)}")
+        with self._lock:
+            del self._unpublished[:len(written)]
+            if not published:
+                # Re-ingested into the next staged generation on the following scan
+                for path in written:
+                    state = self._files.get(path)
+                    if state is not None:
+                        state.processed = None
+            self._draining = False
+            self._last_publish = time.monotonic()
+
+    def metrics(self) -> Dict:
+        """Queue depth, work in flight, freshness lag and outcome counts."""
+        now = time.time()
+        with self._lock:
+            waiting = [state.changed_at for state in self._files.values() if state.pending()]
+            return {
+                'queue_depth': self._queued,
+                'in_flight': self._in_flight,
+                'settling': sum(1 for state in self._files.values()
+                                if state.pending() and not state.queued),
+                'lag_seconds': round(now - min(waiting), 3) if waiting else 0.0,
+                'last_ingest_lag_seconds': round(self._last_lag, 3) if self._last_lag is not None else None,
+                'tracked_files': len(self._files),
+                **self._counts,
+                'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+
+    def _report(self) -> None:
+        metrics = self.metrics()
+        logger.info(f"Watch: queue={metrics['queue_depth']} in_flight={metrics['in_flight']} "
+                    f"lag={metrics['lag_seconds']:.1f}s ingested={metrics['ingested']} "
+                    f"failed={metrics['failed']}")
+        if self.metrics_path:
+            os.makedirs(os.path.dirname(self.metrics_path) or '.', exist_ok=True)
+            temp_path = f"{self.metrics_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(metrics, f, indent=2)
+            os.replace(temp_path, self.metrics_path)
+
+    def _start_observer(self):
+        """inotify/FSEvents wake-ups via ``watchdog`` if installed, else None."""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.info(f"watchdog not installed; polling every {self.interval}s")
+            return None
+
+        wake = self._wake
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+
+        observer = Observer()
+        observer.schedule(Handler(), self.pdf_dir, recursive=False)
+        observer.start()
+        return observer
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def run(self) -> None:
+        """Watch until ``stop`` is called or the process is interrupted."""
+        logger.info(f"Watching {self.pdf_dir} with {self.workers} worker(s)")
+        observer = self._start_observer()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        last_report = 0.0
+        try:
+            while not self._stop.is_set():
+                # Keep writing into the live index after a build publishes a new generation
+                self.rag.reload_if_published()
+                timeout = self._scan()
+                # Citations of the documents ingested since the last pass
+                self.rag.save_citations()
+                self._maybe_publish()
+                if time.time() - last_report >= self.report_interval:
+                    self._report()
+                    last_report = time.time()
+                self._wake.wait(timeout)
+                self._wake.clear()
+        except KeyboardInterrupt:
+            logger.info("Stopping watcher")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self._executor.shutdown(wait=True)
+            self.rag.save_citations()
+            self._maybe_publish(force=True)
+            self._report()